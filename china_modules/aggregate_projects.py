@@ -0,0 +1,441 @@
+"""
+Merge similar generation projects into clusters to reduce model size, and
+split results for the clusters back to the original projects.
+
+    python -m china_modules.aggregate_projects aggregate \\
+        --inputs-dir inputs --outputs-dir inputs_clustered
+    python -m china_modules.aggregate_projects disaggregate \\
+        --inputs-dir inputs_clustered --outputs-dir outputs
+
+Projects are merged when they have the same load zone, technology, energy
+source and vintage (the first year with predetermined capacity, optionally
+grouped into --vintage-years bins, or 'new' for candidate projects), the same
+full-load heat rate bin (--heat-rate-bin-width) and the same values for every
+other column of gen_info.csv except those in AVERAGED_COLUMNS and
+SUMMED_COLUMNS. Since gen_water_basin and gen_is_re_connect are compared
+too, a cluster lies in a single water basin and has a single connection
+mode, so china_modules.water_limits and china_modules.mixed_strategy treat it
+the same as its members. Projects must also have the same part-load loading
+levels, capacity factor profile and gen_can_retire_early setting, and
+candidate projects the same build costs in every period, so merging them
+doesn't change the set of options open to the model.
+
+For each cluster:
+  * predetermined capacity is added up by build year, so existing plants
+    still retire when they reach their maximum age;
+  * capacity limits are added up;
+  * heat rates (full and part load), variable and fixed O&M, outage rates,
+    cooling water use and build costs are averaged, weighted by capacity
+    (predetermined capacity for existing plants, capacity limits for
+    candidates).
+Projects that don't match any other project keep their name and data.
+
+The mapping from projects to clusters, with each project's share of its
+cluster's capacity, is saved as project_clusters.csv in the new inputs
+directory. `disaggregate` uses it to split per-project results (BuildGen.csv,
+DispatchGen.csv, dispatch.csv, gen_cap.csv, etc.) into rows for the
+original projects, in proportion to those shares, and writes them to
+<outputs-dir>/disaggregated.
+"""
+
+import argparse
+import hashlib
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_bool_dtype, is_numeric_dtype
+
+# gen_info.csv columns that are averaged within a cluster, weighted by capacity
+AVERAGED_COLUMNS = [
+    "gen_full_load_heat_rate",
+    "gen_variable_om",
+    "gen_connect_cost_per_mw",
+    "gen_scheduled_outage_rate",
+    "gen_forced_outage_rate",
+    "gen_cooling_water_m3_per_mwh",
+]
+# gen_info.csv columns that are added up within a cluster ('.' if any is '.')
+SUMMED_COLUMNS = ["gen_capacity_limit_mw"]
+# gen_info.csv columns that identify a single project
+ID_COLUMNS = ["GENERATION_PROJECT", "gen_dbid"]
+
+MAPPING_FILE = "project_clusters.csv"
+
+# columns of output tables that are not split between the members of a cluster
+UNSPLIT_COLUMNS = {
+    "period",
+    "PERIOD",
+    "timestamp",
+    "timepoint",
+    "tp_weight_in_year_hrs",
+    "LCOE_dollar_per_MWh",
+    "capacity_factor",
+}
+
+
+def read_table(path):
+    return pd.read_csv(path, dtype=str, keep_default_na=False, encoding="utf-8-sig")
+
+
+def to_number(series):
+    """Convert a text column to floats, with blank, '.' or text as NaN."""
+    return pd.to_numeric(series.replace({".": None, "": None}), errors="coerce")
+
+
+def format_number(x):
+    if pd.isna(x):
+        return "."
+    x = float(f"{x:.12g}")
+    if x.is_integer():
+        return str(int(x))
+    return repr(x)
+
+
+def weighted_mean(values, weights):
+    values = np.asarray(values, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    known = ~np.isnan(values)
+    if not known.any():
+        return np.nan
+    if weights[known].sum() <= 0:
+        return values[known].mean()
+    return float((values[known] * weights[known]).sum() / weights[known].sum())
+
+
+def signature(df, key_column):
+    """
+    Return a short hash of the rows for each project in df (excluding the
+    project column), for comparing tables like capacity factor profiles.
+    """
+    other = [c for c in df.columns if c != key_column]
+    rows = df.sort_values(other)[[key_column] + other]
+    text = rows[other].apply(lambda r: "|".join(r), axis=1)
+    return text.groupby(rows[key_column]).agg(
+        lambda t: hashlib.sha1("\n".join(t).encode()).hexdigest()[:16]
+    )
+
+
+def assign_clusters(tables, options):
+    """
+    Return a DataFrame with one row per project, giving its cluster and its
+    capacity weight.
+    """
+    info = tables["gen_info.csv"]
+    pre = tables["gen_build_predetermined.csv"]
+    costs = tables["gen_build_costs.csv"]
+    projects = info["GENERATION_PROJECT"]
+
+    existing_mw = (
+        to_number(pre["build_gen_predetermined"])
+        .groupby(pre["GENERATION_PROJECT"])
+        .sum()
+    )
+    first_year = pre["build_year"].astype(int).groupby(pre["GENERATION_PROJECT"]).min()
+    limit = to_number(info["gen_capacity_limit_mw"])
+    weight = projects.map(existing_mw)
+    weight = weight.fillna(pd.Series(limit.values, index=weight.index)).fillna(1.0)
+
+    # water columns etc. are only present when their modules are used
+    key = info.drop(
+        columns=ID_COLUMNS + AVERAGED_COLUMNS + SUMMED_COLUMNS, errors="ignore"
+    )
+    vintage = projects.map(first_year)
+    if options.vintage_years > 1:
+        vintage = vintage // options.vintage_years * options.vintage_years
+    key = key.assign(
+        vintage=vintage.map(lambda y: "new" if pd.isna(y) else str(int(y))),
+        heat_rate_bin=(
+            to_number(info["gen_full_load_heat_rate"]) // options.heat_rate_bin_width
+        ).map(lambda b: "" if pd.isna(b) else str(int(b))),
+    )
+    if "gen_can_retire_early" in pre.columns:
+        key["retire_early"] = projects.map(
+            pre.groupby("GENERATION_PROJECT")["gen_can_retire_early"].first()
+        ).fillna("")
+    heat_rates = tables.get("gen_part_load_heat_rates.csv")
+    if heat_rates is not None:
+        levels = heat_rates.groupby("GENERATION_PROJECT")["gen_loading_level"].agg(
+            lambda l: " ".join(sorted(l))
+        )
+        key["loading_levels"] = projects.map(levels).fillna("")
+    factors = tables.get("variable_capacity_factors.csv")
+    if factors is not None:
+        key["capacity_factors"] = projects.map(
+            signature(factors, "GENERATION_PROJECT")
+        ).fillna("")
+    # candidate projects are only merged if they cost the same to build
+    new_costs = costs[~costs["GENERATION_PROJECT"].isin(existing_mw.index)]
+    key["build_costs"] = projects.map(
+        signature(new_costs, "GENERATION_PROJECT")
+    ).fillna("")
+
+    group = key.groupby(list(key.columns), sort=False, dropna=False).ngroup()
+    size = group.map(group.value_counts())
+    names = {}
+    for g, members in projects.groupby(group):
+        if len(members) == 1:
+            names[g] = members.iloc[0]
+        else:
+            row = info.loc[members.index[0]]
+            names[g] = "-".join(
+                [
+                    row["gen_load_zone"],
+                    row["gen_tech"],
+                    key.loc[members.index[0], "vintage"],
+                    f"cluster{g}",
+                ]
+            )
+    mapping = pd.DataFrame(
+        {
+            "GENERATION_PROJECT": projects,
+            "cluster": group.map(names),
+            "weight": weight,
+            "cluster_size": size,
+        }
+    )
+    mapping["share"] = mapping["weight"] / mapping.groupby("cluster")[
+        "weight"
+    ].transform("sum")
+    return mapping
+
+
+def read_inputs(inputs_dir, outputs_dir):
+    """
+    Read all the .csv tables in inputs_dir as text and copy the other files
+    (modules.txt, etc.) to outputs_dir.
+    """
+    tables = {}
+    os.makedirs(outputs_dir, exist_ok=True)
+    for filename in os.listdir(inputs_dir):
+        path = os.path.join(inputs_dir, filename)
+        if not os.path.isfile(path):
+            continue
+        if filename.endswith(".csv"):
+            tables[filename] = read_table(path)
+        else:
+            shutil.copy2(path, os.path.join(outputs_dir, filename))
+    return tables
+
+
+def write_inputs(tables, outputs_dir):
+    for filename, df in tables.items():
+        df.to_csv(os.path.join(outputs_dir, filename), index=False)
+
+
+def aggregate(options):
+    tables = read_inputs(options.inputs_dir, options.outputs_dir)
+    mapping = merge_projects(tables, options)
+    write_inputs(tables, options.outputs_dir)
+    merged = mapping[mapping["cluster_size"] > 1]
+    print(
+        f"Merged {len(merged)} of {len(mapping)} projects into "
+        f"{merged['cluster'].nunique()} clusters, leaving "
+        f"{mapping['cluster'].nunique()} projects. Inputs saved in "
+        f"{options.outputs_dir}."
+    )
+    return mapping
+
+
+def merge_projects(tables, options):
+    """
+    Replace the projects in the input tables with their clusters, and save
+    the mapping from projects to clusters as MAPPING_FILE in the tables.
+    """
+    mapping = assign_clusters(tables, options)
+    cluster_of = dict(zip(mapping["GENERATION_PROJECT"], mapping["cluster"]))
+    weight_of = dict(zip(mapping["GENERATION_PROJECT"], mapping["weight"]))
+    merged = mapping[mapping["cluster_size"] > 1]
+
+    for filename, df in tables.items():
+        if "GENERATION_PROJECT" not in df.columns:
+            continue
+        df = df.copy()
+        weights = df["GENERATION_PROJECT"].map(weight_of)
+        df["GENERATION_PROJECT"] = df["GENERATION_PROJECT"].map(cluster_of)
+        if filename == "gen_info.csv":
+            df = merge_rows(df, weights, ["GENERATION_PROJECT"])
+            df["gen_dbid"] = df["gen_dbid"].where(
+                ~df["GENERATION_PROJECT"].isin(merged["cluster"]),
+                df["GENERATION_PROJECT"],
+            )
+        elif filename == "gen_build_predetermined.csv":
+            df = merge_rows(
+                df,
+                weights,
+                ["GENERATION_PROJECT", "build_year"],
+                summed=["build_gen_predetermined", "build_gen_energy_predetermined"],
+            )
+        elif filename == "gen_build_costs.csv":
+            # weight existing plants' costs by the capacity built that year
+            pre = tables["gen_build_predetermined.csv"]
+            built = dict(
+                zip(
+                    zip(pre["GENERATION_PROJECT"], pre["build_year"]),
+                    to_number(pre["build_gen_predetermined"]),
+                )
+            )
+            original = tables[filename]
+            weights = pd.Series(
+                [
+                    built.get(k, w)
+                    for k, w in zip(
+                        zip(original["GENERATION_PROJECT"], original["build_year"]),
+                        weights,
+                    )
+                ],
+                index=df.index,
+            )
+            df = merge_rows(df, weights, ["GENERATION_PROJECT", "build_year"])
+        elif filename == "gen_part_load_heat_rates.csv":
+            df = merge_rows(df, weights, ["GENERATION_PROJECT", "gen_loading_level"])
+        else:
+            # other tables (e.g., capacity factors) are the same for all the
+            # members of a cluster, so one copy is kept
+            index = list(df.columns[:-1])
+            if (df.groupby(index)[df.columns[-1]].nunique() > 1).any():
+                raise ValueError(
+                    f"Projects in the same cluster have different data in {filename}."
+                )
+            duplicated = df.duplicated(subset=index)
+            df = df[~duplicated]
+        tables[filename] = df
+
+    tables[MAPPING_FILE] = mapping[["GENERATION_PROJECT", "cluster", "weight", "share"]]
+    return mapping
+
+
+def merge_rows(df, weights, index, summed=()):
+    """
+    Merge the rows of df that have the same index: columns in summed and
+    SUMMED_COLUMNS are added up, columns in AVERAGED_COLUMNS and other numeric
+    columns are averaged (weighted) and the rest are taken from the first row.
+    """
+    df = df.assign(_weight=weights.values)
+    if not df.duplicated(subset=index).any():
+        return df.drop(columns="_weight")
+    rows = []
+    for key, group in df.groupby(index, sort=False):
+        if len(group) == 1:
+            rows.append(group.iloc[0])
+            continue
+        row = group.iloc[0].copy()
+        for column in df.columns:
+            if column in index or column == "_weight":
+                continue
+            values = to_number(group[column]) if column not in ID_COLUMNS else None
+            if column in summed or column in SUMMED_COLUMNS:
+                row[column] = (
+                    "." if values.isna().any() else format_number(values.sum())
+                )
+            elif (
+                values is not None
+                and values.notna().any()
+                and (column in AVERAGED_COLUMNS or group[column].nunique() > 1)
+            ):
+                row[column] = format_number(weighted_mean(values, group["_weight"]))
+        rows.append(row)
+    return pd.DataFrame(rows).drop(columns="_weight").reset_index(drop=True)
+
+
+def disaggregate(options):
+    dest = os.path.join(options.outputs_dir, "disaggregated")
+    count = disaggregate_projects(options.inputs_dir, options.outputs_dir, dest)
+    print(f"Disaggregated {count} output tables into {dest}.")
+
+
+def disaggregate_projects(inputs_dir, outputs_dir, dest):
+    """
+    Split per-project results for clusters in outputs_dir into rows for the
+    original projects and save them in dest. Returns the number of tables
+    written.
+    """
+    mapping = pd.read_csv(os.path.join(inputs_dir, MAPPING_FILE))
+    mapping = mapping[mapping["GENERATION_PROJECT"] != mapping["cluster"]]
+    members = mapping.rename(
+        columns={
+            "GENERATION_PROJECT": "_project",
+            "cluster": "_cluster",
+            "share": "_share",
+        }
+    )[["_project", "_cluster", "_share"]]
+    clusters = set(mapping["cluster"])
+    os.makedirs(dest, exist_ok=True)
+    count = 0
+    for filename in sorted(os.listdir(outputs_dir)):
+        if not filename.endswith(".csv"):
+            continue
+        df = pd.read_csv(os.path.join(outputs_dir, filename))
+        if df.empty:
+            continue
+        column = df.columns[0]
+        if is_numeric_dtype(df[column]) or not df[column].isin(clusters).any():
+            continue
+        is_cluster = df[column].isin(clusters)
+        split = df[is_cluster].merge(members, left_on=column, right_on="_cluster")
+        split[column] = split["_project"]
+        # the last column of a variable dump is its value; report tables can
+        # have several quantity columns
+        if column.endswith("_1"):
+            quantities = [df.columns[-1]]
+        else:
+            quantities = [
+                c
+                for c in df.columns[1:]
+                if c not in UNSPLIT_COLUMNS
+                and is_numeric_dtype(df[c])
+                and not is_bool_dtype(df[c])
+            ]
+        for c in quantities:
+            split[c] = split[c] * split["_share"]
+        result = pd.concat([df[~is_cluster], split[df.columns]], ignore_index=True)
+        result.to_csv(os.path.join(dest, filename), index=False)
+        count += 1
+    return count
+
+
+def define_arguments(argparser):
+    argparser.add_argument("action", choices=["aggregate", "disaggregate"])
+    argparser.add_argument(
+        "--inputs-dir",
+        default="inputs",
+        help="Inputs to aggregate, or aggregated inputs with the "
+        f"{MAPPING_FILE} mapping for disaggregate (default: inputs).",
+    )
+    argparser.add_argument(
+        "--outputs-dir",
+        required=True,
+        help="Directory for the aggregated inputs, or Switch outputs to "
+        "disaggregate.",
+    )
+    argparser.add_argument(
+        "--vintage-years",
+        type=int,
+        default=1,
+        help="Merge existing plants whose first build years fall in the same "
+        "bin of this many years (default: 1, i.e., same year only).",
+    )
+    argparser.add_argument(
+        "--heat-rate-bin-width",
+        type=float,
+        default=0.25,
+        help="Width of the full-load heat rate bins, in MMBtu/MWh " "(default: 0.25).",
+    )
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Merge similar generation projects into clusters, or "
+        "split cluster results back to projects."
+    )
+    define_arguments(parser)
+    options = parser.parse_args(args)
+    if options.action == "aggregate":
+        aggregate(options)
+    else:
+        disaggregate(options)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,595 @@
+"""
+Merge provincial load zones into regions (e.g., the six regional grids) for
+quick screening runs, and split regional results back to the provinces.
+
+    python -m china_modules.aggregate_zones aggregate \\
+        --inputs-dir inputs --outputs-dir inputs_regional
+    python -m china_modules.aggregate_zones disaggregate \\
+        --inputs-dir inputs_regional --outputs-dir outputs_regional
+
+Regions are read from a --regions file with LOAD_ZONE and region columns, or
+default to zone_balancing_area in load_zones.csv. In the new inputs:
+  * loads, coincident peak demand, existing local T&D and sunk costs,
+    and capacity plans in capacity_plans.csv and tech_capacity_plans.csv
+    are added up for each region;
+  * other numeric load_zones.csv columns and fuel costs are averaged,
+    weighted by the energy demand of each zone; a region is flagged with
+    zone_is_constrained if any of its zones is;
+  * lines within a region are dropped and parallel lines between two regions
+    are merged, with their existing capacity added up and their efficiency,
+    length and other numeric attributes averaged, weighted by capacity (if
+    all the zones are in one region, the transmission inputs are left out,
+    and the transport modules must be removed from modules.txt);
+  * fuel markets used by zones in the same region are merged into one market,
+    whose supply curve has all the tiers of the original markets;
+  * planning reserve requirements are assigned to the regions of their zones,
+    and requirements that become duplicates are dropped;
+  * projects are moved to their region and similar projects are merged as in
+    china_modules.aggregate_projects, unless --no-merge-projects is given.
+
+The mappings needed to split the results are saved in the new inputs
+directory: zone_regions.csv (each zone's share of its region's demand in each
+period), zone_load_shares.csv (the same for each timepoint) and
+project_zones.csv (the original zone of each project), plus
+project_clusters.csv if projects were merged. `disaggregate` first splits
+results for merged projects (see china_modules.aggregate_projects), then
+gives each project its original zone and divides zonal results (load
+balance, local T&D, etc.) between the zones of each region, in proportion to
+their demand. Zonal results are therefore allocations of the regional
+solution, not a provincial dispatch; transmission results are left for the
+lines between regions. Results are saved in <outputs-dir>/disaggregated.
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_numeric_dtype
+
+from china_modules import aggregate_projects
+from china_modules.aggregate_projects import (
+    format_number,
+    read_table,
+    to_number,
+    weighted_mean,
+)
+
+REGIONS_FILE = "zone_regions.csv"
+LOAD_SHARES_FILE = "zone_load_shares.csv"
+PROJECT_ZONES_FILE = "project_zones.csv"
+
+# load_zones.csv columns that are added up for each region; other numeric
+# columns are averaged, weighted by energy demand
+SUMMED_ZONE_COLUMNS = [
+    "existing_local_td",
+    "existing_tx_sunk_annual_payment",
+    "existing_local_td_sunk_annual_payment",
+]
+# load_zones.csv columns that are averaged, weighted by existing local T&D
+TD_WEIGHTED_COLUMNS = ["local_td_annual_cost_per_mw"]
+# load_zones.csv flags that are set for a region if they are set for any zone
+ANY_ZONE_COLUMNS = ["zone_is_constrained"]
+
+# transmission inputs, which are left out if there is only one region
+TRANSMISSION_TABLES = ["transmission_lines.csv", "trans_params.csv"]
+
+# tables with one value per zone (or zone and other keys) in the last column
+# that is added up for each region
+SUMMED_TABLES = {
+    "loads.csv": "load_zone",
+    "zone_coincident_peak_demand.csv": "LOAD_ZONE",
+    "capacity_plans.csv": "load_zones",
+    "tech_capacity_plans.csv": "load_zones",
+}
+# tables with one value per zone, fuel and period in the last column that is
+# averaged, weighted by energy demand
+AVERAGED_TABLES = {
+    "fuel_cost.csv": "load_zone",
+    "zone_fuel_cost_diff.csv": "load_zone",
+}
+
+
+def read_regions(tables, path):
+    """Return a Series giving the region of each load zone."""
+    zones = tables["load_zones.csv"]
+    if path is None:
+        regions = pd.Series(
+            zones["zone_balancing_area"].values, index=zones["LOAD_ZONE"]
+        )
+    else:
+        df = read_table(path)
+        regions = pd.Series(df["region"].values, index=df["LOAD_ZONE"])
+    missing = sorted(set(zones["LOAD_ZONE"]) - set(regions.index))
+    if missing:
+        raise ValueError(f"No region was given for load zone(s) {', '.join(missing)}.")
+    return regions[zones["LOAD_ZONE"]]
+
+
+def demand_shares(tables, region_of):
+    """
+    Return DataFrames giving each zone's share of its region's demand in
+    each timepoint and in each period, and a Series with each zone's total
+    energy demand (weighting timepoints by their duration and scale).
+    """
+    loads = tables["loads.csv"]
+    tps = tables["timepoints.csv"].set_index("timepoint_id")
+    ts = tables["timeseries.csv"].set_index("TIMESERIES")
+    timeseries = tps.loc[loads["TIMEPOINT"], "timeseries"].values
+    df = pd.DataFrame(
+        {
+            "LOAD_ZONE": loads["load_zone"].values,
+            "region": loads["load_zone"].map(region_of).values,
+            "timepoint": loads["TIMEPOINT"].values,
+            "PERIOD": ts.loc[timeseries, "ts_period"].values,
+            "load": to_number(loads["zone_demand_mw"]).fillna(0).values,
+            "weight": (
+                to_number(ts.loc[timeseries, "ts_duration_of_tp"])
+                * to_number(ts.loc[timeseries, "ts_scale_to_period"])
+            ).values,
+        }
+    )
+    df["energy"] = df["load"] * df["weight"]
+    tp_shares = share_of_total(df, ["region", "timepoint"], "load")
+    period_shares = share_of_total(
+        df.groupby(["LOAD_ZONE", "region", "PERIOD"], as_index=False)["energy"].sum(),
+        ["region", "PERIOD"],
+        "energy",
+    )
+    return (
+        tp_shares[["LOAD_ZONE", "timepoint", "load_share"]],
+        period_shares[["LOAD_ZONE", "region", "PERIOD", "load_share"]],
+        df.groupby("LOAD_ZONE")["energy"].sum(),
+    )
+
+
+def share_of_total(df, groups, column):
+    """
+    Add a load_share column to df with each row's share of column within its
+    group (or an equal share if the group total is zero).
+    """
+    total = df.groupby(groups)[column].transform("sum")
+    count = df.groupby(groups)[column].transform("size")
+    df = df.copy()
+    df["load_share"] = np.where(
+        total > 0, df[column] / total.where(total > 0, 1), 1 / count
+    )
+    return df
+
+
+def aggregate_load_zones(zones, region_of, energy):
+    """Return load_zones.csv for the regions."""
+    td = to_number(zones["existing_local_td"]).fillna(0)
+    rows = []
+    for region, group in zones.groupby(zones["LOAD_ZONE"].map(region_of), sort=False):
+        row = group.iloc[0].copy()
+        row["LOAD_ZONE"] = region
+        for column in zones.columns:
+            if column == "LOAD_ZONE":
+                continue
+            values = to_number(group[column])
+            if column in SUMMED_ZONE_COLUMNS:
+                row[column] = format_number(values.sum(min_count=1))
+            elif column in ANY_ZONE_COLUMNS:
+                row[column] = format_number(values.max())
+            elif column in TD_WEIGHTED_COLUMNS:
+                row[column] = format_number(weighted_mean(values, td[group.index]))
+            elif values.notna().any():
+                row[column] = format_number(
+                    weighted_mean(values, group["LOAD_ZONE"].map(energy))
+                )
+            elif group[column].nunique() > 1:
+                # e.g., zones in different balancing areas
+                row[column] = region
+        if "zone_dbid" in row:
+            row["zone_dbid"] = region
+        rows.append(row)
+    return pd.DataFrame(rows).reset_index(drop=True)
+
+
+def aggregate_lines(lines, region_of):
+    """Return transmission_lines.csv for the lines between regions."""
+    lines = lines.copy()
+    r1 = lines["trans_lz1"].map(region_of)
+    r2 = lines["trans_lz2"].map(region_of)
+    lines["trans_lz1"] = np.where(r1 <= r2, r1, r2)
+    lines["trans_lz2"] = np.where(r1 <= r2, r2, r1)
+    lines = lines[lines["trans_lz1"] != lines["trans_lz2"]]
+    capacity = to_number(lines["existing_trans_cap"]).fillna(0)
+    rows = []
+    for (lz1, lz2), group in lines.groupby(["trans_lz1", "trans_lz2"], sort=False):
+        row = group.iloc[0].copy()
+        row["TRANSMISSION_LINE"] = f"{lz1}-{lz2}"
+        if "trans_dbid" in row:
+            row["trans_dbid"] = row["TRANSMISSION_LINE"]
+        for column in lines.columns:
+            if column in ["TRANSMISSION_LINE", "trans_dbid", "trans_lz1", "trans_lz2"]:
+                continue
+            values = to_number(group[column])
+            if column == "existing_trans_cap":
+                row[column] = format_number(values.sum())
+            elif column == "trans_new_build_allowed":
+                row[column] = (
+                    "TRUE"
+                    if group[column].str.upper().isin(["TRUE", "1"]).any()
+                    else "FALSE"
+                )
+            elif values.notna().any():
+                row[column] = format_number(
+                    weighted_mean(values, capacity[group.index])
+                )
+        rows.append(row)
+    return pd.DataFrame(rows, columns=lines.columns).reset_index(drop=True)
+
+
+def aggregate_fuel_markets(tables, region_of):
+    """
+    Merge fuel markets used by zones in the same region, and update the
+    market tables in place.
+    """
+    links = tables["zone_to_regional_fuel_market.csv"]
+    fuel_of = dict(
+        zip(
+            tables["regional_fuel_markets.csv"]["regional_fuel_market"],
+            tables["regional_fuel_markets.csv"]["fuel"],
+        )
+    )
+    # union-find over markets that supply the same fuel to the same region
+    parent = {m: m for m in fuel_of}
+
+    def root(m):
+        while parent[m] != m:
+            parent[m] = parent[parent[m]]
+            m = parent[m]
+        return m
+
+    region_markets = links.assign(
+        region=links["load_zone"].map(region_of),
+        fuel=links["regional_fuel_market"].map(fuel_of),
+    )
+    for _, group in region_markets.groupby(["region", "fuel"]):
+        markets = list(group["regional_fuel_market"])
+        for m in markets[1:]:
+            parent[root(m)] = root(markets[0])
+    members = {}
+    for m in fuel_of:
+        members.setdefault(root(m), []).append(m)
+    name = {}
+    for r, ms in members.items():
+        for m in ms:
+            name[m] = r if len(ms) == 1 else "+".join(sorted(ms))
+
+    markets = tables["regional_fuel_markets.csv"].copy()
+    markets["regional_fuel_market"] = markets["regional_fuel_market"].map(name)
+    tables["regional_fuel_markets.csv"] = markets.drop_duplicates().reset_index(
+        drop=True
+    )
+    tables["zone_to_regional_fuel_market.csv"] = (
+        pd.DataFrame(
+            {
+                "load_zone": region_markets["region"],
+                "regional_fuel_market": region_markets["regional_fuel_market"].map(
+                    name
+                ),
+            }
+        )
+        .drop_duplicates()
+        .reset_index(drop=True)
+    )
+    curves = tables.get("fuel_supply_curves.csv")
+    if curves is not None:
+        curves = curves.copy()
+        merged = curves["regional_fuel_market"].map(lambda m: name[m] != m)
+        curves["regional_fuel_market"] = curves["regional_fuel_market"].map(name)
+        # renumber the tiers of merged markets in order of cost
+        curves["_cost"] = to_number(curves["unit_cost"])
+        curves = curves.sort_values(
+            ["regional_fuel_market", "period", "_cost"], kind="stable"
+        )
+        tier = curves.groupby(["regional_fuel_market", "period"]).cumcount()
+        curves["tier"] = curves["tier"].where(~merged[curves.index], tier.astype(str))
+        tables["fuel_supply_curves.csv"] = curves.drop(columns="_cost").reset_index(
+            drop=True
+        )
+
+
+def aggregate_reserves(tables, region_of):
+    """
+    Assign planning reserve requirements to regions and drop duplicates.
+    Requirements for a single zone that are named after it (e.g.,
+    Anhui_1.15peak) are renamed after its region (East_China_1.15peak).
+    """
+    prr = tables["planning_reserve_requirements.csv"]
+    prr_zones = tables["planning_reserve_requirement_zones.csv"]
+    members = prr_zones.groupby("PLANNING_RESERVE_REQUIREMENTS")["LOAD_ZONE"].agg(list)
+    regions = members.map(lambda zs: tuple(sorted(set(region_of[z] for z in zs))))
+    prr = prr.assign(_regions=prr["PLANNING_RESERVE_REQUIREMENTS"].map(regions))
+    settings = [c for c in prr.columns if c not in ["PLANNING_RESERVE_REQUIREMENTS"]]
+    keep = prr.drop_duplicates(subset=settings).copy()
+
+    def rename(name):
+        zones = members[name]
+        if len(zones) == 1 and name.startswith(zones[0]):
+            return region_of[zones[0]] + name[len(zones[0]) :]
+        return name
+
+    keep["PLANNING_RESERVE_REQUIREMENTS"] = keep["PLANNING_RESERVE_REQUIREMENTS"].map(
+        rename
+    )
+    tables["planning_reserve_requirements.csv"] = keep.drop(
+        columns="_regions"
+    ).reset_index(drop=True)
+    tables["planning_reserve_requirement_zones.csv"] = pd.DataFrame(
+        [
+            (name, region)
+            for name, rs in zip(keep["PLANNING_RESERVE_REQUIREMENTS"], keep["_regions"])
+            for region in rs
+        ],
+        columns=prr_zones.columns,
+    )
+
+
+def aggregate(options):
+    tables = aggregate_projects.read_inputs(options.inputs_dir, options.outputs_dir)
+    region_of = read_regions(tables, options.regions)
+    tp_shares, period_shares, energy = demand_shares(tables, region_of)
+
+    zones = tables["load_zones.csv"]
+    tables["load_zones.csv"] = aggregate_load_zones(zones, region_of, energy)
+    tables["transmission_lines.csv"] = aggregate_lines(
+        tables["transmission_lines.csv"], region_of
+    )
+    corridors = len(tables["transmission_lines.csv"])
+    if not corridors:
+        # Switch can't read an empty transmission_lines.csv, so leave out the
+        # transmission inputs altogether
+        for filename in TRANSMISSION_TABLES:
+            tables.pop(filename, None)
+            path = os.path.join(options.outputs_dir, filename)
+            if os.path.exists(path):
+                os.remove(path)
+        print(
+            "Warning: all load zones are in one region, so there are no "
+            "transmission lines. Remove the switch_model.transmission.transport "
+            f"modules from {os.path.join(options.outputs_dir, 'modules.txt')}."
+        )
+    if "zone_to_regional_fuel_market.csv" in tables:
+        aggregate_fuel_markets(tables, region_of)
+    if "planning_reserve_requirement_zones.csv" in tables:
+        aggregate_reserves(tables, region_of)
+    for filename, column in SUMMED_TABLES.items():
+        if filename in tables:
+            tables[filename] = sum_by_region(tables[filename], column, region_of)
+    for filename, column in AVERAGED_TABLES.items():
+        if filename in tables:
+            tables[filename] = average_by_region(
+                tables[filename], column, region_of, energy
+            )
+
+    info = tables["gen_info.csv"]
+    project_zones = info[["GENERATION_PROJECT", "gen_load_zone"]]
+    info = info.copy()
+    info["gen_load_zone"] = info["gen_load_zone"].map(region_of)
+    tables["gen_info.csv"] = info
+    if options.merge_projects:
+        mapping = aggregate_projects.merge_projects(tables, options)
+        projects = mapping["cluster"].nunique()
+    else:
+        projects = len(info)
+
+    unhandled = [
+        f
+        for f, df in tables.items()
+        if f not in SUMMED_TABLES
+        and f not in AVERAGED_TABLES
+        and f
+        not in [
+            "load_zones.csv",
+            "zone_to_regional_fuel_market.csv",
+            "planning_reserve_requirement_zones.csv",
+        ]
+        and {"load_zone", "LOAD_ZONE", "load_zones"} & set(df.columns)
+    ]
+    if unhandled:
+        raise ValueError(
+            f"Don't know how to aggregate zone data in {', '.join(unhandled)}."
+        )
+
+    tables[PROJECT_ZONES_FILE] = project_zones
+    tables[REGIONS_FILE] = period_shares
+    tables[LOAD_SHARES_FILE] = tp_shares
+    aggregate_projects.write_inputs(tables, options.outputs_dir)
+    print(
+        f"Merged {len(zones)} load zones into {region_of.nunique()} regions "
+        f"with {corridors} transmission corridors "
+        f"and {projects} projects. Inputs saved in {options.outputs_dir}."
+    )
+
+
+def sum_by_region(df, column, region_of):
+    df = df.copy()
+    value = df.columns[-1]
+    df[column] = df[column].map(region_of)
+    df[value] = to_number(df[value])
+    keys = [c for c in df.columns if c != value]
+    df = df.groupby(keys, sort=False, as_index=False)[value].sum()
+    df[value] = df[value].map(format_number)
+    return df
+
+
+def average_by_region(df, column, region_of, energy):
+    weights = df[column].map(energy)
+    df = df.copy()
+    df[column] = df[column].map(region_of)
+    return aggregate_projects.merge_rows(df, weights, list(df.columns[:-1]))
+
+
+def disaggregate(options):
+    dest = os.path.join(options.outputs_dir, "disaggregated")
+    os.makedirs(dest, exist_ok=True)
+    if os.path.exists(
+        os.path.join(options.inputs_dir, aggregate_projects.MAPPING_FILE)
+    ):
+        aggregate_projects.disaggregate_projects(
+            options.inputs_dir, options.outputs_dir, dest
+        )
+
+    def inputs(filename):
+        return pd.read_csv(os.path.join(options.inputs_dir, filename), dtype=str)
+
+    period_shares = inputs(REGIONS_FILE)
+    period_shares["load_share"] = period_shares["load_share"].astype(float)
+    tp_shares = inputs(LOAD_SHARES_FILE)
+    tp_shares["load_share"] = tp_shares["load_share"].astype(float)
+    timestamps = inputs("timepoints.csv")
+    tp_shares = pd.concat(
+        [
+            tp_shares,
+            tp_shares.assign(
+                timepoint=tp_shares["timepoint"].map(
+                    dict(zip(timestamps["timepoint_id"], timestamps["timestamp"]))
+                )
+            ),
+        ]
+    ).drop_duplicates()
+    zone_of = dict(zip(*inputs(PROJECT_ZONES_FILE).values.T))
+    regions = set(period_shares["region"])
+    periods = set(period_shares["PERIOD"])
+    timepoints = set(tp_shares["timepoint"])
+    overall = (
+        period_shares.groupby(["LOAD_ZONE", "region"], as_index=False)["load_share"]
+        .mean()
+        .assign(PERIOD="")
+    )
+
+    count = 0
+    for filename in sorted(os.listdir(options.outputs_dir)):
+        if not filename.endswith(".csv"):
+            continue
+        path = os.path.join(dest, filename)
+        if not os.path.exists(path):
+            path = os.path.join(options.outputs_dir, filename)
+        df = pd.read_csv(path)
+        if df.empty:
+            continue
+        text = df.astype(str)
+        zone_columns = [c for c in df.columns if text[c].isin(regions).all()]
+        if "gen_load_zone" in zone_columns and text.iloc[:, 0].isin(zone_of).all():
+            # per-project table: use each project's own zone
+            df["gen_load_zone"] = text.iloc[:, 0].map(zone_of)
+        elif len(zone_columns) == 1 and zone_columns[0] != "gen_load_zone":
+            df = split_zones(
+                df,
+                text,
+                zone_columns[0],
+                tp_shares,
+                period_shares,
+                overall,
+                timepoints,
+                periods,
+            )
+        else:
+            # transmission and per-technology zonal summaries are left as is
+            continue
+        df.to_csv(os.path.join(dest, filename), index=False)
+        count += 1
+    print(f"Disaggregated {count} output tables into {dest}.")
+
+
+def split_zones(df, text, zone, tp_shares, period_shares, overall, timepoints, periods):
+    """
+    Divide each row of df for a region among its zones, in proportion to
+    their demand in the row's timepoint or period.
+    """
+    others = [c for c in df.columns if c != zone]
+    tp = next((c for c in others if text[c].isin(timepoints).all()), None)
+    period = next((c for c in others if text[c].isin(periods).all()), None)
+    if tp is not None:
+        shares = tp_shares.rename(columns={"timepoint": "_key"})
+        key = text[tp]
+    elif period is not None:
+        shares = period_shares.rename(columns={"PERIOD": "_key"})
+        key = text[period]
+    else:
+        shares = overall.rename(columns={"PERIOD": "_key"})
+        key = pd.Series("", index=df.index)
+    if "region" not in shares:
+        shares = shares.merge(
+            period_shares[["LOAD_ZONE", "region"]].drop_duplicates(), on="LOAD_ZONE"
+        )
+    split = df.assign(_region=text[zone], _key=key).merge(
+        shares, left_on=["_region", "_key"], right_on=["region", "_key"]
+    )
+    split[zone] = split["LOAD_ZONE"]
+    if zone.endswith("_1"):
+        quantities = [df.columns[-1]]
+    else:
+        quantities = [
+            c
+            for c in others
+            if c not in aggregate_projects.UNSPLIT_COLUMNS
+            and c not in [tp, period]
+            and is_numeric_dtype(df[c])
+        ]
+    for c in quantities:
+        split[c] = split[c] * split["load_share"]
+    return split[df.columns]
+
+
+def define_arguments(argparser):
+    argparser.add_argument("action", choices=["aggregate", "disaggregate"])
+    argparser.add_argument(
+        "--inputs-dir",
+        default="inputs",
+        help="Inputs to aggregate, or aggregated inputs with the mapping "
+        "files for disaggregate (default: inputs).",
+    )
+    argparser.add_argument(
+        "--outputs-dir",
+        required=True,
+        help="Directory for the aggregated inputs, or Switch outputs to "
+        "disaggregate.",
+    )
+    argparser.add_argument(
+        "--regions",
+        default=None,
+        help="CSV file with LOAD_ZONE and region columns (default: use "
+        "zone_balancing_area from load_zones.csv).",
+    )
+    argparser.add_argument(
+        "--no-merge-projects",
+        dest="merge_projects",
+        action="store_false",
+        help="Move projects to their region without merging similar ones.",
+    )
+    argparser.add_argument(
+        "--vintage-years",
+        type=int,
+        default=1,
+        help="Vintage bin width for merging projects (see "
+        "china_modules.aggregate_projects; default: 1).",
+    )
+    argparser.add_argument(
+        "--heat-rate-bin-width",
+        type=float,
+        default=0.25,
+        help="Heat rate bin width for merging projects, in MMBtu/MWh "
+        "(default: 0.25).",
+    )
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Merge load zones into regions, or split regional "
+        "results back to zones."
+    )
+    define_arguments(parser)
+    options = parser.parse_args(args)
+    if options.action == "aggregate":
+        aggregate(options)
+    else:
+        disaggregate(options)
+
+
+if __name__ == "__main__":
+    main()
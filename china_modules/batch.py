@@ -0,0 +1,419 @@
+"""
+Run a batch of Switch scenarios in parallel.
+
+Each scenario is built and solved by its own `switch solve` process. The
+scenarios are given as either:
+
+  * a Switch scenario list (e.g., scenarios.txt), with one scenario per line
+    written as command-line arguments, e.g.,
+        --scenario-name rc_100 --include-modules china_modules.re_connected_strategy
+  * a scenario matrix (.csv) with a scenario_name column and one column per
+    Switch option (named without the leading dashes, e.g., inputs_dir or
+    include_modules). Cells hold the option's value(s), separated by spaces;
+    TRUE gives a bare flag and blank or FALSE leaves the option out.
+
+Arguments given after `--` on the command line are passed to every scenario.
+
+The machine's cores are shared between the running jobs so that solvers
+don't oversubscribe the machine: when a job is started it gets the free
+cores divided by the number of jobs that can still be started, passed to the
+solver through its threads option (e.g., Threads=n for Gurobi). Jobs started
+near the end of the batch, when fewer jobs are left than the --jobs limit,
+therefore get more threads. Thread counts for BLAS/OpenMP libraries used
+while building the model are limited the same way. Solvers without a known
+threads option (e.g., glpk) get one core per job; --threads-option can be
+used to name the option for other solvers.
+
+Each scenario writes its outputs to <outputs-root>/<scenario_name> (unless
+it sets --outputs-dir itself) and its log to <outputs-root>/logs. After each
+job finishes, a summary with the status, thread count and timing of every
+scenario is written to <outputs-root>/batch_summary.csv.
+
+With --result-cache-dir, each scenario is run through
+china_modules.result_cache, so scenarios that were already solved with the
+same inputs, modules and options get the saved outputs instead of being
+solved again (e.g., when a batch is restarted after one job failed).
+
+Usage:
+    python -m china_modules.batch scenarios.txt --jobs 8 -- --solver gurobi
+"""
+
+import argparse
+import csv
+import os
+import re
+import shlex
+import signal
+import subprocess
+import sys
+import time
+
+from .solver_errors import INFEASIBLE_MESSAGES
+
+# name of the option each solver uses to set its number of threads
+SOLVER_THREADS_OPTIONS = {
+    "gurobi": "Threads",
+    "gurobi_direct": "Threads",
+    "gurobi_persistent": "Threads",
+    "cplex": "threads",
+    "cplex_direct": "threads",
+    "cplex_persistent": "threads",
+    "appsi_highs": "threads",
+    "highs": "threads",
+    "cbc": "threads",
+    "xpress": "threads",
+    "xpress_direct": "threads",
+    "mosek": "MSK_IPAR_NUM_THREADS",
+}
+
+# timing lines written by switch_model.solve with --log-level info
+TIMING_PATTERNS = {
+    "read_s": r"Data read in ([\d.]+) s",
+    "solve_s": r"Total time spent in solver: ([\d.]+) s",
+    "total_s": r"Switch completed successfully in ([\d.]+) s",
+}
+
+SUMMARY_COLUMNS = [
+    "scenario_name",
+    "status",
+    "returncode",
+    "threads",
+    "wall_s",
+    "read_s",
+    "solve_s",
+    "total_s",
+    "log",
+]
+
+
+def available_cores():
+    """Number of cores this process may run on."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def read_scenarios(path):
+    """
+    Return a list of (scenario_name, args) from a scenario list or a scenario
+    matrix (.csv).
+    """
+    scenarios = []
+    if path.endswith(".csv"):
+        with open(path, newline="") as f:
+            for row in csv.DictReader(f):
+                name = row.pop("scenario_name")
+                args = ["--scenario-name", name]
+                for option, value in row.items():
+                    value = (value or "").strip()
+                    if value == "" or value.upper() == "FALSE":
+                        continue
+                    args.append("--" + option.replace("_", "-"))
+                    if value.upper() != "TRUE":
+                        args.extend(shlex.split(value))
+                scenarios.append((name, args))
+    else:
+        with open(path) as f:
+            for line in f:
+                args = shlex.split(line, comments=True)
+                if not args:
+                    continue
+                try:
+                    name = args[args.index("--scenario-name") + 1]
+                except (ValueError, IndexError):
+                    raise ValueError(
+                        f"Scenario in {path} has no --scenario-name: {line.strip()}"
+                    )
+                scenarios.append((name, args))
+    names = [name for name, args in scenarios]
+    duplicates = sorted({n for n in names if names.count(n) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicate scenario names in {path}: {', '.join(duplicates)}")
+    return scenarios
+
+
+def option_value(args, option):
+    """Return the value given for option in args (the last one wins), or None."""
+    value = None
+    for i, arg in enumerate(args[:-1]):
+        if arg == option:
+            value = args[i + 1]
+    return value
+
+
+def job_command(args, threads, threads_option, outputs_dir, result_cache_dir=None):
+    """
+    Return the command line to solve a scenario with the given threads,
+    through china_modules.result_cache if result_cache_dir is given.
+    """
+    args = list(args)
+    if option_value(args, "--outputs-dir") is None:
+        args += ["--outputs-dir", outputs_dir]
+    if option_value(args, "--log-level") is None:
+        args += ["--log-level", "info"]
+    if threads_option is not None:
+        setting = f"{threads_option}={threads}"
+        for i, arg in enumerate(args[:-1]):
+            if arg == "--solver-options-string":
+                args[i + 1] = f"{args[i + 1]} {setting}"
+                break
+        else:
+            args += ["--solver-options-string", setting]
+    if result_cache_dir is not None:
+        return [
+            sys.executable,
+            "-m",
+            "china_modules.result_cache",
+            "--cache-dir",
+            result_cache_dir,
+            "--",
+        ] + args
+    return [sys.executable, "-m", "switch_model.main", "solve"] + args
+
+
+def job_status(returncode, log_path):
+    """Classify a finished job and collect timing lines from its log."""
+    with open(log_path, errors="replace") as f:
+        log = f.read()
+    timing = {}
+    for key, pattern in TIMING_PATTERNS.items():
+        found = re.findall(pattern, log)
+        timing[key] = float(found[-1]) if found else ""
+    if returncode == 0:
+        status = "ok"
+    elif any(message in log for message in INFEASIBLE_MESSAGES):
+        status = "infeasible"
+    else:
+        status = "failed"
+    return status, timing
+
+
+def kill_job(process):
+    """Stop a job and any processes it started (e.g., a solver)."""
+    if hasattr(os, "killpg"):
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    else:
+        process.kill()
+
+
+def write_summary(path, rows):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(tmp_path, path)
+
+
+def run_batch(options, common_args):
+    scenarios = read_scenarios(options.scenario_list)
+    if options.scenarios:
+        unknown = set(options.scenarios) - {name for name, args in scenarios}
+        if unknown:
+            raise ValueError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+        scenarios = [s for s in scenarios if s[0] in options.scenarios]
+
+    log_dir = os.path.join(options.outputs_root, "logs")
+    os.makedirs(log_dir, exist_ok=True)
+    summary_path = os.path.join(options.outputs_root, "batch_summary.csv")
+    summary = {}
+    if os.path.exists(summary_path):
+        with open(summary_path, newline="") as f:
+            summary = {row["scenario_name"]: row for row in csv.DictReader(f)}
+    if options.skip_completed:
+        scenarios = [
+            s for s in scenarios if summary.get(s[0], {}).get("status") != "ok"
+        ]
+
+    cores = options.cores or available_cores()
+    jobs = max(1, min(options.jobs or cores, cores, len(scenarios) or 1))
+    pending = [(name, common_args + args) for name, args in scenarios]
+    running = {}  # name -> (process, log file, threads, start time)
+    free_cores = cores
+    print(f"Running {len(pending)} scenarios, {jobs} at a time on {cores} cores.")
+
+    while pending or running:
+        # start as many jobs as allowed, sharing out the free cores
+        while pending and len(running) < jobs and free_cores > 0:
+            name, args = pending.pop(0)
+            solver = option_value(args, "--solver")
+            threads_option = options.threads_option or SOLVER_THREADS_OPTIONS.get(
+                solver
+            )
+            if threads_option is None:
+                threads = 1
+            else:
+                startable = min(jobs - len(running), len(pending) + 1)
+                threads = max(1, free_cores // startable)
+            cmd = job_command(
+                args,
+                threads,
+                threads_option,
+                os.path.join(options.outputs_root, name),
+                options.result_cache_dir,
+            )
+            if options.dry_run:
+                print(f"{name} ({threads} threads): {shlex.join(cmd)}")
+                # pretend the job runs until all the slots are full
+                running[name] = (None, None, threads, None)
+                free_cores -= threads
+                continue
+            env = dict(os.environ)
+            for var in ["OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"]:
+                env[var] = str(threads)
+            log_path = os.path.join(log_dir, f"{name}.log")
+            log = open(log_path, "w")
+            log.write(shlex.join(cmd) + "\n\n")
+            log.flush()
+            # each job gets its own process group, so a timeout can stop
+            # the solver processes it starts too
+            process = subprocess.Popen(
+                cmd,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+                env=env,
+                start_new_session=True,
+            )
+            running[name] = (process, log, threads, time.time())
+            free_cores -= threads
+            print(f"Started {name} with {threads} threads.")
+
+        if options.dry_run:
+            running.clear()
+            free_cores = cores
+            continue
+
+        finished = []
+        for name, (process, log, threads, start) in running.items():
+            wall_s = time.time() - start
+            if process.poll() is None:
+                if options.timeout and wall_s > options.timeout:
+                    kill_job(process)
+                    process.wait()
+                else:
+                    continue
+            log.close()
+            status, timing = job_status(process.returncode, log.name)
+            if options.timeout and wall_s > options.timeout:
+                status = "timeout"
+            summary[name] = dict(
+                scenario_name=name,
+                status=status,
+                returncode=process.returncode,
+                threads=threads,
+                wall_s=round(wall_s, 2),
+                log=log.name,
+                **timing,
+            )
+            finished.append(name)
+            free_cores += threads
+            print(f"Finished {name}: {status} in {wall_s:.1f} s.")
+        for name in finished:
+            del running[name]
+        if finished:
+            write_summary(summary_path, list(summary.values()))
+        elif running:
+            time.sleep(options.poll_interval)
+
+    if not options.dry_run and summary:
+        counts = {}
+        for row in summary.values():
+            counts[row["status"]] = counts.get(row["status"], 0) + 1
+        print(
+            "Batch complete: "
+            + ", ".join(f"{n} {s}" for s, n in sorted(counts.items()))
+            + f". Summary saved in {summary_path}."
+        )
+    return summary
+
+
+def define_arguments(argparser):
+    argparser.add_argument(
+        "scenario_list",
+        help="Scenario list (one scenario per line, as in scenarios.txt) or "
+        "scenario matrix (.csv with a scenario_name column).",
+    )
+    argparser.add_argument(
+        "--scenarios",
+        nargs="+",
+        default=[],
+        help="Run only these scenarios from the list.",
+    )
+    argparser.add_argument(
+        "--outputs-root",
+        default="outputs",
+        help="Directory for scenario outputs, logs and batch_summary.csv "
+        "(default: outputs).",
+    )
+    argparser.add_argument(
+        "--jobs",
+        type=int,
+        default=None,
+        help="Maximum number of scenarios to run at once (default: one per core).",
+    )
+    argparser.add_argument(
+        "--cores",
+        type=int,
+        default=None,
+        help="Number of cores to share between jobs (default: all available).",
+    )
+    argparser.add_argument(
+        "--threads-option",
+        default=None,
+        help="Solver option that sets the number of threads, if the solver "
+        "is not one of: " + ", ".join(sorted(SOLVER_THREADS_OPTIONS)) + ".",
+    )
+    argparser.add_argument(
+        "--timeout",
+        type=float,
+        default=None,
+        help="Stop scenarios that run longer than this many seconds.",
+    )
+    argparser.add_argument(
+        "--skip-completed",
+        action="store_true",
+        help="Skip scenarios with status 'ok' in an existing batch_summary.csv.",
+    )
+    argparser.add_argument(
+        "--result-cache-dir",
+        default=None,
+        help="Run each scenario through china_modules.result_cache with this "
+        "cache directory, reusing the outputs of identical earlier runs.",
+    )
+    argparser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Show the command and thread count for each scenario without "
+        "running them.",
+    )
+    argparser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=1.0,
+        help="Seconds between checks for finished jobs (default: 1).",
+    )
+
+
+def main(args=None):
+    if args is None:
+        args = sys.argv[1:]
+    # arguments after "--" are passed to every scenario
+    if "--" in args:
+        split = args.index("--")
+        args, common_args = args[:split], args[split + 1 :]
+    else:
+        common_args = []
+    parser = argparse.ArgumentParser(
+        description="Run a batch of Switch scenarios in parallel."
+    )
+    define_arguments(parser)
+    options = parser.parse_args(args)
+    run_batch(options, common_args)
+
+
+if __name__ == "__main__":
+    main()
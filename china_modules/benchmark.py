@@ -0,0 +1,355 @@
+"""
+Time and memory-profile model construction with each China module, to catch
+performance regressions at scale (e.g., on inputs written by
+china_modules.synthetic_inputs).
+
+    python -m china_modules.benchmark --inputs-dir inputs_x4 \\
+        [--cases tech_plans water_limits] [--solve] [-- <switch options>]
+
+Each case builds the model from --inputs-dir in its own process, with the
+modules in the inputs' modules.txt, except China modules, plus the modules
+of the case:
+
+    base                    none
+    tech_plans              china_modules.tech_plans
+    water_limits            china_modules.water_limits
+    mixed_strategy          china_modules.zone_totals, mixed_strategy
+    re_connected_strategy   china_modules.zone_totals, re_connected_strategy
+
+and china_modules.profiling, which records the time and memory used to read
+the inputs and construct each component. By default the model is only
+constructed; with --solve it is also solved with --solver (default:
+appsi_highs, the free HiGHS solver, which runs locally). Arguments after
+`--` are passed to every case.
+
+Each case's log, module list and build profile (build_profile.json) are kept
+in <outputs-dir>/<case>. A row for each case is appended to --results
+(default: benchmark_results.csv), with the git commit of the code, the
+scale of the inputs, the time to read the inputs and construct the model,
+the peak memory (resident set size) of the process, the construction time
+and rows of the components defined by the case's China module and, with
+--solve, the solver time. After the run, each case is compared with the
+last result for the same inputs, case and mode from a different commit in
+the results file.
+"""
+
+import argparse
+import csv
+import datetime
+import json
+import os
+import subprocess
+import sys
+from timeit import default_timer as timer
+
+from china_modules.batch import job_status
+
+CASES = {
+    "base": [],
+    "tech_plans": ["china_modules.tech_plans"],
+    "water_limits": ["china_modules.water_limits"],
+    "mixed_strategy": ["china_modules.zone_totals", "china_modules.mixed_strategy"],
+    "re_connected_strategy": [
+        "china_modules.zone_totals",
+        "china_modules.re_connected_strategy",
+    ],
+}
+
+RESULT_COLUMNS = [
+    "date",
+    "commit",
+    "inputs_dir",
+    "zones",
+    "timepoints",
+    "projects",
+    "case",
+    "mode",
+    "status",
+    "wall_s",
+    "load_inputs_s",
+    "construct_s",
+    "peak_rss_mb",
+    "module_construct_s",
+    "module_rows",
+    "solve_s",
+]
+
+# results compared with the previous commit after each run
+COMPARED_COLUMNS = ["construct_s", "peak_rss_mb", "module_construct_s", "solve_s"]
+
+
+def code_version():
+    """Return the git commit of this code (with -dirty if it has changes)."""
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def count_rows(path):
+    """Number of data rows in a CSV file, or '' if there is no such file."""
+    if not os.path.exists(path):
+        return ""
+    with open(path, "rb") as f:
+        return max(sum(1 for line in f if line.strip()) - 1, 0)
+
+
+def input_scale(inputs_dir):
+    return dict(
+        zones=count_rows(os.path.join(inputs_dir, "load_zones.csv")),
+        timepoints=count_rows(os.path.join(inputs_dir, "timepoints.csv")),
+        projects=count_rows(os.path.join(inputs_dir, "gen_info.csv")),
+    )
+
+
+def case_module_list(inputs_dir, case):
+    """
+    Return the module list for a case: the inputs' modules.txt without China
+    modules, plus the case's modules and the profiler.
+    """
+    with open(os.path.join(inputs_dir, "modules.txt")) as f:
+        modules = [
+            line.strip()
+            for line in f
+            if line.strip()
+            and not line.strip().startswith("#")
+            and not line.strip().startswith("china_modules.")
+        ]
+    return modules + CASES[case] + ["china_modules.profiling"]
+
+
+def case_command(options, case_dir, module_list_path, switch_args):
+    args = [
+        "--inputs-dir",
+        options.inputs_dir,
+        "--module-list",
+        module_list_path,
+        "--outputs-dir",
+        case_dir,
+        "--log-level",
+        "info",
+    ] + switch_args
+    if options.solve:
+        args = ["--solver", options.solver] + args
+        return [sys.executable, "-m", "switch_model.main", "solve"] + args
+    return [sys.executable, "-m", "china_modules.benchmark", "construct", "--"] + args
+
+
+def read_profile(path, modules):
+    """
+    Return the times and memory recorded by china_modules.profiling, with
+    the construction time and rows of the components defined by modules.
+    """
+    with open(path) as f:
+        profile = json.load(f)
+    steps = profile["steps"]
+    own = [m for m in profile["modules"] if m["module"] in modules]
+    return dict(
+        load_inputs_s=round(
+            sum(s["seconds"] for s in steps if s["hook"] == "load_inputs"), 2
+        ),
+        construct_s=round(
+            sum(s["seconds"] for s in steps if s["hook"] == "create_instance"), 2
+        ),
+        peak_rss_mb=round(profile["peak_rss_mb"] or 0, 1),
+        module_construct_s=(
+            round(sum(m["construct_seconds"] for m in own), 3) if own else ""
+        ),
+        module_rows=sum(m.get("construct_rows", 0) for m in own) if own else "",
+    )
+
+
+def run_case(options, case, switch_args):
+    """Build (and solve) the model for one case and return its results."""
+    case_dir = os.path.join(options.outputs_dir, case)
+    os.makedirs(case_dir, exist_ok=True)
+    module_list_path = os.path.join(case_dir, "modules.txt")
+    with open(module_list_path, "w") as f:
+        f.write("\n".join(case_module_list(options.inputs_dir, case)) + "\n")
+    profile_path = os.path.join(case_dir, "build_profile.json")
+    log_path = os.path.join(case_dir, "benchmark.log")
+
+    best = None
+    for _ in range(options.repeat):
+        if os.path.exists(profile_path):
+            os.remove(profile_path)
+        start = timer()
+        with open(log_path, "w") as log:
+            returncode = subprocess.call(
+                case_command(options, case_dir, module_list_path, switch_args),
+                stdout=log,
+                stderr=subprocess.STDOUT,
+            )
+        wall = timer() - start
+        status, timing = job_status(returncode, log_path)
+        result = dict(case=case, status=status, wall_s=round(wall, 2))
+        result["solve_s"] = timing["solve_s"] if options.solve else ""
+        if os.path.exists(profile_path):
+            result.update(read_profile(profile_path, CASES[case]))
+        if status != "ok":
+            return result
+        if best is None or result["construct_s"] < best["construct_s"]:
+            best = result
+    return best
+
+
+def previous_results(path, current):
+    """
+    Return the last earlier result in the results file for the same inputs,
+    case and mode as current, from a different commit.
+    """
+    if not os.path.exists(path):
+        return None
+    previous = None
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            if (
+                row["inputs_dir"] == current["inputs_dir"]
+                and row["case"] == current["case"]
+                and row["mode"] == current["mode"]
+                and row["commit"] != current["commit"]
+                and row["status"] == "ok"
+            ):
+                previous = row
+    return previous
+
+
+def describe_change(now, before):
+    if now in ("", None) or before in ("", None):
+        return str(now)
+    now, before = float(now), float(before)
+    if before == 0:
+        return f"{now:g}"
+    return f"{now:g} ({100 * (now - before) / before:+.0f}%)"
+
+
+def run_benchmark(options, switch_args):
+    cases = options.cases or list(CASES)
+    common = dict(
+        date=datetime.datetime.now().isoformat(timespec="seconds"),
+        commit=code_version(),
+        inputs_dir=os.path.normpath(options.inputs_dir),
+        mode="solve" if options.solve else "construct",
+        **input_scale(options.inputs_dir),
+    )
+    rows = []
+    for case in cases:
+        print(f"Running {case}...", flush=True)
+        row = dict(common, **run_case(options, case, switch_args))
+        row["previous"] = previous_results(options.results, row)
+        rows.append(row)
+
+    new_file = not os.path.exists(options.results)
+    with open(options.results, "a", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_COLUMNS, extrasaction="ignore")
+        if new_file:
+            writer.writeheader()
+        writer.writerows(rows)
+
+    print(
+        f"\nCommit {common['commit']}, {common['zones']} zones, "
+        f"{common['timepoints']} timepoints, {common['projects']} projects, "
+        f"{common['mode']}:"
+    )
+    for row in rows:
+        previous = row["previous"] or {}
+        changes = ", ".join(
+            f"{c} {describe_change(row.get(c, ''), previous.get(c))}"
+            for c in COMPARED_COLUMNS
+            if row.get(c, "") != ""
+        )
+        since = f" vs. {previous['commit']}" if previous else ""
+        print(f"  {row['case']}: {row['status']}{since}; {changes}")
+    print(f"Results were added to {options.results}.")
+
+
+def construct(switch_args):
+    """Build the model instance without solving it and save its profile."""
+    from switch_model import solve
+    from china_modules import profiling
+
+    instance = solve.main(args=switch_args, return_instance=True)
+    profiling.save_report(instance, instance.options.outputs_dir)
+
+
+def define_arguments(argparser):
+    argparser.add_argument(
+        "action",
+        nargs="?",
+        default="run",
+        choices=["run", "construct"],
+        help="'run' (default) runs the benchmark; 'construct' is used by the "
+        "benchmark to build the model for one case.",
+    )
+    argparser.add_argument(
+        "--inputs-dir",
+        default="inputs",
+        help="Inputs directory to build the models from (default: inputs).",
+    )
+    argparser.add_argument(
+        "--outputs-dir",
+        default="benchmark",
+        help="Directory for the logs and build profiles of each case "
+        "(default: benchmark).",
+    )
+    argparser.add_argument(
+        "--results",
+        default="benchmark_results.csv",
+        help="CSV file that results are added to (default: " "benchmark_results.csv).",
+    )
+    argparser.add_argument(
+        "--cases",
+        nargs="+",
+        choices=list(CASES),
+        default=None,
+        help="Cases to run (default: all).",
+    )
+    argparser.add_argument(
+        "--solve",
+        action="store_true",
+        default=False,
+        help="Also solve each model (default: only construct it).",
+    )
+    argparser.add_argument(
+        "--solver",
+        default="appsi_highs",
+        help="Solver to use with --solve (default: appsi_highs).",
+    )
+    argparser.add_argument(
+        "--repeat",
+        type=int,
+        default=1,
+        help="Build each case this many times and keep the fastest "
+        "construction (default: 1).",
+    )
+
+
+def main(args=None):
+    if args is None:
+        args = sys.argv[1:]
+    # arguments after "--" are passed to switch
+    if "--" in args:
+        split = args.index("--")
+        args, switch_args = args[:split], args[split + 1 :]
+    else:
+        switch_args = []
+    parser = argparse.ArgumentParser(
+        description="Time and memory-profile model construction with each "
+        "China module."
+    )
+    define_arguments(parser)
+    options = parser.parse_args(args)
+    if options.action == "construct":
+        construct(switch_args)
+    else:
+        run_benchmark(options, switch_args)
+
+
+if __name__ == "__main__":
+    main()
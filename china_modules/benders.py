@@ -0,0 +1,803 @@
+"""
+Solve the model by Benders decomposition: a master problem chooses the
+capacity to build and separate dispatch subproblems, solved in parallel
+worker processes, price that capacity through optimality cuts.
+
+Once capacity is fixed, the operation of the system in one investment
+period doesn't depend on the other periods. The model is built once and
+converted to matrix form; every variable is then assigned either to the
+master problem (the investment variables in INVESTMENT_VARS, e.g., BuildGen,
+BuildTx) or to the subproblem of the period of the timepoint in its index,
+or else of the last period in its index (e.g., the suspension year of
+SuspendGen), and every constraint goes wherever its variables are.
+Constraints on investment variables alone, such as the capacity plans and
+limits of china_modules.tech_plans, stay in the master problem; plans and
+limits on GenCapacity, which SuspendGen reduces, go to the subproblem of
+their period. Constraints that add up operation over a year, such as the
+basin water budgets of china_modules.water_limits, carbon caps and fuel
+supply tiers, fall inside one period's subproblem and are enforced there.
+
+With --split timeseries, each timeseries gets its own subproblem instead.
+Constraints that link the timepoints of several subproblems, such as the
+annual water budgets, carbon caps and fuel supply tiers, cause those
+subproblems to be merged, so the timeseries of a period are solved together
+when the model has one of these. Variables indexed by period alone (e.g.,
+SuspendGen, which appears in the dispatch of every timeseries of its
+period) join the subproblem of the timepoints they are linked to, or, if
+they link several subproblems (e.g., when gens can retire early but not
+suspend), are moved to the master problem. Moves and merges, with the
+constraints that caused them, are reported in the log.
+
+A trial capacity plan may leave a subproblem unable to meet its constraints
+(e.g., too little capacity for the planning reserve margin), so the rows of
+the subproblems that involve investment variables get slack variables with
+a cost of --infeasibility-penalty per unit. As long as the penalty is above
+the marginal value of those constraints, the best plan is the same as
+without slack, and the cuts steer the master problem away from plans that
+need it; the slack left in the final plan is reported if it is not zero.
+The cost of each subproblem enters the master problem through its cuts,
+starting with one from the bounds on its variables (e.g., SuspendGen <=
+BuildGen), so the master objective is a lower bound on the cost once every
+subproblem has a cut.
+
+Each iteration solves every subproblem for a trial plan, adds an optimality
+cut for each, and solves the master problem for a new lower bound. Plain
+Benders iterations, which take the master problem's plan each time, swing
+between extreme plans and can take thousands of iterations on models with
+many projects. Instead, the next trial plan is the one nearest the best plan
+so far (the one with the lowest cost, including the penalty) whose cost in
+the master problem is --level of the way from the lower bound to that best
+cost (a level bundle method). Iterations stop when the gap between the lower
+bound and the best cost is within --gap.
+
+The model is freed once it has been split, so the main process only holds
+the master problem and the parts of the subproblems it needs for the cuts,
+and each worker process is started with only the subproblems it solves.
+After the solve, the model is built again (china_modules.instance_cache
+makes this quick) and the best plan and its dispatch are loaded into it so
+the usual post-solve outputs can be written. Progress is saved in benders_progress.csv in the outputs directory. Duals
+reported for the subproblem constraints (e.g., energy prices) are those of
+the dispatch with the capacity fixed, so they don't include the capacity
+costs that duals of the full model would.
+
+The master problem and the subproblems are solved with HiGHS through
+scipy.optimize.linprog.
+
+Usage:
+    python -m china_modules.benders --workers 6 -- --inputs-dir inputs
+"""
+
+import argparse
+import csv
+import gc
+import hashlib
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from timeit import default_timer as timer
+
+import numpy as np
+import scipy.sparse as sp
+from pyomo.repn.plugins.standard_form import LinearStandardFormCompiler
+from scipy.optimize import linprog
+
+import switch_model.solve
+
+# variables decided in the master problem; all others belong to a subproblem
+INVESTMENT_VARS = {
+    "BuildGen",
+    "BuildMinGenCap",
+    "BuildRetrofitGen",
+    "BuildUnits",
+    "EarlyRetireUnits",
+    "BuildStorageEnergy",
+    "BuildTx",
+    "BuildLocalTD",
+}
+
+# total slack (violation of subproblem rows that involve investment
+# variables) below which the final plan counts as met
+FEASIBILITY_TOLERANCE = 1e-6
+
+PROGRESS_COLUMNS = [
+    "iteration",
+    "lower_bound",
+    "upper_bound",
+    "gap",
+    "slack",
+    "master_s",
+    "subproblems_s",
+]
+
+
+def stage_labels(m, columns, split):
+    """
+    Return the stage of each column (None for investment variables), whether
+    the column is indexed by timepoint, and the list of stages, ordered by
+    period.
+    """
+    labels, by_timepoint = [], []
+    for v in columns:
+        component = v.parent_component()
+        if component.name in INVESTMENT_VARS:
+            labels.append(None)
+            by_timepoint.append(False)
+            continue
+        index = v.index()
+        index = index if isinstance(index, tuple) else (index,)
+        label = None
+        for i in index:
+            if i in m.TIMEPOINTS:
+                label = m.tp_period[i] if split == "period" else m.tp_ts[i]
+                break
+        by_timepoint.append(label is not None)
+        if label is None:
+            # the last period, e.g., the suspension year of
+            # SuspendGen[g, build_year, period]
+            for i in reversed(index):
+                if i in m.PERIODS:
+                    label = i
+                    break
+        if label is None:
+            raise ValueError(
+                f"Variable {v.name} is not indexed by timepoint or period, so it "
+                "can't be assigned to a subproblem. Add it to INVESTMENT_VARS if "
+                "it is an investment decision."
+            )
+        labels.append(label)
+    order = list(m.PERIODS)
+    if split == "timeseries":
+        order = list(m.TIMESERIES) + order
+    present = set(labels)
+    return labels, np.array(by_timepoint), [s for s in order if s in present]
+
+
+def row_stages(A, col_stage):
+    """
+    Return the highest and lowest nonzero stage of the columns in each row (0
+    if none) and whether each row has investment variables.
+    """
+    nonempty = np.diff(A.indptr) > 0
+    starts = A.indptr[:-1][nonempty]
+    entry_stage = col_stage[A.indices]
+    row_max = np.zeros(A.shape[0], dtype=int)
+    row_max[nonempty] = np.maximum.reduceat(entry_stage, starts)
+    row_min = np.zeros(A.shape[0], dtype=int)
+    row_min[nonempty] = np.minimum.reduceat(
+        np.where(entry_stage > 0, entry_stage, row_max.max() + 1), starts
+    )
+    row_min[row_max == 0] = 0
+    has_master = np.zeros(A.shape[0], dtype=bool)
+    has_master[nonempty] = np.minimum.reduceat(entry_stage, starts) == 0
+    return row_max, row_min, has_master
+
+
+def unlink_stages(m, repn, A, col_stage, by_timepoint, stages):
+    """
+    Resolve the rows that have the variables of more than one stage: merge
+    the stages of the timepoint variables in such a row, then move the
+    period-indexed variables of the rows that still link stages to the
+    master problem, and merge whatever stages are linked after that.
+    Returns the new stage of each column (0 for the master problem) and the
+    stages merged into each subproblem.
+    """
+    parent = list(range(len(stages) + 1))
+
+    def find(k):
+        while parent[k] != k:
+            parent[k] = parent[parent[k]]
+            k = parent[k]
+        return k
+
+    def merge(rows, col_stage, by_timepoint):
+        merged = []
+        for r in rows:
+            cols = A.indices[A.indptr[r] : A.indptr[r + 1]]
+            cols = cols[by_timepoint[cols] & (col_stage[cols] > 0)]
+            if len(np.unique(col_stage[cols])) > 1:
+                merged.append(r)
+            linked = sorted({find(k) for k in col_stage[cols]})
+            for k in linked[1:]:
+                parent[k] = linked[0]
+        return merged
+
+    def current(col_stage):
+        return np.array([find(k) for k in range(len(stages) + 1)])[col_stage]
+
+    # rows that link the timepoints of several stages, e.g., annual water
+    # budgets, carbon caps and fuel supply tiers with --split timeseries
+    row_max, row_min, has_master = row_stages(A, col_stage)
+    merged = merge(np.flatnonzero(row_max != row_min), col_stage, by_timepoint)
+
+    # period-indexed variables that still link stages (e.g., SuspendGen, which
+    # appears in the dispatch of every timeseries of its period) join the
+    # stage of the timepoints they are linked to if there is only one, or
+    # else go to the master problem
+    col_stage = current(col_stage)
+    row_max, row_min, has_master = row_stages(A, col_stage)
+    targets = {}
+    for r in np.flatnonzero(row_max != row_min):
+        cols = A.indices[A.indptr[r] : A.indptr[r + 1]]
+        cols = cols[col_stage[cols] > 0]
+        target = set(col_stage[cols[by_timepoint[cols]]].tolist()) or {0}
+        for j in cols[~by_timepoint[cols]]:
+            targets.setdefault(j, set()).update(target)
+    moved = []
+    for j, target in targets.items():
+        col_stage[j] = target.pop() if len(target) == 1 else 0
+        if col_stage[j] == 0:
+            moved.append(j)
+    if moved:
+        names = sorted({repn.columns[j].parent_component().name for j in moved})
+        m.logger.info(
+            f"Moved {len(moved)} variables that link subproblems to the master "
+            f"problem: {', '.join(names)}."
+        )
+    row_max, row_min, has_master = row_stages(A, col_stage)
+    merged += merge(
+        np.flatnonzero(row_max != row_min), col_stage, np.ones_like(by_timepoint)
+    )
+    if merged:
+        names = sorted({repn.rows[r][0].parent_component().name for r in merged})
+        m.logger.info(
+            f"Merged the subproblems linked by these constraints: {', '.join(names)}."
+        )
+
+    col_stage = current(col_stage)
+    # stages whose variables all moved elsewhere are dropped
+    roots = sorted(set(col_stage[col_stage > 0].tolist()))
+    new_id = np.zeros(len(stages) + 1, dtype=int)
+    members = {root: [] for root in roots}
+    for k in range(1, len(stages) + 1):
+        if find(k) in members:
+            new_id[k] = roots.index(find(k)) + 1
+            members[find(k)].append(stages[k - 1])
+    return new_id[col_stage], [members[root] for root in roots]
+
+
+def layout(repn):
+    """
+    Return a hash of the names of the columns and rows of a standard form, to
+    check that a rebuilt model has the same layout.
+    """
+    h = hashlib.sha256()
+    for v in repn.columns:
+        h.update(v.name.encode() + b"\n")
+    for con, multiplier in repn.rows:
+        h.update(f"{con.name} {multiplier}\n".encode())
+    return h.hexdigest()
+
+
+def decompose(m, options):
+    """
+    Convert the model to matrix form and split it into a master problem and
+    subproblems. Returns a dict describing the decomposition, which holds no
+    references to the model.
+    """
+    repn = LinearStandardFormCompiler().write(m)
+    if len(repn.objectives) != 1:
+        raise ValueError("Benders decomposition needs exactly one objective.")
+    columns = repn.columns
+    labels, by_timepoint, stages = stage_labels(m, columns, options.split)
+    stage_id = {s: k + 1 for k, s in enumerate(stages)}
+    col_stage = np.array([0 if s is None else stage_id[s] for s in labels])
+    c = repn.c.toarray()[0]
+    rhs = np.asarray(repn.rhs, dtype=float)
+    A = sp.csr_array(repn.A)
+    bounds = np.array(
+        [
+            [-np.inf if lb is None else lb, np.inf if ub is None else ub]
+            for lb, ub in (v.bounds for v in columns)
+        ],
+        dtype=float,
+    )
+    col_stage, stages = unlink_stages(m, repn, A, col_stage, by_timepoint, stages)
+    integer = np.array([v.is_integer() or v.is_binary() for v in columns])
+    if integer[col_stage > 0].any():
+        raise ValueError(
+            "Integer variables in the operating subproblems (e.g., unit "
+            "commitment) are not supported by Benders decomposition."
+        )
+    row_max, row_min, has_master = row_stages(A, col_stage)
+    nonempty = np.diff(A.indptr) > 0
+    if (~nonempty & (rhs < 0)).any():
+        raise ValueError("The model has a constraint that can never be met.")
+
+    master_cols = np.flatnonzero(col_stage == 0)
+    master_rows = np.flatnonzero(nonempty & (row_max == 0))
+    subproblems = []
+    for k, stage in enumerate(stages, start=1):
+        cols = np.flatnonzero(col_stage == k)
+        rows = np.flatnonzero(row_max == k)
+        block = A[rows]
+        subproblems.append(
+            dict(
+                stage=", ".join(str(s) for s in stage),
+                cols=cols,
+                rows=rows,
+                c=c[cols],
+                A=sp.csc_array(block[:, cols]),
+                B=sp.csr_array(block[:, master_cols]),
+                rhs=rhs[rows],
+                bounds=bounds[cols],
+                # rows that get slack, which the plan may leave unmet
+                slack=has_master[rows],
+            )
+        )
+    return dict(
+        layout=layout(repn),
+        n_rows=len(repn.rows),
+        c=c,
+        c_offset=float(repn.c_offset[0]),
+        master_cols=master_cols,
+        master_A=sp.csr_array(A[master_rows][:, master_cols]),
+        master_rhs=rhs[master_rows],
+        master_rows=master_rows,
+        bounds=bounds,
+        integer=integer,
+        subproblems=subproblems,
+    )
+
+
+# data for the subproblems of this worker process, by subproblem number
+_worker_subproblems = None
+
+
+def worker_payload(sub):
+    """Return the data a worker process needs to solve a subproblem."""
+    return {key: sub[key] for key in ["A", "c", "bounds", "slack"]}
+
+
+def init_worker(subproblems, penalty):
+    global _worker_subproblems
+    _worker_subproblems = {}
+    for k, sub in subproblems.items():
+        n_slack = int(sub["slack"].sum())
+        # add slack columns to the rows that involve investment variables
+        slack = sp.csc_array(
+            (
+                -np.ones(n_slack),
+                (np.flatnonzero(sub["slack"]), np.arange(n_slack)),
+            ),
+            shape=(len(sub["slack"]), n_slack),
+        )
+        _worker_subproblems[k] = dict(
+            A=sp.hstack([sub["A"], slack], format="csc"),
+            c=np.concatenate([sub["c"], np.full(n_slack, penalty)]),
+            bounds=np.vstack([sub["bounds"], np.tile([0.0, np.inf], (n_slack, 1))]),
+            n=sub["A"].shape[1],
+        )
+
+
+def solve_subproblem(k, rhs):
+    """
+    Solve subproblem k with the given right-hand sides. Returns (status,
+    objective, slack used, values, row duals).
+    """
+    sub = _worker_subproblems[k]
+    result = linprog(
+        sub["c"], A_ub=sub["A"], b_ub=rhs, bounds=sub["bounds"], method="highs"
+    )
+    if result.status != 0:
+        return result.status, None, None, None, None
+    return (
+        0,
+        result.fun,
+        float(result.x[sub["n"] :].sum()),
+        result.x[: sub["n"]],
+        result.ineqlin.marginals,
+    )
+
+
+def start_workers(d, options):
+    """
+    Start the worker processes and give each one its share of the
+    subproblems, balanced by their number of nonzeros. Returns the executor
+    that runs each subproblem. The subproblem matrices are then dropped from
+    d, so the main process only keeps the parts it needs for the cuts.
+    """
+    subproblems = d["subproblems"]
+    n_workers = min(options.workers or os.cpu_count() or 1, len(subproblems))
+    shares = [{} for _ in range(n_workers)]
+    load = np.zeros(n_workers)
+    for k in sorted(
+        range(len(subproblems)), key=lambda k: -subproblems[k]["A"].nnz
+    ):
+        w = int(np.argmin(load))
+        shares[w][k] = worker_payload(subproblems[k])
+        load[w] += subproblems[k]["A"].nnz
+    # spawned workers only receive their own share; forked ones would start
+    # with a copy of everything in the main process
+    context = multiprocessing.get_context("spawn")
+    executors = [
+        ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=context,
+            initializer=init_worker,
+            initargs=(share, options.infeasibility_penalty),
+        )
+        for share in shares
+    ]
+    # start the workers now, while the matrices are still here to send
+    for executor in executors:
+        executor.submit(int).result()
+    assigned = [None] * len(subproblems)
+    for executor, share in zip(executors, shares):
+        for k in share:
+            assigned[k] = executor
+    for sub in subproblems:
+        for key in ["A", "c", "bounds"]:
+            del sub[key]
+    return executors, assigned
+
+
+def master_problem(d, cuts):
+    """
+    Return the master problem with the cuts found so far as a dict of linprog
+    arguments for the investment variables x followed by theta, the cost of
+    each subproblem. Each cut is (k, gradient, constant), meaning theta[k] >=
+    gradient @ x + constant, with the gradient stored as a sparse row.
+    theta[k] is fixed at 0 until subproblem k has a cut. The objective and
+    the cut rows are multiplied by scale.
+    """
+    n_theta = len(d["subproblems"])
+    c = np.concatenate([d["c"][d["master_cols"]], np.ones(n_theta)])
+    # with the infeasibility penalty, cut gradients and constants reach 1e15;
+    # unless they are scaled down, HiGHS reports some masters as unbounded
+    scale = 1 / max(np.abs(c).max(), 1.0)
+    A = [sp.hstack([d["master_A"], sp.csr_array((d["master_A"].shape[0], n_theta))])]
+    b = [d["master_rhs"]]
+    if cuts:
+        grad = sp.vstack([g for k, g, const in cuts])
+        theta = sp.csr_array(
+            (
+                -np.ones(len(cuts)),
+                (np.arange(len(cuts)), [k for k, g, const in cuts]),
+            ),
+            shape=(len(cuts), n_theta),
+        )
+        A.append(scale * sp.hstack([grad, theta]))
+        b.append(scale * np.array([-const for k, g, const in cuts]))
+    has_cut = np.zeros(n_theta, dtype=bool)
+    has_cut[[k for k, g, const in cuts]] = True
+    bounds = np.vstack(
+        [
+            d["bounds"][d["master_cols"]],
+            np.column_stack(
+                [np.where(has_cut, -np.inf, 0.0), np.where(has_cut, np.inf, 0.0)]
+            ),
+        ]
+    )
+    integrality = np.concatenate(
+        [d["integer"][d["master_cols"]], np.zeros(n_theta, dtype=bool)]
+    ).astype(int)
+    return dict(
+        c=scale * c,
+        A_ub=sp.vstack(A, format="csr"),
+        b_ub=np.concatenate(b),
+        bounds=bounds,
+        integrality=integrality if integrality.any() else None,
+        scale=scale,
+        bounded=bool(has_cut.all()),
+    )
+
+
+def solve_master(d, cuts):
+    """
+    Solve the master problem with the cuts found so far. Returns (objective,
+    x, duals, bounded), with objective including the theta terms, the duals
+    of the master rows and bounded telling whether the objective is a lower
+    bound on the cost (i.e., every subproblem has a cut).
+    """
+    master = master_problem(d, cuts)
+    scale, bounded = master.pop("scale"), master.pop("bounded")
+    result = linprog(method="highs", **master)
+    if result.status != 0:
+        raise RuntimeError(f"The Benders master problem failed: {result.message}")
+    duals = result.ineqlin.marginals[: len(d["master_rows"])] / scale
+    n_x = len(d["master_cols"])
+    return result.fun / scale, result.x[:n_x], duals, bounded
+
+
+def level_plan(d, cuts, x_best, level):
+    """
+    Return the plan closest to x_best (by the total change in each investment
+    variable) whose cost, with the cuts found so far, is at most level, or
+    None if the master problem can't find one.
+    """
+    master = master_problem(d, cuts)
+    scale = master.pop("scale")
+    master.pop("bounded")
+    n_x, n = len(d["master_cols"]), len(master["c"])
+    # add u >= |x - x_best| and a row that keeps the master cost below level
+    A, rows = master["A_ub"], master["A_ub"].shape[0]
+    eye = sp.eye_array(n_x, n, format="csr")
+    change = sp.eye_array(n_x, format="csr")
+    master.update(
+        c=np.concatenate([np.zeros(n), np.ones(n_x)]),
+        A_ub=sp.vstack(
+            [
+                sp.hstack([A, sp.csr_array((rows, n_x))]),
+                sp.hstack([sp.csr_array(master["c"][None, :]), sp.csr_array((1, n_x))]),
+                sp.hstack([eye, -change]),
+                sp.hstack([-eye, -change]),
+            ],
+            format="csc",
+        ),
+        b_ub=np.concatenate(
+            [master["b_ub"], [scale * (level - d["c_offset"])], x_best, -x_best]
+        ),
+        bounds=np.vstack([master["bounds"], np.tile([0.0, np.inf], (n_x, 1))]),
+    )
+    if master["integrality"] is not None:
+        master["integrality"] = np.concatenate(
+            [master["integrality"], np.zeros(n_x, dtype=int)]
+        )
+    result = linprog(method="highs", **master)
+    return result.x[:n_x] if result.status == 0 else None
+
+
+def first_cuts(d):
+    """
+    Return a cut for each subproblem whose cost has a lower bound that holds
+    for any plan: variables with a positive cost at their lower bounds and
+    those with a negative cost at their upper bounds, or, if they have none,
+    at the limit set by a row with no other subproblem variables, e.g.,
+    SuspendGen <= BuildGen. Subproblems without such a bound get no cut.
+    """
+    cuts = []
+    for k, sub in enumerate(d["subproblems"]):
+        c, lb, ub = sub["c"], sub["bounds"][:, 0], sub["bounds"][:, 1]
+        if np.isinf(lb[c > 0]).any():
+            continue
+        constant = c[c > 0] @ lb[c > 0]
+        bounded = (c < 0) & np.isfinite(ub)
+        constant += c[bounded] @ ub[bounded]
+        # rows a * y[j] - B x <= rhs, with a > 0, give y[j] <= (rhs - B x) / a
+        rows = sub["A"].tocsr()
+        single = np.flatnonzero(np.diff(rows.indptr) == 1)
+        single = single[rows.data[rows.indptr[single]] > 0]
+        # prefer the tightest limit from rows without investment variables,
+        # e.g., SuspendGen == 0 for generators that can't be suspended
+        limit = rows.data[rows.indptr[single]]
+        limit = np.where(
+            np.diff(sub["B"].tocsr().indptr)[single] == 0,
+            sub["rhs"][single] / limit,
+            np.inf,
+        )
+        limit_row = {}
+        for r in single[np.argsort(limit, kind="stable")]:
+            limit_row.setdefault(rows.indices[rows.indptr[r]], r)
+        unbounded = np.flatnonzero((c < 0) & ~bounded)
+        if not all(j in limit_row for j in unbounded):
+            continue
+        # (this also holds with the penalized slack on those rows, as long as
+        # the penalty is above -c[j] / a)
+        r = np.array([limit_row[j] for j in unbounded], dtype=int)
+        scale = c[unbounded] / rows.data[rows.indptr[r]]
+        constant += scale @ sub["rhs"][r]
+        gradient = -(sub["B"][r].T @ scale)
+        cuts.append((k, sp.csr_array(gradient[None, :]), constant))
+    return cuts
+
+
+def load_solution(m, d, solution):
+    """
+    Load the values and duals of a solution from solve_benders into the model,
+    which must be built the same way as the one that was decomposed.
+    """
+    repn = LinearStandardFormCompiler().write(m)
+    if layout(repn) != d["layout"]:
+        raise RuntimeError(
+            "The rebuilt model doesn't match the one that was decomposed, so "
+            "the solution can't be loaded."
+        )
+    for v, value in zip(repn.columns, solution["values"].tolist()):
+        v.set_value(value, skip_validation=True)
+    if hasattr(m, "dual"):
+        m.dual.clear()
+        for (con, multiplier), dual in zip(repn.rows, solution["duals"].tolist()):
+            # equality and range constraints appear as two rows
+            m.dual[con] = m.dual.get(con, 0.0) + multiplier * dual
+
+
+def solve_benders(d, options, logger, outputs_dir):
+    """
+    Solve the decomposed model d (see decompose). Returns the progress of
+    each iteration and the best solution, as the values of all the columns
+    and the duals of all the rows of the model's standard form.
+    """
+    cuts, progress = first_cuts(d), []
+    best_upper, best = np.inf, None
+    progress_path = os.path.join(outputs_dir, "benders_progress.csv")
+    os.makedirs(outputs_dir, exist_ok=True)
+
+    start = timer()
+    lower, x, master_duals, bounded = solve_master(d, cuts)
+    master_s = timer() - start
+    executors, assigned = start_workers(d, options)
+    try:
+        for iteration in range(1, options.max_iterations + 1):
+            start = timer()
+            futures = [
+                assigned[k].submit(solve_subproblem, k, sub["rhs"] - sub["B"] @ x)
+                for k, sub in enumerate(d["subproblems"])
+            ]
+            results = [f.result() for f in futures]
+            subproblems_s = timer() - start
+            for sub, result in zip(d["subproblems"], results):
+                if result[0] != 0:
+                    raise RuntimeError(
+                        f"The subproblem for {options.split} {sub['stage']} could "
+                        "not be solved."
+                    )
+
+            # the cost of the plan, including the penalty on any slack
+            upper = d["c_offset"] + d["c"][d["master_cols"]] @ x
+            slack = 0.0
+            for k, (sub, result) in enumerate(zip(d["subproblems"], results)):
+                status, obj, sub_slack, y, row_duals = result
+                upper += obj
+                slack += sub_slack
+                # obj(x) >= obj + gradient @ (x' - x), where the duals give the
+                # change in cost per unit of the right-hand side, rhs - B x
+                gradient = -(sub["B"].T @ row_duals)
+                cuts.append((k, sp.csr_array(gradient[None, :]), obj - gradient @ x))
+            if upper < best_upper:
+                best_upper, best = upper, (x, results, slack)
+
+            start = timer()
+            lower, x, master_duals, bounded = solve_master(d, cuts)
+            lower = lower + d["c_offset"] if bounded else -np.inf
+            if np.isfinite(lower):
+                gap = (best_upper - lower) / max(abs(best_upper), 1e-10)
+                # try the plan nearest the best one whose estimated cost is
+                # part way from the lower bound to the best cost
+                level = lower + options.level * (best_upper - lower)
+                if gap > options.gap:
+                    x = level_plan(d, cuts, best[0], level)
+                    if x is None:
+                        x = solve_master(d, cuts)[1]
+            else:
+                gap = np.inf
+            master_s += timer() - start
+
+            progress.append(
+                dict(
+                    iteration=iteration,
+                    lower_bound=lower,
+                    upper_bound=best_upper,
+                    gap=gap,
+                    slack=slack,
+                    master_s=round(master_s, 2),
+                    subproblems_s=round(subproblems_s, 2),
+                )
+            )
+            with open(progress_path, "w", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=PROGRESS_COLUMNS)
+                writer.writeheader()
+                writer.writerows(progress)
+            logger.info(
+                f"Iteration {iteration}: lower bound {lower:.6g}, upper bound "
+                f"{best_upper:.6g}, gap {gap:.3%}, slack {slack:.6g} (master "
+                f"{master_s:.1f} s, subproblems {subproblems_s:.1f} s)."
+            )
+            master_s = 0.0
+            if gap <= options.gap:
+                break
+        else:
+            logger.warning(
+                f"Stopped after {options.max_iterations} iterations "
+                "(--max-iterations) before reaching the requested gap."
+            )
+    finally:
+        for executor in executors:
+            executor.shutdown(cancel_futures=True)
+
+    x, results, slack = best
+    if slack > FEASIBILITY_TOLERANCE:
+        logger.warning(
+            f"The best plan leaves {slack:.6g} of the subproblem constraints "
+            "unmet; run more iterations (--max-iterations) or raise "
+            "--infeasibility-penalty if this doesn't shrink."
+        )
+    values = np.zeros(len(d["c"]))
+    values[d["master_cols"]] = x
+    duals = np.zeros(d["n_rows"])
+    duals[d["master_rows"]] = master_duals
+    for sub, (status, obj, sub_slack, y, row_duals) in zip(d["subproblems"], results):
+        values[sub["cols"]] = y
+        duals[sub["rows"]] = row_duals
+    return progress, dict(values=values, duals=duals)
+
+
+def define_arguments(argparser):
+    argparser.add_argument(
+        "--split",
+        choices=["period", "timeseries"],
+        default="period",
+        help="Make one dispatch subproblem per period (default) or per "
+        "timeseries.",
+    )
+    argparser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of worker processes for the subproblems (default: one "
+        "per core).",
+    )
+    argparser.add_argument(
+        "--gap",
+        type=float,
+        default=1e-4,
+        help="Stop when the relative gap between the bounds is below this "
+        "(default: 0.0001).",
+    )
+    argparser.add_argument(
+        "--max-iterations",
+        type=int,
+        default=500,
+        help="Maximum number of Benders iterations (default: 500).",
+    )
+    argparser.add_argument(
+        "--level",
+        type=float,
+        default=0.3,
+        help="After the first iteration, try the plan closest to the best one "
+        "so far whose cost in the master problem is this fraction of the way "
+        "from the lower bound to the best cost (default: 0.3). Lower values "
+        "take bolder steps.",
+    )
+    argparser.add_argument(
+        "--infeasibility-penalty",
+        type=float,
+        default=1e9,
+        help="Objective cost per unit of violation of subproblem constraints "
+        "that involve investment variables (default: 1e9).",
+    )
+
+
+def main(args=None):
+    if args is None:
+        args = sys.argv[1:]
+    # arguments after "--" are passed to switch solve to build the model
+    if "--" in args:
+        split = args.index("--")
+        args, switch_args = args[:split], args[split + 1 :]
+    else:
+        switch_args = []
+    parser = argparse.ArgumentParser(
+        description="Solve a Switch model by Benders decomposition."
+    )
+    define_arguments(parser)
+    options = parser.parse_args(args)
+
+    instance = switch_model.solve.main(args=switch_args, return_instance=True)
+    logger, outputs_dir = instance.logger, instance.options.outputs_dir
+    start = timer()
+    d = decompose(instance, options)
+    logger.info(
+        f"Split the model into a master problem with {len(d['master_cols'])} "
+        f"variables and {len(d['subproblems'])} subproblems by {options.split} "
+        f"in {timer() - start:.2f} s."
+    )
+    # the decomposition holds everything the solve needs, so the model can go
+    no_post_solve = instance.options.no_post_solve
+    del instance
+    gc.collect()
+
+    start = timer()
+    progress, solution = solve_benders(d, options, logger, outputs_dir)
+    logger.info(f"Benders decomposition finished in {timer() - start:.2f} s.")
+    if no_post_solve:
+        return None
+    # build the model again to load the solution and write the outputs
+    instance = switch_model.solve.main(args=switch_args, return_instance=True)
+    load_solution(instance, d, solution)
+    instance.post_solve()
+    return instance
+
+
+if __name__ == "__main__":
+    main()
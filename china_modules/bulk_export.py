@@ -0,0 +1,166 @@
+"""
+Write output tables of the China modules in bulk, as arrays.
+
+Each table has the index of a model component (e.g., load zone and
+timepoint) and one column per component with values for that index: decision
+variables, parameters, expressions, and the duals of constraints (when the
+model has a 'dual' suffix, e.g., with --suffixes dual). Values are gathered
+into NumPy arrays for the whole column at once instead of calling value()
+for each element:
+
+  * variable and parameter values are read directly from their data
+    objects;
+  * linear expressions (e.g., RenewableDispatchZone) are compiled once per
+    instance into a sparse matrix of coefficients over the variables, so
+    their values are a single matrix-vector product, which is reused after
+    each solve by the iterative solution methods (e.g., carbon_sweep or
+    --lazy-charge-limit);
+  * duals are read from the suffix, with NaN for rows that are not in the
+    model (rows dropped by the presolve or not yet added by
+    --lazy-charge-limit).
+
+Tables are saved as compressed NumPy archives, <outputs-dir>/<table>.npz,
+with one array per column, which can be read back quickly, e.g., with
+`pd.DataFrame(dict(np.load(path)))`. With --export-csv they are also saved
+as .csv files. Tables without rows (e.g., for plans whose optional input file
+is absent) are not saved.
+
+This module is used by the post_solve functions of the China modules, so it
+does not need to be listed in modules.txt; those modules should also call
+`define_arguments` from their own define_arguments.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+from pyomo.core.expr.visitor import identify_mutable_parameters
+from pyomo.environ import Constraint, Expression, Param, Var, value
+from pyomo.repn.linear import LinearRepnVisitor
+
+
+def define_arguments(argparser):
+    # several modules write tables with this module
+    if any("--export-csv" in a.option_strings for a in argparser._actions):
+        return
+    argparser.add_argument(
+        "--export-csv",
+        action="store_true",
+        default=False,
+        help="Also save the output tables of the China modules as .csv files "
+        "(they are always saved as compressed .npz archives).",
+    )
+
+
+def write_table(m, outdir, name, index_names, keys, columns, csv=None):
+    """
+    Save a table with one row for each index in keys to <outdir>/<name>.npz
+    and, if csv is True, or None and --export-csv was given,
+    <outdir>/<name>.csv. Nothing is saved if keys is empty.
+
+    index_names are the column names for the parts of the index, and columns
+    is a dict of column names and either indexed components (Var, Param,
+    Expression or Constraint) with values for those keys or sequences with a
+    value for each key; Constraints give their duals, and are left out if
+    the model has no dual suffix.
+    """
+    keys = list(keys)
+    if not keys:
+        return
+    table = {}
+    tuples = [k if isinstance(k, tuple) else (k,) for k in keys]
+    for i, index_name in enumerate(index_names):
+        table[index_name] = np.array([k[i] for k in tuples])
+    for column, component in columns.items():
+        if not hasattr(component, "ctype"):
+            table[column] = np.array(component)
+        elif component.ctype is Constraint:
+            if not hasattr(m, "dual"):
+                continue
+            table[column] = dual_values(m.dual, component, keys)
+        else:
+            table[column] = component_values(m, component, keys)
+
+    np.savez_compressed(os.path.join(outdir, name + ".npz"), **table)
+    if csv or (csv is None and m.options.export_csv):
+        pd.DataFrame(table).to_csv(os.path.join(outdir, name + ".csv"), index=False)
+
+
+def component_values(m, component, keys):
+    """Return an array of the values of component for the given keys."""
+    if component.ctype is Var:
+        return np.array([component[k].value for k in keys], dtype=float)
+    if component.ctype is Param:
+        return np.array([component[k] for k in keys])
+    if component.ctype is Expression:
+        rows = expression_rows(m, component)
+        if rows is not None:
+            values = rows.evaluate()
+            return np.array([values[rows.position[k]] for k in keys])
+    return np.array([value(component[k]) for k in keys], dtype=float)
+
+
+def dual_values(dual, constraint, keys):
+    """Return an array of the duals of constraint, NaN for missing rows."""
+    return np.array(
+        [dual.get(constraint[k], np.nan) if k in constraint else np.nan for k in keys],
+        dtype=float,
+    )
+
+
+def expression_rows(m, component):
+    """
+    Return the LinearRows for an indexed Expression, or None if some of its
+    members are nonlinear. The rows are kept with the instance unless their
+    coefficients depend on mutable parameters.
+    """
+    if not hasattr(m, "_bulk_export_rows"):
+        m._bulk_export_rows = {}
+    rows = m._bulk_export_rows.get(component.name)
+    if rows is None:
+        rows = LinearRows(component)
+        if rows.linear and not rows.mutable:
+            m._bulk_export_rows[component.name] = rows
+    return rows if rows.linear else None
+
+
+class LinearRows(object):
+    """
+    Coefficients of the members of an indexed Expression over the variables
+    they use, in coordinate format, plus the constant of each member.
+    """
+
+    def __init__(self, component):
+        visitor = LinearRepnVisitor({})
+        self.position = {}
+        self.linear = True
+        self.mutable = False
+        constants, term_rows, term_vars, coefs = [], [], [], []
+        for row, (key, data) in enumerate(component.items()):
+            self.position[key] = row
+            repn = visitor.walk_expression(data.expr)
+            if repn.nonlinear is not None:
+                self.linear = False
+                return
+            if not self.mutable and next(identify_mutable_parameters(data.expr), None):
+                self.mutable = True
+            constants.append(repn.multiplier * repn.constant)
+            for var_id, coef in repn.linear.items():
+                term_rows.append(row)
+                term_vars.append(var_id)
+                coefs.append(repn.multiplier * coef)
+        var_position = {var_id: i for i, var_id in enumerate(visitor.var_map)}
+        self.variables = list(visitor.var_map.values())
+        self.constants = np.array(constants, dtype=float)
+        self.term_rows = np.array(term_rows, dtype=np.int64)
+        self.term_vars = np.array([var_position[v] for v in term_vars], dtype=np.int64)
+        self.coefs = np.array(coefs, dtype=float)
+
+    def evaluate(self):
+        """Return the value of every row with the current variable values."""
+        x = np.array([v.value for v in self.variables], dtype=float)
+        return self.constants + np.bincount(
+            self.term_rows,
+            weights=self.coefs * x[self.term_vars],
+            minlength=len(self.constants),
+        )
@@ -0,0 +1,284 @@
+"""
+Trace the trade-off between CO2 emissions and system costs with as few
+solves as possible.
+
+The points of the frontier are found by scaling all the carbon caps in
+carbon_policies.csv by a factor s between --min-scale and --max-scale. The
+minimum system cost V(s) of a linear program is a convex, piecewise-linear
+function of its constraint limits, and the duals of the carbon cap
+constraints give its slope, dV/ds = sum over periods of dual[p] * cap[p].
+So after solving at two scales, the tangents at the two ends bound the curve
+between them from below and the chord bounds it from above (the "sandwich"
+method). The next cap is placed where the tangents meet, in the interval
+where the gap between the bounds is largest, and the search stops when every
+gap is below --tolerance (a fraction of the range of system costs covered by
+the frontier). Flat stretches where the caps don't bind and nearly straight
+stretches are then covered by a few points, and solves are concentrated
+where the curve bends.
+
+If the solver returns no duals (e.g., for a MIP), the slopes are estimated
+from the neighbouring points instead and intervals without an estimate are
+bisected. Scales at which the model is infeasible are excluded by bisecting
+between them and the nearest feasible scale until the interval is narrower
+than --scale-tolerance.
+
+The model is built once and re-solved for each point as described in
+china_modules.carbon_sweep. The post-solve outputs for each point (including
+emissions.csv, electricity_cost.csv and dispatch_annual_summary.csv, as used
+by the Fig. 2 notebook) are written to <outputs-dir>/scale_<s>, with a
+per-period summary in carbon_sweep.csv and one row per point, ordered by
+cumulative emissions, in carbon_frontier.csv.
+
+Usage:
+    python -m china_modules.carbon_frontier --min-scale 0.2 --tolerance 0.01 \\
+        -- --solver appsi_highs --inputs-dir inputs
+"""
+
+import argparse
+import os
+import sys
+
+from pyomo.environ import value
+
+from .carbon_sweep import create_sweep_instance, solve_point, write_summary
+
+FRONTIER_COLUMNS = [
+    "point",
+    "carbon_cap_scale",
+    "cumulative_emissions_tCO2",
+    "SystemCost_NPV",
+    "cost_slope_NPV_per_scale",
+    "status",
+    "solve_s",
+]
+
+
+def cost_slope(m, base_caps):
+    """
+    Return dV/ds, the change in the optimal system cost per unit change in
+    the scale applied to base_caps, from the duals of the carbon cap
+    constraints, or None if the solver didn't return them.
+    """
+    slope = 0.0
+    for p in m.PERIODS:
+        c = m.Enforce_Carbon_Cap[p]
+        if not c.active:
+            continue
+        if c not in m.dual:
+            return None
+        # loosening a cap can only lower costs, whatever the sign convention
+        slope -= abs(m.dual[c]) * base_caps[p]
+    return slope
+
+
+def interval_gap(a, b, left, right):
+    """
+    Return (gap, s) for the interval between frontier points a and b: the
+    largest possible distance between the chord and the true cost curve, and
+    the scale where it may occur (where the tangents at a and b meet). left
+    and right are the neighbouring points, used to estimate slopes that are
+    missing. Returns (None, midpoint) if the gap can't be bounded.
+    """
+    slope_a, slope_b = a["slope"], b["slope"]
+    if slope_a is None and left is not None:
+        slope_a = (a["cost"] - left["cost"]) / (a["scale"] - left["scale"])
+    if slope_b is None and right is not None:
+        slope_b = (right["cost"] - b["cost"]) / (right["scale"] - b["scale"])
+    midpoint = (a["scale"] + b["scale"]) / 2
+    width = b["scale"] - a["scale"]
+    secant = (b["cost"] - a["cost"]) / width
+    # by convexity, secants from the neighbouring points give lines that stay
+    # below the curve, so a single line still bounds the gap (at the far end)
+    if slope_a is None and slope_b is None:
+        return None, midpoint
+    if slope_b is None:
+        return max((secant - slope_a) * width, 0.0), midpoint
+    if slope_a is None:
+        return max((slope_b - secant) * width, 0.0), midpoint
+    if slope_b - slope_a <= 0:
+        # no curvature between the points (within solver tolerance)
+        return 0.0, midpoint
+    s = (b["cost"] - a["cost"] + slope_a * a["scale"] - slope_b * b["scale"]) / (
+        slope_a - slope_b
+    )
+    s = min(max(s, a["scale"] + 0.1 * width), b["scale"] - 0.1 * width)
+    chord = a["cost"] + secant * (s - a["scale"])
+    tangent = max(
+        a["cost"] + slope_a * (s - a["scale"]), b["cost"] + slope_b * (s - b["scale"])
+    )
+    return max(chord - tangent, 0.0), s
+
+
+def next_scale(points, options):
+    """
+    Return the scale to solve next, or None if the frontier is complete.
+    points is a list of evaluated points, sorted by scale.
+    """
+    feasible = [p for p in points if p["status"] == "ok"]
+    if not feasible:
+        raise RuntimeError(
+            f"The model is infeasible at --max-scale {options.max_scale}; "
+            "no frontier can be traced."
+        )
+    # move the lower end up to the feasibility limit, if needed
+    lowest = feasible[0]
+    below = [p for p in points if p["scale"] < lowest["scale"]]
+    if below and lowest["scale"] - below[-1]["scale"] > options.scale_tolerance:
+        return (below[-1]["scale"] + lowest["scale"]) / 2
+
+    costs = [p["cost"] for p in feasible]
+    tolerance = options.tolerance * (max(costs) - min(costs))
+    worst_gap, worst_s = 0.0, None
+    for i in range(len(feasible) - 1):
+        a, b = feasible[i], feasible[i + 1]
+        if b["scale"] - a["scale"] <= options.scale_tolerance:
+            continue
+        gap, s = interval_gap(
+            a,
+            b,
+            feasible[i - 1] if i > 0 else None,
+            feasible[i + 2] if i + 2 < len(feasible) else None,
+        )
+        if gap is None:
+            gap = float("inf")
+        if gap > tolerance and gap > worst_gap:
+            worst_gap, worst_s = gap, s
+    return worst_s
+
+
+def trace_frontier(options, switch_args):
+    instance = create_sweep_instance(switch_args)
+    logger = instance.logger
+    outputs_dir = instance.options.outputs_dir
+    base_caps = {p: value(instance.carbon_cap_tco2_per_yr[p]) for p in instance.PERIODS}
+    if all(cap == float("inf") for cap in base_caps.values()):
+        raise ValueError(
+            "carbon_policies.csv gives no carbon caps, so there is nothing to scale."
+        )
+
+    points, summary = [], []
+    s = options.max_scale
+    while s is not None and len(points) < options.max_solves:
+        point = f"scale_{s:.6g}"
+        rows = solve_point(
+            instance, point, {p: cap * s for p, cap in base_caps.items()}
+        )
+        summary.extend(rows)
+        status = rows[0]["status"]
+        points.append(
+            dict(
+                point=point,
+                scale=s,
+                status=status,
+                solve_s=rows[0]["solve_s"],
+                cost=value(instance.SystemCost) if status == "ok" else None,
+                slope=cost_slope(instance, base_caps) if status == "ok" else None,
+                emissions=(
+                    sum(
+                        value(
+                            instance.AnnualEmissions[p]
+                            * instance.period_length_years[p]
+                        )
+                        for p in instance.PERIODS
+                    )
+                    if status == "ok"
+                    else None
+                ),
+            )
+        )
+        points.sort(key=lambda p: p["scale"])
+        write_summary(os.path.join(outputs_dir, "carbon_sweep.csv"), summary)
+        write_frontier(os.path.join(outputs_dir, "carbon_frontier.csv"), points)
+
+        if len(points) == 1 and status == "ok":
+            s = options.min_scale
+        else:
+            s = next_scale(points, options)
+
+    if s is not None:
+        logger.warning(
+            f"Stopped after {options.max_solves} solves (--max-solves) before "
+            "the frontier reached the requested tolerance."
+        )
+    logger.info(
+        f"\nTraced the carbon frontier with {len(points)} solves. Results saved "
+        f"in {os.path.join(outputs_dir, 'carbon_frontier.csv')}."
+    )
+    return points
+
+
+def write_frontier(path, points):
+    rows = [
+        dict(
+            point=p["point"],
+            carbon_cap_scale=p["scale"],
+            cumulative_emissions_tCO2=p["emissions"],
+            SystemCost_NPV=p["cost"],
+            cost_slope_NPV_per_scale=p["slope"],
+            status=p["status"],
+            solve_s=p["solve_s"],
+        )
+        for p in sorted(
+            points, key=lambda p: (p["emissions"] is None, p["emissions"] or 0)
+        )
+    ]
+    write_summary(path, rows, columns=FRONTIER_COLUMNS)
+
+
+def define_frontier_arguments(argparser):
+    argparser.add_argument(
+        "--min-scale",
+        type=float,
+        default=0.2,
+        help="Smallest multiple of the carbon caps in carbon_policies.csv to "
+        "consider (default: 0.2).",
+    )
+    argparser.add_argument(
+        "--max-scale",
+        type=float,
+        default=1.0,
+        help="Largest multiple of the carbon caps to consider (default: 1).",
+    )
+    argparser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.01,
+        help="Stop when linear interpolation between the points is within "
+        "this fraction of the range of system costs (default: 0.01).",
+    )
+    argparser.add_argument(
+        "--scale-tolerance",
+        type=float,
+        default=0.005,
+        help="Don't divide intervals narrower than this, in units of scale "
+        "(default: 0.005).",
+    )
+    argparser.add_argument(
+        "--max-solves",
+        type=int,
+        default=20,
+        help="Maximum number of points to solve (default: 20).",
+    )
+
+
+def main(args=None):
+    if args is None:
+        args = sys.argv[1:]
+    # arguments after "--" are passed to switch solve
+    if "--" in args:
+        split = args.index("--")
+        args, switch_args = args[:split], args[split + 1 :]
+    else:
+        switch_args = []
+    parser = argparse.ArgumentParser(
+        description="Trace the CO2-cost frontier of a Switch model adaptively."
+    )
+    define_frontier_arguments(parser)
+    options = parser.parse_args(args)
+    if not 0 <= options.min_scale < options.max_scale:
+        parser.error("--min-scale must be at least 0 and less than --max-scale.")
+    trace_frontier(options, switch_args)
+
+
+if __name__ == "__main__":
+    main()
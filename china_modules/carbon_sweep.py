@@ -0,0 +1,350 @@
+"""
+Solve the model for a series of carbon caps, building the instance only once.
+
+A trade-off curve between CO2 emissions and system costs (e.g., Fig. 2 of
+Peng et al., 2023) needs one solution per carbon cap. Everything except the
+cap is identical between the points, so this script builds and loads the
+model once, then changes only the cap and solves again, letting the solver
+start from the basis of the previous point.
+
+When it is loaded as a module, it replaces the fixed carbon cap of
+switch_model.policies.carbon_policies with a mutable parameter of the same
+name and defines Enforce_Carbon_Cap for every period. Periods without a cap
+(carbon_cap_tco2_per_yr = inf, the default) have their constraint
+deactivated, so the model is the same as with the standard module.
+
+Use it as a script, with the usual `switch solve` arguments after `--`:
+
+    python -m china_modules.carbon_sweep --carbon-cap-scales 1 0.8 0.6 0.4 \\
+        -- --solver appsi_highs --inputs-dir inputs
+
+Each point of the sweep is given either by a scale factor applied to all the
+caps in carbon_policies.csv (--carbon-cap-scales), or by a table
+(--carbon-cap-file) with columns point, PERIOD and carbon_cap_tco2_per_yr.
+Periods not listed for a point keep the cap from carbon_policies.csv.
+
+The cap is updated in place on a persistent solver interface:
+  * appsi_* solvers (e.g., appsi_highs or appsi_gurobi) detect the changed
+    parameter values and update only the right-hand sides of the cap rows;
+  * legacy *_persistent solvers (e.g., gurobi_persistent) have the changed
+    cap rows removed and added again.
+In both cases the solver keeps its model and basis between points. Other
+solvers are accepted, but then each point is sent to the solver from scratch
+(the Pyomo instance is still only built once).
+
+The post-solve outputs of each point (emissions.csv, electricity_cost.csv,
+dispatch_annual_summary.csv, etc.) are written to <outputs-dir>/<point>
+unless --no-post-solve is given, and a summary of all points is written to
+<outputs-dir>/carbon_sweep.csv.
+"""
+
+import argparse
+import csv
+import os
+import sys
+from timeit import default_timer as timer
+
+from pyomo.environ import (
+    Constraint,
+    NonNegativeReals,
+    Param,
+    SolverFactory,
+    SolverManagerFactory,
+    value,
+)
+
+import switch_model.solve
+
+from .solver_errors import INFEASIBLE_MESSAGES
+
+dependencies = (
+    "switch_model.timescales",
+    "switch_model.financials",
+    "switch_model.policies.carbon_policies",
+)
+
+SUMMARY_COLUMNS = [
+    "point",
+    "PERIOD",
+    "carbon_cap_tco2_per_yr",
+    "AnnualEmissions_tCO2_per_yr",
+    "carbon_cap_dual_future_dollar_per_tco2",
+    "SystemCostPerPeriod_NPV",
+    "SystemCost_NPV",
+    "status",
+    "solve_s",
+]
+
+
+def define_components(mod):
+    """
+    Replace carbon_cap_tco2_per_yr and Enforce_Carbon_Cap from
+    switch_model.policies.carbon_policies with versions whose cap can be
+    changed after the model is built. carbon_policies.load_inputs and
+    post_solve look the components up by name, so they use these instead.
+    """
+    mod.del_component(mod.Enforce_Carbon_Cap)
+    mod.del_component(mod.carbon_cap_tco2_per_yr)
+    mod.carbon_cap_tco2_per_yr = Param(
+        mod.PERIODS,
+        within=NonNegativeReals,
+        default=float("inf"),
+        mutable=True,
+        doc=(
+            "Emissions from this model must be less than this cap. "
+            "This is specified in metric tonnes of CO2 per year."
+        ),
+    )
+    mod.Enforce_Carbon_Cap = Constraint(
+        mod.PERIODS,
+        rule=lambda m, p: m.AnnualEmissions[p] <= m.carbon_cap_tco2_per_yr[p],
+        doc=(
+            "Enforces the carbon cap for generation-related emissions; "
+            "deactivated in periods without a cap."
+        ),
+    )
+
+
+def pre_solve(instance):
+    set_carbon_caps(instance, {})
+
+
+def set_carbon_caps(m, caps):
+    """
+    Set the carbon cap for the periods in caps (a dict of {period: tCO2/yr})
+    and activate the cap rows of periods that have a finite cap. Returns the
+    periods whose cap changed.
+    """
+    changed = []
+    for p in m.PERIODS:
+        if p in caps and caps[p] != value(m.carbon_cap_tco2_per_yr[p]):
+            m.carbon_cap_tco2_per_yr[p] = caps[p]
+            changed.append(p)
+        capped = value(m.carbon_cap_tco2_per_yr[p]) != float("inf")
+        if m.Enforce_Carbon_Cap[p].active != capped:
+            if capped:
+                m.Enforce_Carbon_Cap[p].activate()
+            else:
+                m.Enforce_Carbon_Cap[p].deactivate()
+            if p not in changed:
+                changed.append(p)
+    return changed
+
+
+def read_sweep_points(options, base_caps):
+    """
+    Return a list of (point, caps) for the sweep, where caps is a dict of
+    {period: tCO2/yr}.
+    """
+    points = []
+    if options.carbon_cap_file:
+        with open(options.carbon_cap_file, newline="") as f:
+            for row in csv.DictReader(f):
+                point = row["point"]
+                if not points or points[-1][0] != point:
+                    if point in dict(points):
+                        raise ValueError(
+                            f"Rows for point {point} in {options.carbon_cap_file} "
+                            "must be listed together."
+                        )
+                    points.append((point, dict(base_caps)))
+                period = int(row["PERIOD"])
+                if period not in base_caps:
+                    raise ValueError(
+                        f"Period {period} in {options.carbon_cap_file} is not "
+                        "one of the model's periods."
+                    )
+                cap = row["carbon_cap_tco2_per_yr"].strip()
+                points[-1][1][period] = (
+                    float("inf") if cap in {"", ".", "inf"} else float(cap)
+                )
+    for scale in options.carbon_cap_scales:
+        points.append(
+            (f"scale_{scale:g}", {p: cap * scale for p, cap in base_caps.items()})
+        )
+    return points
+
+
+def update_solver(m, changed):
+    """
+    Prepare the solver for the next point after the cap rows of the changed
+    periods were updated. Legacy persistent solvers need those rows rebuilt;
+    appsi solvers find changed parameters themselves when solve() is called.
+    """
+    solver = getattr(m, "solver", None)
+    if solver is None or not hasattr(solver, "set_instance"):
+        return
+    if m.options.solver.startswith("appsi_"):
+        return
+    if getattr(solver, "_pyomo_model", None) is not m:
+        solver.set_instance(m, symbolic_solver_labels=m.options.symbolic_solver_labels)
+        return
+    for p in changed:
+        c = m.Enforce_Carbon_Cap[p]
+        if c in solver._pyomo_con_to_solver_con_map:
+            solver.remove_constraint(c)
+        if c.active:
+            solver.add_constraint(c)
+
+
+def create_sweep_instance(switch_args):
+    """
+    Build and load the model with this module added, ready for the first
+    solve, and set up a persistent solver if one was requested.
+    """
+    instance = switch_model.solve.main(
+        args=switch_args + ["--include-modules", "china_modules.carbon_sweep"],
+        return_instance=True,
+    )
+    options = instance.options
+    os.makedirs(options.outputs_dir, exist_ok=True)
+
+    if options.solver.endswith("_persistent"):
+        # create the solver here so switch_model.solve.solve() reuses it and
+        # update_solver() can load the instance into it before the first solve
+        instance.solver = SolverFactory(options.solver)
+        instance.solver_manager = SolverManagerFactory(options.solver_manager)
+    elif not options.solver.startswith("appsi_"):
+        instance.logger.warning(
+            f"Solver {options.solver} is not a persistent solver interface, so "
+            "each point will be solved from scratch. Use an appsi_* or "
+            "*_persistent solver to re-solve from the previous basis."
+        )
+    return instance
+
+
+def found_no_solution(error):
+    """
+    Return True if error is the one switch_model.solve raises when the solver
+    finds no feasible solution. Switch raises "Infeasible model" after
+    checking the termination condition, but appsi_* solvers raise their own
+    error before returning any results, so there is no termination condition
+    to check and the error is recognized by its message.
+    """
+    return str(error).startswith(INFEASIBLE_MESSAGES)
+
+
+def solve_point(instance, point, caps):
+    """
+    Solve the model with the carbon caps given in caps (a dict of
+    {period: tCO2/yr}; other periods keep their current cap), save the
+    post-solve outputs in <outputs-dir>/<point> and return one summary row
+    per period.
+    """
+    options = instance.options
+    instance.logger.info(f"\nCarbon cap sweep point {point}...")
+    changed = set_carbon_caps(instance, caps)
+    update_solver(instance, changed)
+    start = timer()
+    try:
+        switch_model.solve.solve(instance)
+        status = "ok"
+    except RuntimeError as e:
+        if not found_no_solution(e):
+            raise
+        status = "infeasible"
+    solve_s = round(timer() - start, 2)
+
+    if status == "ok" and not options.no_post_solve:
+        instance.post_solve(os.path.join(options.outputs_dir, point))
+    rows = []
+    for p in instance.PERIODS:
+        row = dict(
+            point=point,
+            PERIOD=p,
+            carbon_cap_tco2_per_yr=value(instance.carbon_cap_tco2_per_yr[p]),
+            status=status,
+            solve_s=solve_s,
+        )
+        if status == "ok":
+            c = instance.Enforce_Carbon_Cap[p]
+            row.update(
+                AnnualEmissions_tCO2_per_yr=value(instance.AnnualEmissions[p]),
+                carbon_cap_dual_future_dollar_per_tco2=(
+                    abs(instance.dual[c])
+                    / value(instance.bring_annual_costs_to_base_year[p])
+                    if c.active and c in instance.dual
+                    else "."
+                ),
+                SystemCostPerPeriod_NPV=value(instance.SystemCostPerPeriod[p]),
+                SystemCost_NPV=value(instance.SystemCost),
+            )
+        rows.append(row)
+    instance.logger.info(f"Point {point}: {status}, solved in {solve_s:.2f} s.")
+    return rows
+
+
+def write_summary(path, rows, columns=SUMMARY_COLUMNS):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def run_sweep(sweep_options, switch_args):
+    instance = create_sweep_instance(switch_args)
+    base_caps = {p: value(instance.carbon_cap_tco2_per_yr[p]) for p in instance.PERIODS}
+    points = read_sweep_points(sweep_options, base_caps)
+    if not points:
+        raise ValueError(
+            "No sweep points given; use --carbon-cap-scales or --carbon-cap-file."
+        )
+
+    summary = []
+    summary_path = os.path.join(
+        instance.options.outputs_dir, sweep_options.sweep_summary
+    )
+    for point, caps in points:
+        summary.extend(solve_point(instance, point, caps))
+        # save after every point so a long sweep can be inspected while it runs
+        write_summary(summary_path, summary)
+
+    instance.logger.info(
+        f"\nCarbon cap sweep complete. Summary saved in {summary_path}."
+    )
+    return summary
+
+
+def define_sweep_arguments(argparser):
+    argparser.add_argument(
+        "--carbon-cap-scales",
+        type=float,
+        nargs="+",
+        default=[],
+        help="Solve once for each of these multiples of the carbon caps in "
+        "carbon_policies.csv, e.g., 1 0.8 0.6.",
+    )
+    argparser.add_argument(
+        "--carbon-cap-file",
+        default=None,
+        help="CSV file with columns point, PERIOD and carbon_cap_tco2_per_yr "
+        "giving the caps for each sweep point.",
+    )
+    argparser.add_argument(
+        "--sweep-summary",
+        default="carbon_sweep.csv",
+        help="Name of the summary file in the outputs directory "
+        "(default: carbon_sweep.csv).",
+    )
+
+
+def main(args=None):
+    if args is None:
+        args = sys.argv[1:]
+    # arguments after "--" are passed to switch solve
+    if "--" in args:
+        split = args.index("--")
+        args, switch_args = args[:split], args[split + 1 :]
+    else:
+        switch_args = []
+    parser = argparse.ArgumentParser(
+        description="Solve a Switch model for a series of carbon caps, "
+        "building the instance only once."
+    )
+    define_sweep_arguments(parser)
+    options = parser.parse_args(args)
+    run_sweep(options, switch_args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+Shared battery-charging limit for 'mixed_strategy' and 're_connected_strategy'.
+
+Both modules limit the charging of some central batteries in each load zone
+and timepoint to the renewable dispatch in that zone and timepoint:
+
+    Charge_Storage_Upper_Limit_Zone[z, t]:
+        <battery charging>[z, t] <= RenewableDispatchZone[z, t]
+
+Most of these rows are slack at the optimum (e.g., at midday, when solar
+output far exceeds battery charging), so with --lazy-charge-limit they are
+added only when needed: the model starts with the rows in
+CHARGE_LIMIT_ZONE_TIMEPOINTS (none, or the seed rows described below), and
+after each solve the rows that the solution violates are added and the model
+is solved again, until no rows are violated. This uses Switch's iteration
+framework (see switch_model.solve.iterate); this module registers itself as
+an iteration module, so it does not need to be listed in iterate.txt.
+--max-iter limits the number of rounds.
+
+With --lazy-charge-limit-seed-cf, the first solve also includes the rows for
+zones and timepoints where the average capacity factor of the zone's
+variable renewable projects is at or below the given value (e.g., at night),
+since those rows are likely to bind. Zones with no renewable projects are
+always seeded.
+
+Appsi solvers pick up the new rows themselves and re-solve from the previous
+solution; other solvers are given the whole model again in each round.
+
+After solving, `write_outputs` saves RenewableDispatchZone, the battery
+charging and the duals of the limit for every zone and timepoint in
+battery_charge_limit.npz (see bulk_export.py).
+
+This module is used by calling `define_components` from the
+define_components of the module that owns the limit (and `write_outputs`
+from its post_solve), so it does not need to be listed in modules.txt; that
+module should also call `define_arguments` from its own define_arguments.
+"""
+
+from pyomo.environ import *
+from pyomo.core.expr.numvalue import is_constant
+
+from . import bulk_export
+
+# violations smaller than this (MW) are treated as solver tolerance
+VIOLATION_TOLERANCE_MW = 1e-3
+
+
+def define_arguments(argparser):
+    bulk_export.define_arguments(argparser)
+    # both modules that use the charge limit add these arguments
+    if any("--lazy-charge-limit" in a.option_strings for a in argparser._actions):
+        return
+    argparser.add_argument(
+        "--lazy-charge-limit",
+        action="store_true",
+        default=False,
+        help="Add Charge_Storage_Upper_Limit_Zone rows only when the solution "
+        "violates them, re-solving until none are violated.",
+    )
+    argparser.add_argument(
+        "--lazy-charge-limit-seed-cf",
+        type=float,
+        default=None,
+        help="With --lazy-charge-limit, start with the rows for zones and "
+        "timepoints where the average renewable capacity factor is at or "
+        "below this value (default: start with no rows).",
+    )
+
+
+def define_components(mod, index, charge):
+    """
+    Define Charge_Storage_Upper_Limit_Zone[z, t] for (z, t) in index, limiting
+    charge[z, t] to RenewableDispatchZone[z, t]. index and charge are the
+    names of the index set and charging expression on mod.
+
+    With --lazy-charge-limit, the constraint is indexed by
+    CHARGE_LIMIT_ZONE_TIMEPOINTS, the subset of index whose rows are
+    currently in the model.
+    """
+    mod.charge_limit_index = index
+    mod.charge_limit_expression = charge
+
+    if not mod.options.lazy_charge_limit:
+        mod.Charge_Storage_Upper_Limit_Zone = Constraint(
+            getattr(mod, index), rule=charge_limit_rule
+        )
+        return
+
+    mod.CHARGE_LIMIT_ZONE_TIMEPOINTS = Set(
+        dimen=2, within=getattr(mod, index), initialize=seed_rows
+    )
+    mod.Charge_Storage_Upper_Limit_Zone = Constraint(
+        mod.CHARGE_LIMIT_ZONE_TIMEPOINTS, rule=charge_limit_rule
+    )
+    if [__name__] not in mod.iterate_modules:
+        mod.iterate_modules.append([__name__])
+
+
+def charge_limit_rule(m, z, t):
+    return getattr(m, m.charge_limit_expression)[z, t] <= m.RenewableDispatchZone[z, t]
+
+
+def seed_rows(m):
+    """Rows to include in the first solve with --lazy-charge-limit."""
+    limit = m.options.lazy_charge_limit_seed_cf
+    if limit is None:
+        return []
+    # average capacity factor of the renewable projects in each zone and
+    # timepoint, gathered a whole period at a time
+    average = {}
+    for p in m.PERIODS:
+        tps = list(m.TPS_IN_PERIOD[p])
+        for z in m.LOAD_ZONES:
+            gens = list(m.VARIABLE_GENS_IN_ZONE_PERIOD[z, p])
+            if gens:
+                factors = [
+                    sum(m.gen_max_capacity_factor[g, t] for g in gens) / len(gens)
+                    for t in tps
+                ]
+                average.update(zip(((z, t) for t in tps), factors))
+    charge = getattr(m, m.charge_limit_expression)
+    rows = []
+    for z, t in getattr(m, m.charge_limit_index):
+        if is_constant(charge[z, t].expr):
+            # no batteries to limit
+            continue
+        if (z, t) not in average or average[z, t] <= limit:
+            rows.append((z, t))
+    return rows
+
+
+def post_iterate(m):
+    """
+    Add the rows that the last solution violates. Returns True (converged)
+    if there were none.
+    """
+    if not m.options.lazy_charge_limit:
+        return True
+    charge = getattr(m, m.charge_limit_expression)
+    active = m.CHARGE_LIMIT_ZONE_TIMEPOINTS
+    new_rows = [
+        (z, t)
+        for z, t in getattr(m, m.charge_limit_index)
+        if (z, t) not in active
+        and value(charge[z, t]) - value(m.RenewableDispatchZone[z, t])
+        > VIOLATION_TOLERANCE_MW
+    ]
+    for z, t in new_rows:
+        active.add((z, t))
+        m.Charge_Storage_Upper_Limit_Zone.add((z, t), charge_limit_rule(m, z, t))
+
+    solver = getattr(m, "solver", None)
+    if (
+        new_rows
+        and not m.options.solver.startswith("appsi_")
+        and getattr(solver, "_pyomo_model", None) is m
+    ):
+        # legacy persistent solver that already has the model
+        for row in new_rows:
+            solver.add_constraint(m.Charge_Storage_Upper_Limit_Zone[row])
+
+    m.logger.info(
+        f"Lazy charge limit round {m.iteration_number + 1}: added "
+        f"{len(new_rows)} violated rows; {len(active)} of "
+        f"{len(getattr(m, m.charge_limit_index))} rows are in the model."
+    )
+    return not new_rows
+
+
+def write_outputs(m, outdir):
+    """
+    Save the renewable dispatch, battery charging and duals of the charging
+    limit (NaN for rows that were never added) for each zone and timepoint.
+    """
+    bulk_export.write_table(
+        m,
+        outdir,
+        "battery_charge_limit",
+        ["LOAD_ZONE", "TIMEPOINT"],
+        getattr(m, m.charge_limit_index),
+        {
+            "RenewableDispatchZone": m.RenewableDispatchZone,
+            m.charge_limit_expression: getattr(m, m.charge_limit_expression),
+            "Charge_Storage_Upper_Limit_Zone_dual": m.Charge_Storage_Upper_Limit_Zone,
+        },
+    )
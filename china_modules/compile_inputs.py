@@ -0,0 +1,857 @@
+"""
+Compile Switch input files from the SWITCH-China database tables.
+
+This script turns the raw tables in `database/` into the generator,
+transmission and load files read by Switch:
+
+    gen_info.csv                  existing_plants, new_projects, generator_info,
+                                  generator_cap_cost_yearly
+    gen_build_predetermined.csv   existing_plants, generator_info
+    gen_build_costs.csv           gen_info, existing_plants,
+                                  generator_cap_cost_yearly, generator_info,
+                                  periods, financials
+    gen_part_load_heat_rates.csv  gen_info, heat_rate_curves
+    transmission_lines.csv        transmission_lines
+    loads.csv                     china_electricity_demand_projection,
+                                  china_electricity_growth_rate,
+                                  load_profile_monthly_province,
+                                  load_profile_daily_province, timepoints
+    zone_coincident_peak_demand.csv
+                                  the same demand tables, periods
+
+With --demand-scenarios, loads.<scenario>.csv and
+zone_coincident_peak_demand.<scenario>.csv are also written for each listed
+demand scenario (or all of them). Demand is computed for every scenario at
+once by broadcasting annual energy x monthly share x hourly shape over zones
+and timepoints, so full hourly years are practical. A scenario is selected
+when solving with, e.g.,
+
+    --input-aliases loads.csv=loads.Scenario_1.csv \\
+        zone_coincident_peak_demand.csv=zone_coincident_peak_demand.Scenario_1.csv
+
+The generator tables (gen_info, gen_build_predetermined, gen_build_costs and
+gen_part_load_heat_rates) reproduce the shipped inputs exactly. The other
+tables follow the rules above and differ from the shipped files in these
+ways, so rebuilding them changes the model:
+
+  * transmission capacities and post-2030 loads in the shipped inputs come
+    from later data updates that are not in database/ (the compiler extends
+    the last growth rate past 2030);
+  * in every period, including 2025 and 2030, the shipped loads of Hebei use
+    an hourly shape that is not in load_profile_daily_province.csv, and
+    the shipped loads of Jilin and Liaoning use each other's monthly shares
+    from load_profile_monthly_province.csv. Rebuilt loads and peak demand for
+    these provinces differ from the shipped ones by factors of 0.78-1.20
+    (Hebei) and 0.95-1.05 (Jilin and Liaoning) in each timepoint;
+  * loads and peak demand of the other provinces match the shipped files
+    for 2025 and 2030.
+
+Rebuilt files keep the line endings of the files they replace.
+
+Scenario settings that are maintained by hand (periods.csv, timepoints.csv,
+financials.csv, non_fuel_energy_sources.csv, load_zones.csv) are read from the
+inputs directory.
+
+Each output is a node in a small dependency graph. The compiler records a
+content hash of every source table, of the options and of the code used to
+build each output in `compile_inputs_manifest.json` in the inputs directory.
+On the next run, an output is only rebuilt if one of those hashes changed.
+Outputs are also hashed after they are written, so an output that is rebuilt
+with the same content does not trigger rebuilds of the outputs that depend on
+it. Files in the inputs directory that were not written by the compiler are
+never overwritten unless --force is given.
+
+Usage:
+    python -m china_modules.compile_inputs --database-dir database \\
+        --inputs-dir inputs [--demand-scenarios all] [--force] [--dry-run] \\
+        [targets ...]
+"""
+
+import argparse
+import hashlib
+import inspect
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+MANIFEST_FILE = "compile_inputs_manifest.json"
+
+# Energy-to-power ratios (hours) of storage technologies; these are not
+# recorded in generator_info.csv.
+STORAGE_ENERGY_TO_POWER_RATIO = {"Battery_Storage": 4, "Hydro_Pumped": 8}
+
+
+def file_hash(path):
+    """Return the sha256 hex digest of the contents of a file."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def output_hash(paths):
+    """Return the hash of a target's output file, or of all of its files."""
+    if len(paths) == 1:
+        return file_hash(paths[0])
+    h = hashlib.sha256()
+    for path in paths:
+        h.update(f"{os.path.basename(path)}:{file_hash(path)}".encode())
+    return h.hexdigest()
+
+
+def tf(series):
+    """Convert 't'/'f' (or boolean) columns to the TRUE/FALSE used in inputs."""
+    return (
+        series.astype(str)
+        .str.lower()
+        .isin(["t", "true", "1"])
+        .map({True: "TRUE", False: "FALSE"})
+    )
+
+
+def zone_name(series):
+    """Normalize province names from the database to load zone names."""
+    return series.astype(str).str.strip().str.replace(" ", "_")
+
+
+def write_table(df, path):
+    """
+    Write a table in the format used in the inputs directory: missing values
+    as '.' and whole numbers without a decimal point. If path already
+    exists, its line endings (CRLF or LF) and whether it ends with a line
+    break are kept, so a rebuilt file only differs where its data changed.
+    """
+    df = df.copy()
+    for col in df.columns:
+        if df[col].dtype.kind == "f":
+            df[col] = df[col].map(
+                lambda v: "." if pd.isna(v) else f"{v:.0f}" if v % 1 == 0 else repr(v)
+            )
+    line_end, final_line_end = "\n", True
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            existing = f.read()
+        if existing.split(b"\n", 1)[0].endswith(b"\r"):
+            line_end = "\r\n"
+        final_line_end = existing.endswith(b"\n")
+    text = df.to_csv(index=False, na_rep=".", lineterminator=line_end)
+    if not final_line_end:
+        text = text[: -len(line_end)]
+    with open(path, "w", newline="") as f:
+        f.write(text)
+
+
+def construction_cost_factor(tech_info, interest_rate):
+    """
+    Multiplier from overnight cost to cost including interest during
+    construction, based on the construction schedule in generator_info.csv:
+    sum over construction years i of year_i_cost_fraction * (1+r)^(n-i).
+    """
+    n = tech_info["construction_time_years"].astype(int)
+    factor = pd.Series(0.0, index=tech_info.index)
+    for i in range(1, 7):
+        years_to_completion = (n - i).clip(lower=0)
+        factor += tech_info[f"year_{i}_cost_fraction"] * (
+            (1 + interest_rate) ** years_to_completion
+        )
+    return factor
+
+
+def technology_info(read, options):
+    tech = read("database", "generator_info.csv")
+    tech = tech[tech["gen_info_scenario_id"] == options.gen_info_scenario_id]
+    return tech.set_index("technology")
+
+
+def build_gen_info(read, options):
+    tech = technology_info(read, options)
+    non_fuel = set(read("inputs", "non_fuel_energy_sources.csv")["fuel"])
+    zones = set(read("inputs", "load_zones.csv")["LOAD_ZONE"])
+
+    existing = read("database", "existing_plants.csv")
+    existing = existing[
+        existing["gen_info_scenario_id"] == options.gen_info_scenario_id
+    ]
+    existing = pd.DataFrame(
+        {
+            "zone": zone_name(existing["province"]),
+            "tech": existing["technology"],
+            "id": "ep-" + existing["project_id"].astype(str),
+            "dbid": "existing." + existing["project_id"].astype(str),
+            "heat_rate": existing["heat_rate"],
+            "variable_om": existing["variable_o_m"],
+            "connect_cost": existing["connect_cost_per_mw"],
+            "capacity_limit": existing["capacity_mw"],
+        }
+    )
+
+    new = read("database", "new_projects.csv")
+    new = new[new["gen_info_scenario_id"] == options.gen_info_scenario_id]
+    # records without a Chinese province name are incomplete and are left out
+    # of the shipped inputs (project 13128, Guangdong Nuclear_SEA)
+    new = new[new["province_cn"].notna()]
+    # only technologies that can be built and burn fuels known to the model
+    buildable = tech.index[
+        tf(tech["can_build_new"]).eq("TRUE") & tf(tech["ccs"]).eq("FALSE")
+    ]
+    new = new[new["technology"].isin(buildable)]
+    costs = read("database", "generator_cap_cost_yearly.csv")
+    costs = costs[costs["gen_cost_scenario_id"] == options.gen_cost_scenario_id]
+    first_period = read("inputs", "periods.csv")["INVESTMENT_PERIOD"].min()
+    variable_om = (
+        costs[costs["year"] == first_period]
+        .set_index("technology")["variable_o_m"]
+        .reindex(new["technology"])
+        .values
+    )
+    new = pd.DataFrame(
+        {
+            "zone": zone_name(new["province"]),
+            "tech": new["technology"],
+            "id": new["project_id"].astype(str),
+            "dbid": "new." + new["project_id"].astype(str),
+            "heat_rate": new["heat_rate"],
+            "variable_om": variable_om,
+            "connect_cost": new["connect_cost_per_mw"],
+            # 0 means no limit in the database
+            "capacity_limit": new["capacity_limit"].where(new["capacity_limit"] > 0),
+        }
+    )
+
+    gens = pd.concat([existing, new], ignore_index=True)
+    gens = gens[gens["zone"].isin(zones) & gens["tech"].isin(tech.index)]
+    t = tech.loc[gens["tech"]].reset_index(drop=True)
+    gens = gens.reset_index(drop=True)
+
+    is_variable = tf(t["intermittent"])
+    is_flexible_baseload = tf(t["flexible_baseload"])
+    is_baseload = tf(t["baseload"])
+    can_spin = ~(is_flexible_baseload.eq("TRUE") | is_baseload.eq("TRUE"))
+    is_storage = tf(t["storage"]).eq("TRUE")
+    is_fuel_based = ~t["fuel"].isin(non_fuel)
+    gen_info = pd.DataFrame(
+        {
+            "GENERATION_PROJECT": gens["zone"] + "-" + gens["tech"] + "-" + gens["id"],
+            "gen_dbid": gens["dbid"],
+            "gen_tech": gens["tech"],
+            "gen_energy_source": t["fuel"],
+            "gen_load_zone": gens["zone"],
+            "gen_max_age": t["max_age_years"].astype(int),
+            "gen_is_variable": is_variable,
+            "gen_is_flexible_baseload": is_flexible_baseload,
+            "gen_is_baseload": is_baseload,
+            "gen_can_provide_spinning_reserves": tf(can_spin),
+            "gen_can_provide_quickstart_reserves": tf(
+                can_spin & is_variable.eq("FALSE")
+            ),
+            "gen_full_load_heat_rate": gens["heat_rate"].where(is_fuel_based),
+            "gen_variable_om": gens["variable_om"].fillna(0),
+            "gen_connect_cost_per_mw": gens["connect_cost"],
+            "gen_scheduled_outage_rate": t["scheduled_outage_rate"],
+            "gen_forced_outage_rate": t["forced_outage_rate"],
+            "gen_capacity_limit_mw": gens["capacity_limit"],
+            "gen_min_build_capacity": 0,
+            "gen_is_cogen": tf(t["cogen"]),
+            "gen_storage_efficiency": t["storage_efficiency"].where(is_storage),
+            "gen_min_load_fraction": t["minimum_loading"],
+            "gen_is_pumped_hydro": tf(gens["tech"].eq("Hydro_Pumped")),
+            "gen_storage_energy_to_power_ratio": gens["tech"].map(
+                STORAGE_ENERGY_TO_POWER_RATIO
+            ),
+        }
+    )
+    return gen_info.sort_values("GENERATION_PROJECT")
+
+
+def existing_builds(read, options):
+    """Existing plants with their project names, build years and sizes."""
+    existing = read("database", "existing_plants.csv")
+    existing = existing[
+        existing["gen_info_scenario_id"] == options.gen_info_scenario_id
+    ]
+    return pd.DataFrame(
+        {
+            "GENERATION_PROJECT": zone_name(existing["province"])
+            + "-"
+            + existing["technology"]
+            + "-ep-"
+            + existing["project_id"].astype(str),
+            "project_id": existing["project_id"],
+            "technology": existing["technology"],
+            "build_year": existing["start_year"],
+            "capacity_mw": existing["capacity_mw"],
+            "overnight_cost": existing["overnight_cost"],
+            "fixed_om": existing["fixed_o_m"],
+        }
+    )
+
+
+def build_gen_build_predetermined(read, options):
+    tech = technology_info(read, options)
+    non_fuel = set(read("inputs", "non_fuel_energy_sources.csv")["fuel"])
+    gens = set(read("inputs", "gen_info.csv")["GENERATION_PROJECT"])
+    ex = existing_builds(read, options)
+    ex = ex[ex["GENERATION_PROJECT"].isin(gens)].sort_values("project_id")
+    # fuel-burning plants may retire early; hydro, wind and solar may not
+    can_retire = ~tech.loc[ex["technology"], "fuel"].isin(non_fuel).values
+    return pd.DataFrame(
+        {
+            "GENERATION_PROJECT": ex["GENERATION_PROJECT"],
+            "build_year": ex["build_year"],
+            "build_gen_predetermined": ex["capacity_mw"],
+            "gen_can_retire_early": can_retire.astype(int),
+        }
+    )
+
+
+def build_gen_build_costs(read, options):
+    tech = technology_info(read, options)
+    interest_rate = read("inputs", "financials.csv")["interest_rate"].iloc[0]
+    cost_factor = construction_cost_factor(tech, interest_rate)
+    gen_info = read("inputs", "gen_info.csv")
+    gens = set(gen_info["GENERATION_PROJECT"])
+
+    ex = existing_builds(read, options)
+    ex = ex[ex["GENERATION_PROJECT"].isin(gens)]
+    existing = pd.DataFrame(
+        {
+            "GENERATION_PROJECT": ex["GENERATION_PROJECT"],
+            "build_year": ex["build_year"],
+            "gen_overnight_cost": (
+                ex["overnight_cost"] * cost_factor.loc[ex["technology"]].values
+            ).round(),
+            "gen_fixed_om": ex["fixed_om"],
+            "tech": ex["technology"],
+        }
+    )
+
+    # new projects can be built in every investment period at the average of
+    # the yearly costs during the period
+    periods = read("inputs", "periods.csv")
+    costs = read("database", "generator_cap_cost_yearly.csv")
+    costs = costs[costs["gen_cost_scenario_id"] == options.gen_cost_scenario_id]
+    period_costs = []
+    for p in periods.itertuples():
+        in_period = costs[costs["year"].between(p.period_start, p.period_end)]
+        period_costs.append(
+            in_period.groupby("technology")[["overnight_cost", "fixed_o_m"]]
+            .mean()
+            .assign(build_year=p.INVESTMENT_PERIOD)
+        )
+    period_costs = pd.concat(period_costs).reset_index()
+    new_gens = gen_info.loc[
+        gen_info["gen_dbid"].str.startswith("new."), ["GENERATION_PROJECT", "gen_tech"]
+    ]
+    new = new_gens.merge(period_costs, left_on="gen_tech", right_on="technology")
+    new = pd.DataFrame(
+        {
+            "GENERATION_PROJECT": new["GENERATION_PROJECT"],
+            "build_year": new["build_year"],
+            "gen_overnight_cost": (
+                new["overnight_cost"] * cost_factor.loc[new["gen_tech"]].values
+            ).round(),
+            "gen_fixed_om": new["fixed_o_m"].round(),
+            "tech": new["gen_tech"],
+        }
+    )
+
+    build_costs = pd.concat([existing, new], ignore_index=True)
+    is_storage = tf(tech.loc[build_costs["tech"], "storage"]).eq("TRUE").values
+    # storage energy capacity is priced into the power capacity cost
+    build_costs["gen_storage_energy_overnight_cost"] = np.where(is_storage, 0, np.nan)
+    build_costs = build_costs.drop(columns="tech")
+    return build_costs.sort_values(["GENERATION_PROJECT", "build_year"])
+
+
+def build_gen_part_load_heat_rates(read, options):
+    gen_info = read("inputs", "gen_info.csv")
+    curves = read("database", "heat_rate_curves.csv")
+    curves = curves[
+        (curves["hr_curve_scenario_id"] == options.hr_curve_scenario_id)
+        & (curves["gen_info_scenario_id"] == options.gen_info_scenario_id)
+    ]
+    gens = gen_info.loc[
+        gen_info["gen_full_load_heat_rate"].notna(),
+        ["GENERATION_PROJECT", "gen_tech", "gen_full_load_heat_rate"],
+    ]
+    hr = gens.merge(curves, left_on="gen_tech", right_on="technology")
+    hr = hr.sort_values(["GENERATION_PROJECT", "gen_loading_level"])
+    return pd.DataFrame(
+        {
+            "GENERATION_PROJECT": hr["GENERATION_PROJECT"],
+            # written as fractions (1.0 for full load), as in the shipped inputs
+            "gen_loading_level": hr["gen_loading_level"].astype(float).map(repr),
+            "gen_heat_rate_at_loading_level": (
+                hr["gen_full_load_heat_rate"]
+                * hr["gen_heat_rate_factor_at_loading_level"]
+            ).round(6),
+        }
+    )
+
+
+def build_transmission_lines(read, options):
+    lines = read("database", "transmission_lines.csv")
+    zones = set(read("inputs", "load_zones.csv")["LOAD_ZONE"])
+    lines["lz1"] = zone_name(lines["province_start"])
+    lines["lz2"] = zone_name(lines["province_end"])
+    lines = lines[lines["lz1"].isin(zones) & lines["lz2"].isin(zones)]
+    # the database lists each corridor in both directions; keep the first
+    pair = lines[["lz1", "lz2"]].apply(lambda r: tuple(sorted(r)), axis=1)
+    lines = lines[~pair.duplicated()]
+    return pd.DataFrame(
+        {
+            "TRANSMISSION_LINE": lines["lz1"] + "-" + lines["lz2"],
+            "trans_dbid": lines["transmission_line_id"],
+            "trans_lz1": lines["lz1"],
+            "trans_lz2": lines["lz2"],
+            "trans_length_km": lines["transmission_length_km"].round(2),
+            "trans_efficiency": lines["transmission_efficiency"].round(6),
+            "existing_trans_cap": lines["existing_transfer_capacity_mw"],
+            "trans_new_build_allowed": tf(lines["new_transmission_builds_allowed"]),
+        }
+    )
+
+
+def demand_scenario_names(read):
+    """Return the demand scenarios in china_electricity_demand_projection.csv."""
+    projection = read("database", "china_electricity_demand_projection.csv")
+    return [c[: -len("_2020")] for c in projection.columns if c.endswith("_2020")]
+
+
+def selected_demand_scenarios(read, options):
+    """Return the scenarios named by --demand-scenarios ('all' for every one)."""
+    if "all" in options.demand_scenarios:
+        return demand_scenario_names(read)
+    return list(options.demand_scenarios)
+
+
+def demand_mw(read, scenarios, zones, stamps):
+    """
+    Return an array of demand (MW) with one layer per demand scenario, one
+    row per zone and one column per timestamp. Zone demand at each hour is
+    annual energy x monthly share / days in the month x hourly share. Annual
+    energy starts from each scenario's 2020 demand and grows at the
+    provincial growth rate for each decade; years after the last decade in
+    the growth table continue at its rate. The hourly shape is the same for
+    every scenario, so it is computed once and broadcast over the scenarios.
+    """
+    projection = read("database", "china_electricity_demand_projection.csv")
+    projection = projection.set_index(zone_name(projection["province"]))
+    growth = read("database", "china_electricity_growth_rate.csv")
+    growth = growth.set_index(zone_name(growth["province"]))
+    monthly = read("database", "load_profile/load_profile_monthly_province.csv")
+    monthly = monthly.set_index(zone_name(monthly.iloc[:, 0])).iloc[:, 1:]
+    hourly = read("database", "load_profile/load_profile_daily_province.csv")
+    hourly = hourly.set_index(zone_name(hourly.iloc[:, 0])).iloc[:, 1:]
+    stamps = pd.DatetimeIndex(stamps)
+
+    base_year = 2020
+    years = np.unique(stamps.year)
+    # growth factor from the base year to each year: zone x year
+    decades = np.arange(base_year, max(years.max(), base_year + 1), 10)
+    columns = [f"growth_rate_{d}_{d + 10}" for d in decades]
+    rates = np.column_stack(
+        [
+            growth.loc[zones, c if c in growth.columns else growth.columns[-1]]
+            for c in columns
+        ]
+    )
+    decade_years = np.clip(years[None, :] - decades[:, None], 0, 10)
+    factor = np.exp(np.log1p(rates / 100) @ decade_years)
+    # annual energy (MWh): scenario x zone x year
+    base_twh = projection.loc[zones, [f"{s}_{base_year}" for s in scenarios]].values
+    energy_mwh = base_twh.T[:, :, None] * factor[None, :, :] * 1e6
+    # share of annual energy in each hour: zone x timestamp
+    shape = (
+        monthly.loc[zones].values[:, stamps.month - 1]
+        / stamps.days_in_month.values
+        * hourly.loc[zones].values[:, stamps.hour]
+    )
+    return energy_mwh[:, :, np.searchsorted(years, stamps.year)] * shape[None, :, :]
+
+
+def zone_demand_mw(read, options, zones, stamps):
+    """
+    Return an array of demand (MW) for the selected --demand-scenario, with
+    one row per zone and one column per timestamp (see demand_mw).
+    """
+    return demand_mw(read, [options.demand_scenario], zones, stamps)[0]
+
+
+def loads_table(zones, timepoints, demand):
+    """
+    Return loads.csv for demand with one row per zone and timepoint. Zones
+    and timepoints are stored as categories, so hourly tables don't hold a
+    string for every row.
+    """
+    return pd.DataFrame(
+        {
+            "load_zone": pd.Categorical.from_codes(
+                np.repeat(np.arange(len(zones)), len(timepoints)), zones
+            ),
+            "TIMEPOINT": pd.Categorical.from_codes(
+                np.tile(np.arange(len(timepoints)), len(zones)), timepoints
+            ),
+            "zone_demand_mw": demand.ravel(),
+        }
+    )
+
+
+def peak_demand_mw(read, scenarios, zones, periods):
+    """
+    Return the expected coincident peak demand (MW) for each scenario, zone
+    and period: the highest hourly demand of the zone in the middle year of
+    the period, the year that representative days are drawn from.
+    """
+    years = (periods["period_start"] + periods["period_end"]) // 2
+    hours = [pd.date_range(f"{y}-01-01", f"{y}-12-31 23:00", freq="h") for y in years]
+    demand = demand_mw(read, scenarios, zones, hours[0].append(hours[1:]))
+    starts = np.cumsum([0] + [len(h) for h in hours[:-1]])
+    return np.maximum.reduceat(demand, starts, axis=2)
+
+
+def peak_demand_table(zones, periods, peaks):
+    """Return zone_coincident_peak_demand.csv for peaks (zone x period)."""
+    return pd.DataFrame(
+        {
+            "LOAD_ZONE": np.repeat(zones, len(periods)),
+            "PERIOD": np.tile(periods, len(zones)),
+            "zone_expected_coincident_peak_demand": peaks.ravel(),
+        }
+    )
+
+
+def build_loads(read, options):
+    zones = list(read("inputs", "load_zones.csv")["LOAD_ZONE"])
+    timepoints = read("inputs", "timepoints.csv")
+    stamps = pd.to_datetime(timepoints["timestamp"], format="%Y-%m-%d_%H:%M")
+    demand = zone_demand_mw(read, options, zones, stamps)
+    return loads_table(zones, timepoints["timepoint_id"].values, demand)
+
+
+def build_peak_demand(read, options):
+    zones = list(read("inputs", "load_zones.csv")["LOAD_ZONE"])
+    periods = read("inputs", "periods.csv")
+    peaks = peak_demand_mw(read, [options.demand_scenario], zones, periods)
+    return peak_demand_table(zones, periods["INVESTMENT_PERIOD"].values, peaks[0])
+
+
+def demand_scenario_files(read, options):
+    return [
+        f"{table}.{scenario}.csv"
+        for scenario in selected_demand_scenarios(read, options)
+        for table in ["loads", "zone_coincident_peak_demand"]
+    ]
+
+
+def build_demand_scenarios(read, options):
+    """
+    Yield loads.<scenario>.csv and zone_coincident_peak_demand.<scenario>.csv
+    for every scenario selected by --demand-scenarios, computed together.
+    """
+    scenarios = selected_demand_scenarios(read, options)
+    zones = list(read("inputs", "load_zones.csv")["LOAD_ZONE"])
+    timepoints = read("inputs", "timepoints.csv")
+    stamps = pd.to_datetime(timepoints["timestamp"], format="%Y-%m-%d_%H:%M")
+    periods = read("inputs", "periods.csv")
+    demand = demand_mw(read, scenarios, zones, stamps)
+    peaks = peak_demand_mw(read, scenarios, zones, periods)
+    for i, scenario in enumerate(scenarios):
+        yield f"loads.{scenario}.csv", loads_table(
+            zones, timepoints["timepoint_id"].values, demand[i]
+        )
+        yield f"zone_coincident_peak_demand.{scenario}.csv", peak_demand_table(
+            zones, periods["INVESTMENT_PERIOD"].values, peaks[i]
+        )
+
+
+# Dependency graph: output file -> sources, options and builder. Sources in
+# "inputs" that are also outputs (e.g., gen_info.csv) are built first. Targets
+# with several output files name them with an outputs function, and their
+# builder yields (file, table) pairs.
+TARGETS = {
+    "gen_info.csv": dict(
+        database=[
+            "existing_plants.csv",
+            "new_projects.csv",
+            "generator_info.csv",
+            "generator_cap_cost_yearly.csv",
+        ],
+        inputs=["non_fuel_energy_sources.csv", "load_zones.csv", "periods.csv"],
+        options=["gen_info_scenario_id", "gen_cost_scenario_id"],
+        build=build_gen_info,
+    ),
+    "gen_build_predetermined.csv": dict(
+        database=["existing_plants.csv", "generator_info.csv"],
+        inputs=["non_fuel_energy_sources.csv", "gen_info.csv"],
+        options=["gen_info_scenario_id"],
+        build=build_gen_build_predetermined,
+    ),
+    "gen_build_costs.csv": dict(
+        database=[
+            "existing_plants.csv",
+            "generator_info.csv",
+            "generator_cap_cost_yearly.csv",
+        ],
+        inputs=["gen_info.csv", "periods.csv", "financials.csv"],
+        options=["gen_info_scenario_id", "gen_cost_scenario_id"],
+        build=build_gen_build_costs,
+    ),
+    "gen_part_load_heat_rates.csv": dict(
+        database=["heat_rate_curves.csv"],
+        inputs=["gen_info.csv"],
+        options=["gen_info_scenario_id", "hr_curve_scenario_id"],
+        build=build_gen_part_load_heat_rates,
+    ),
+    "transmission_lines.csv": dict(
+        database=["transmission_lines.csv"],
+        inputs=["load_zones.csv"],
+        options=[],
+        build=build_transmission_lines,
+    ),
+    "loads.csv": dict(
+        database=[
+            "china_electricity_demand_projection.csv",
+            "china_electricity_growth_rate.csv",
+            "load_profile/load_profile_monthly_province.csv",
+            "load_profile/load_profile_daily_province.csv",
+        ],
+        inputs=["load_zones.csv", "timepoints.csv"],
+        options=["demand_scenario"],
+        build=build_loads,
+    ),
+    "zone_coincident_peak_demand.csv": dict(
+        database=[
+            "china_electricity_demand_projection.csv",
+            "china_electricity_growth_rate.csv",
+            "load_profile/load_profile_monthly_province.csv",
+            "load_profile/load_profile_daily_province.csv",
+        ],
+        inputs=["load_zones.csv", "periods.csv"],
+        options=["demand_scenario"],
+        build=build_peak_demand,
+    ),
+    # one pair of files per scenario in --demand-scenarios, for use with
+    # Switch's --input-aliases (e.g., loads.csv=loads.Scenario_1.csv)
+    "demand_scenarios": dict(
+        database=[
+            "china_electricity_demand_projection.csv",
+            "china_electricity_growth_rate.csv",
+            "load_profile/load_profile_monthly_province.csv",
+            "load_profile/load_profile_daily_province.csv",
+        ],
+        inputs=["load_zones.csv", "timepoints.csv", "periods.csv"],
+        options=["demand_scenarios"],
+        build=build_demand_scenarios,
+        outputs=demand_scenario_files,
+    ),
+}
+
+
+def build_order(targets):
+    """Return target names so that every target follows the targets it reads."""
+    order = []
+    visiting = set()
+
+    def visit(name):
+        if name in order:
+            return
+        if name in visiting:
+            raise ValueError(f"Circular dependency involving {name}.")
+        visiting.add(name)
+        for source in targets[name]["inputs"]:
+            if source in targets:
+                visit(source)
+        visiting.discard(name)
+        order.append(name)
+
+    for name in targets:
+        visit(name)
+    return order
+
+
+def downstream(targets, names):
+    """Return the given targets plus all targets that depend on them."""
+    selected = set(names)
+    for name in build_order(targets):
+        if any(s in selected for s in targets[name]["inputs"]):
+            selected.add(name)
+    return selected
+
+
+def code_dependencies(func):
+    """
+    Return func and the functions in this module that it calls, directly or
+    indirectly, so changes to shared helpers also invalidate outputs.
+    """
+    found = [func]
+    for f in found:
+        for name in f.__code__.co_names:
+            obj = globals().get(name)
+            if inspect.isfunction(obj) and obj.__module__ == __name__:
+                if obj not in found:
+                    found.append(obj)
+    return found
+
+
+def target_key(name, spec, dirs, options):
+    """Hash everything an output depends on: sources, options and code."""
+    h = hashlib.sha256()
+    h.update(name.encode())
+    for kind in ["database", "inputs"]:
+        for source in spec[kind]:
+            h.update(
+                f"{kind}/{source}:{file_hash(os.path.join(dirs[kind], source))}".encode()
+            )
+    h.update(json.dumps({o: getattr(options, o) for o in spec["options"]}).encode())
+    for func in code_dependencies(spec["build"]):
+        h.update(inspect.getsource(func).encode())
+    return h.hexdigest()
+
+
+def compile_inputs(options, targets=TARGETS):
+    """
+    Rebuild the outputs whose sources, options or code changed since the last
+    run. Returns the list of outputs that were (or, with dry_run, would be)
+    rebuilt.
+    """
+    dirs = {"database": options.database_dir, "inputs": options.inputs_dir}
+    manifest_path = os.path.join(options.inputs_dir, MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    else:
+        manifest = {}
+
+    def read(kind, filename):
+        return pd.read_csv(
+            os.path.join(dirs[kind], filename), na_values=".", encoding="utf-8-sig"
+        )
+
+    selected = set(targets)
+    if options.targets:
+        unknown = set(options.targets) - set(targets)
+        if unknown:
+            raise ValueError(f"Unknown targets: {', '.join(sorted(unknown))}")
+        selected = downstream(targets, options.targets)
+
+    rebuilt, skipped = [], []
+    for name in build_order(targets):
+        if name not in selected:
+            continue
+        spec = targets[name]
+        outputs = spec["outputs"](read, options) if "outputs" in spec else [name]
+        if not outputs:
+            continue
+        out_paths = [os.path.join(options.inputs_dir, o) for o in outputs]
+        key = target_key(name, spec, dirs, options)
+        record = manifest.get(name)
+        if any(os.path.exists(p) for p in out_paths) and not options.force:
+            if record is None:
+                print(
+                    f"Skipping {name}: it was not created by this compiler "
+                    "(use --force to replace it)."
+                )
+                skipped.append(name)
+                continue
+            if (
+                all(os.path.exists(p) for p in out_paths)
+                and record["key"] == key
+                and record["output"] == output_hash(out_paths)
+            ):
+                continue
+        print(f"{'Would rebuild' if options.dry_run else 'Rebuilding'} {name}")
+        rebuilt.append(name)
+        if options.dry_run:
+            continue
+        tables = spec["build"](read, options)
+        if isinstance(tables, pd.DataFrame):
+            tables = [(name, tables)]
+        for output, df in tables:
+            write_table(df, os.path.join(options.inputs_dir, output))
+        manifest[name] = {"key": key, "output": output_hash(out_paths)}
+        with open(manifest_path, "w") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+    if not rebuilt and not skipped:
+        print("All compiled inputs are up to date.")
+    return rebuilt
+
+
+def define_arguments(argparser):
+    argparser.add_argument(
+        "--database-dir",
+        default="database",
+        help="Directory with the SWITCH-China database tables (default: database).",
+    )
+    argparser.add_argument(
+        "--inputs-dir",
+        default="inputs",
+        help="Directory to write Switch inputs to (default: inputs).",
+    )
+    argparser.add_argument(
+        "--gen-info-scenario-id",
+        type=int,
+        default=2,
+        help="gen_info_scenario_id to select from the generator tables.",
+    )
+    argparser.add_argument(
+        "--gen-cost-scenario-id",
+        type=int,
+        default=28,
+        help="gen_cost_scenario_id to select from generator_cap_cost_yearly.csv.",
+    )
+    argparser.add_argument(
+        "--hr-curve-scenario-id",
+        type=int,
+        default=1,
+        help="hr_curve_scenario_id to select from heat_rate_curves.csv.",
+    )
+    argparser.add_argument(
+        "--demand-scenario",
+        default="Scenario_3",
+        help="Demand scenario column prefix in "
+        "china_electricity_demand_projection.csv (default: Scenario_3).",
+    )
+    argparser.add_argument(
+        "--demand-scenarios",
+        nargs="+",
+        default=[],
+        help="Also write loads.<scenario>.csv and "
+        "zone_coincident_peak_demand.<scenario>.csv for these demand "
+        "scenarios ('all' for every scenario in "
+        "china_electricity_demand_projection.csv), to select with Switch's "
+        "--input-aliases.",
+    )
+    argparser.add_argument(
+        "--force",
+        action="store_true",
+        help="Rebuild the selected outputs even if they are up to date, "
+        "replacing files that were not created by the compiler.",
+    )
+    argparser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Report which outputs would be rebuilt without writing them.",
+    )
+    argparser.add_argument(
+        "targets",
+        nargs="*",
+        help="Outputs to build (and everything that depends on them); "
+        "default is all outputs.",
+    )
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Compile Switch inputs from the SWITCH-China database."
+    )
+    define_arguments(parser)
+    options = parser.parse_args(args)
+    compile_inputs(options)
+
+
+if __name__ == "__main__":
+    main()
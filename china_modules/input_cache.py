@@ -0,0 +1,470 @@
+"""
+Cache parsed input tables in a binary columnar format.
+
+Switch reads every input table through `switch_data.load_aug`, which hands
+the .csv file to Pyomo's DataPortal to be tokenized, converted and turned
+into set and parameter data. When this module is listed first in
+modules.txt, it intercepts those reads: the first time a table is read, the
+data Pyomo produced for each component are saved in a cache directory, one
+.npy file per column, with text columns stored as integer codes plus a list
+of categories. Later runs that read an identical file (by sha256 hash of its
+contents) with the same columns load the columns with memory-mapped reads
+and skip the DataPortal parsing.
+
+The cache is keyed by file contents rather than path, so a batch of
+scenarios whose input directories share most of their files can share one
+cache. By default the cache is kept in an 'input_cache' directory inside
+the inputs directory; use --input-cache-dir to choose another location (e.g.,
+one shared by all scenarios) or --no-input-cache to turn it off.
+
+Cache entries are written to a temporary directory and then renamed into
+place, so runs in parallel can share a cache. The hashes of the input files
+are remembered in file_hashes.json, which is updated once, at the end of each
+run: the run's new hashes are merged with the hashes saved by other runs in
+the meantime, and hashes of files that no longer exist or have changed are
+dropped. Cache entries for files that no longer exist are never read again
+and can be removed by deleting the directory.
+
+Tables whose data cannot be stored by column (e.g., a column that mixes text
+and numbers) are read normally and are not cached.
+
+The timepoint series in SERIES (zone_demand_mw from loads.csv and
+gen_max_capacity_factor from variable_capacity_factors.csv) hold tens of
+millions of values with full hourly years. On a cache miss these tables are
+read in chunks with pandas instead of the DataPortal, their values are
+checked against the domain of the Param in one pass, and the data are built
+the way the DataPortal builds them, so they are cached like any other table.
+They are recognized by the Param they fill, so tables chosen with
+--input-aliases (e.g., loads.csv=loads.high.csv) are read the same way. The
+model still holds every value in its Params, so this shortens reading but
+does not bound the memory used by the model.
+"""
+
+import atexit
+import hashlib
+import json
+import os
+import re
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pyomo
+from pyomo.core.base.param import Param
+from pyomo.core.base.set import Set
+
+# increase when the layout of cache entries changes
+CACHE_FORMAT = 1
+HASH_INDEX_FILE = "file_hashes.json"
+# rows read at a time from the tables in SERIES
+CHUNK_ROWS = 1000000
+# numbers in .csv labels, as recognized by Pyomo
+NUMBER = re.compile(r"^[-+]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][-+]?[0-9]+)?$")
+
+# Params of timepoint series that are read with pandas, and the check applied
+# to their values
+SERIES = {
+    "zone_demand_mw": dict(check=lambda v: v >= 0, domain="non-negative"),
+    "gen_max_capacity_factor": dict(
+        check=lambda v: (v > -1) & (v < 2), domain="between -1 and 2"
+    ),
+}
+
+
+def define_arguments(argparser):
+    argparser.add_argument(
+        "--input-cache-dir",
+        default=None,
+        help="Directory for cached input tables (default: 'input_cache' "
+        "inside the inputs directory).",
+    )
+    argparser.add_argument(
+        "--no-input-cache",
+        action="store_true",
+        default=False,
+        help="Read all input files normally, without using the input cache.",
+    )
+
+
+def load_inputs(mod, switch_data, inputs_dir):
+    """
+    Replace switch_data.load with a version that uses the input cache.
+    load_aug calls switch_data.load after resolving file aliases and
+    selecting columns, so all .csv tables read by later modules (including
+    the China modules) go through the cache.
+    """
+    if mod.options.no_input_cache:
+        return
+    cache_dir = mod.options.input_cache_dir
+    if cache_dir is None:
+        cache_dir = os.path.join(inputs_dir, "input_cache")
+    os.makedirs(cache_dir, exist_ok=True)
+    cache = InputCache(cache_dir)
+    atexit.register(cache.save_file_hashes)
+
+    original_load = switch_data.load
+
+    def load(**kwargs):
+        return cache.load(switch_data, original_load, kwargs)
+
+    switch_data.load = load
+    switch_data.input_cache = cache
+
+
+class InputCache(object):
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self._file_hashes = None
+        self._new_hashes = {}
+
+    def load(self, switch_data, original_load, kwargs):
+        """Load one table into switch_data, using the cache if possible."""
+        key, names = self.entry_key(switch_data, kwargs)
+        if key is None:
+            return original_load(**kwargs)
+        entry_dir = os.path.join(self.cache_dir, key[:2], key)
+        data = switch_data._data.setdefault(None, {})
+        if any(name in data for name in names):
+            # component already has data; Pyomo will merge into it, so the
+            # result doesn't describe this file alone
+            return original_load(**kwargs)
+        if os.path.isdir(entry_dir):
+            data.update(read_entry(entry_dir))
+            self.hits += 1
+            return
+        series = read_series(kwargs)
+        if series is None:
+            original_load(**kwargs)
+        else:
+            data.update(series)
+        self.misses += 1
+        write_entry(entry_dir, {name: data[name] for name in names if name in data})
+
+    def entry_key(self, switch_data, kwargs):
+        """
+        Return the cache key for a load() call and the names of the
+        components it fills, or (None, None) if the call can't be cached.
+        """
+        path = kwargs.get("filename")
+        if not path or not path.endswith(".csv"):
+            return None, None
+        if set(kwargs) - {"filename", "select", "param", "index", "set"}:
+            return None, None
+        params = kwargs.get("param", ())
+        if not isinstance(params, (list, tuple)):
+            params = [params]
+        names = [p.name if isinstance(p, Param) else p for p in params]
+        for k in ["index", "set"]:
+            s = kwargs.get(k)
+            if s is not None:
+                names.append(s.name if isinstance(s, Set) else s)
+        description = {
+            "format": CACHE_FORMAT,
+            "pyomo": pyomo.version.version,
+            "file": self.file_hash(path),
+            "select": list(kwargs.get("select", [])),
+            "names": names,
+            "index": "index" in kwargs,
+            "set": "set" in kwargs,
+        }
+        key = hashlib.sha256(
+            json.dumps(description, sort_keys=True).encode()
+        ).hexdigest()
+        return key, names
+
+    def file_hash(self, path):
+        """
+        Return the sha256 hash of a file's contents. Hashes are remembered
+        with the file's size and modification time, so unchanged files are
+        not read again.
+        """
+        if self._file_hashes is None:
+            try:
+                with open(os.path.join(self.cache_dir, HASH_INDEX_FILE)) as f:
+                    self._file_hashes = json.load(f)
+            except (OSError, ValueError):
+                self._file_hashes = {}
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        record = self._file_hashes.get(path)
+        if record and record[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return record[2]
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        record = [stat.st_size, stat.st_mtime_ns, h.hexdigest()]
+        self._file_hashes[path] = self._new_hashes[path] = record
+        return h.hexdigest()
+
+    def save_file_hashes(self):
+        """
+        Add the hashes computed in this run to the index file, keeping the
+        hashes other runs have saved since it was read and dropping those of
+        files that no longer exist or have changed.
+        """
+        if not self._new_hashes:
+            return
+        path = os.path.join(self.cache_dir, HASH_INDEX_FILE)
+        try:
+            with open(path) as f:
+                hashes = json.load(f)
+        except (OSError, ValueError):
+            hashes = {}
+        hashes.update(self._new_hashes)
+        current = {}
+        for file_path, record in hashes.items():
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue
+            if record[:2] == [stat.st_size, stat.st_mtime_ns]:
+                current[file_path] = record
+        replace_file(path, json.dumps(current).encode())
+        self._new_hashes = {}
+
+
+def replace_file(path, contents):
+    """Write contents to path via a temporary file, so readers never see a
+    partially written file."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, "wb") as f:
+        f.write(contents)
+    os.replace(tmp_path, path)
+
+
+def read_series(kwargs):
+    """
+    Return the DataPortal data for a load() call that reads one of the
+    series in SERIES, or None for any other call. The table is read in
+    chunks and its labels are converted the way the DataPortal converts
+    them; rows with a missing value ('.') are left out of the Param but not
+    of the index set.
+    """
+    params = kwargs.get("param", ())
+    if not isinstance(params, (list, tuple)):
+        params = [params]
+    select = list(kwargs.get("select", []))
+    if (
+        len(params) != 1
+        or not isinstance(params[0], Param)
+        or params[0].name not in SERIES
+        or not select
+        or select[-1] != params[0].name
+    ):
+        return None
+    name, path = params[0].name, kwargs["filename"]
+    index_columns = select[:-1]
+    labels = [{} for _ in index_columns]
+    codes = [[] for _ in index_columns]
+    values = []
+    for chunk in pd.read_csv(
+        path,
+        usecols=select,
+        dtype=str,
+        keep_default_na=False,
+        encoding="utf-8-sig",
+        chunksize=CHUNK_ROWS,
+    ):
+        for column, ids, column_codes in zip(index_columns, labels, codes):
+            for label in pd.unique(chunk[column]):
+                ids.setdefault(label, len(ids))
+            column_codes.append(chunk[column].map(ids).to_numpy(np.int64))
+        values.append(
+            pd.to_numeric(chunk[name].replace(".", np.nan), errors="raise").to_numpy(
+                float
+            )
+        )
+    values = np.concatenate(values)
+    key_columns = [
+        np.array([to_label(label) for label in ids], dtype=object)[
+            np.concatenate(column_codes)
+        ].tolist()
+        for ids, column_codes in zip(labels, codes)
+    ]
+    keys = list(zip(*key_columns)) if len(key_columns) > 1 else key_columns[0]
+
+    spec = SERIES[name]
+    present = ~np.isnan(values)
+    bad = present & ~spec["check"](np.where(present, values, 0.0))
+    if bad.any():
+        examples = ", ".join(
+            f"{keys[i]}: {values[i]:g}" for i in np.flatnonzero(bad)[:5].tolist()
+        )
+        raise ValueError(
+            f"{bad.sum()} value(s) of {name} in {path} are not "
+            f"{spec['domain']} ({examples})."
+        )
+
+    if present.all():
+        data = {name: dict(zip(keys, values.tolist()))}
+    else:
+        rows = np.flatnonzero(present).tolist()
+        data = {name: {keys[i]: v for i, v in zip(rows, values[rows].tolist())}}
+    index = kwargs.get("index")
+    if index is not None:
+        data[index.name if isinstance(index, Set) else index] = {None: keys}
+    return data
+
+
+def to_label(text):
+    """
+    Convert a label from a .csv file to a number or text the way Pyomo
+    converts .csv tokens: numbers with a decimal point are floats, other
+    whole numbers are ints.
+    """
+    if not NUMBER.match(text):
+        return text
+    number = float(text)
+    if "." not in text and number.is_integer():
+        return int(number)
+    return number
+
+
+def encode_column(values):
+    """
+    Convert a list of Python values to a dict of numpy arrays, or return None
+    if the values can't be stored in a single typed column. Text is stored as
+    integer codes into a list of categories; columns that mix integers and
+    floats keep a mask of the integer entries so they are restored exactly.
+    """
+    types = set(map(type, values))
+    if types <= {bool}:
+        return {"values": np.array(values, dtype=bool)}
+    if types <= {int}:
+        return {"values": np.array(values, dtype=np.int64)}
+    if types <= {int, float}:
+        return {
+            "values": np.array(values, dtype=np.float64),
+            "ints": np.array([type(v) is int for v in values]),
+        }
+    if types <= {str}:
+        categories, codes = np.unique(np.array(values, dtype=str), return_inverse=True)
+        return {"codes": codes.astype(np.int32), "categories": categories}
+    return None
+
+
+def decode_column(arrays):
+    """Convert arrays from encode_column back to a list of Python values."""
+    if "codes" in arrays:
+        categories = arrays["categories"].tolist()
+        return [categories[c] for c in arrays["codes"].tolist()]
+    values = arrays["values"].tolist()
+    if "ints" in arrays:
+        for i in np.flatnonzero(arrays["ints"]).tolist():
+            values[i] = int(values[i])
+    return values
+
+
+def write_entry(entry_dir, components):
+    """
+    Save the DataPortal data for the components read from one table. Sets
+    are stored as {None: [members]}, indexed params as {index: value} and
+    scalar params as {None: value}.
+
+    The keys of all the components are gathered into one table of rows,
+    stored once as key columns. Each component then stores the positions of
+    its members or keys in that table (omitted if it uses every row in
+    order) and, for params, a column of values.
+    """
+    meta = {"components": {}}
+    columns = {}
+    rows, row_pos, members = [], {}, {}
+    for name, value in components.items():
+        if not isinstance(value, dict):
+            return
+        if list(value) == [None]:
+            if not isinstance(value[None], (list, tuple)):
+                # scalar param, stored directly in the metadata
+                meta["components"][name] = {"kind": "scalar", "value": value[None]}
+                continue
+            members[name] = list(value[None])
+            meta["components"][name] = {"kind": "set"}
+        else:
+            members[name] = list(value)
+            meta["components"][name] = {"kind": "param"}
+            arrays = encode_column(list(value.values()))
+            if arrays is None:
+                return
+            for part, array in arrays.items():
+                columns[f"{name}.{part}"] = array
+        for k in members[name]:
+            if k not in row_pos:
+                row_pos[k] = len(rows)
+                rows.append(k)
+
+    tuple_keys = bool(rows) and isinstance(rows[0], tuple)
+    if tuple_keys:
+        width = len(rows[0])
+        if any(not isinstance(r, tuple) or len(r) != width for r in rows):
+            return
+        key_columns = list(zip(*rows))
+    else:
+        if any(isinstance(r, tuple) for r in rows):
+            return
+        key_columns = [rows] if rows else []
+    for i, col in enumerate(key_columns):
+        arrays = encode_column(list(col))
+        if arrays is None:
+            return
+        for part, array in arrays.items():
+            columns[f"key{i}.{part}"] = array
+    meta["key_width"] = len(key_columns)
+    meta["tuple_keys"] = tuple_keys
+    for name, keys in members.items():
+        positions = np.array([row_pos[k] for k in keys], dtype=np.int32)
+        if len(positions) != len(rows) or (positions != np.arange(len(rows))).any():
+            columns[f"{name}.positions"] = positions
+
+    parent = os.path.dirname(entry_dir)
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=parent)
+    for column, array in columns.items():
+        np.save(os.path.join(tmp_dir, column + ".npy"), array, allow_pickle=False)
+    with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+        json.dump(meta, f)
+    try:
+        os.rename(tmp_dir, entry_dir)
+    except OSError:
+        # another run saved the same entry first
+        for filename in os.listdir(tmp_dir):
+            os.remove(os.path.join(tmp_dir, filename))
+        os.rmdir(tmp_dir)
+
+
+def read_entry(entry_dir):
+    """Return the DataPortal data saved by write_entry."""
+    with open(os.path.join(entry_dir, "meta.json")) as f:
+        meta = json.load(f)
+
+    def arrays(prefix):
+        found = {}
+        for part in ["values", "ints", "codes", "categories", "positions"]:
+            path = os.path.join(entry_dir, f"{prefix}.{part}.npy")
+            if os.path.exists(path):
+                found[part] = np.load(path, mmap_mode="r", allow_pickle=False)
+        return found
+
+    key_columns = [decode_column(arrays(f"key{i}")) for i in range(meta["key_width"])]
+    if meta["tuple_keys"]:
+        rows = list(zip(*key_columns))
+    else:
+        rows = key_columns[0] if key_columns else []
+
+    components = {}
+    for name, info in meta["components"].items():
+        if info["kind"] == "scalar":
+            components[name] = {None: info["value"]}
+            continue
+        parts = arrays(name)
+        if "positions" in parts:
+            keys = [rows[i] for i in parts["positions"].tolist()]
+        else:
+            keys = list(rows)
+        if info["kind"] == "set":
+            components[name] = {None: keys}
+        else:
+            components[name] = dict(zip(keys, decode_column(parts)))
+    return components
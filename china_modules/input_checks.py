@@ -0,0 +1,986 @@
+"""
+Check the input tables in bulk before the model is constructed.
+
+Pyomo checks the input data one element at a time while it constructs the
+model, e.g., that each gen_load_zone is in LOAD_ZONES (`within`) or that
+each period in water_limit_annual.csv is in PERIODS (`validate`), and stops
+at the first bad value, often after minutes of construction. When this
+module is listed in modules.txt (right after china_modules.input_cache, so
+it runs before the other tables are read), it loads the input tables of the
+listed modules into pandas data frames and checks whole columns at once:
+
+  * required files and columns are present, including the extra columns
+    used by the China modules (e.g., gen_water_basin and
+    gen_cooling_water_m3_per_mwh in gen_info.csv for water_limits);
+  * key columns have no blank or duplicate values;
+  * values are in their domains (numbers, non-negative numbers, fractions,
+    booleans, etc.);
+  * values refer to rows of other tables (foreign keys), e.g., each
+    gen_load_zone is a LOAD_ZONE in load_zones.csv and each period in
+    capacity_plans.csv is an INVESTMENT_PERIOD in periods.csv;
+  * a few cross-table rules that Switch enforces during construction, e.g.,
+    every load zone has a load in every timepoint and every variable
+    project has a capacity factor in every timepoint when it can operate.
+
+Every violation is reported at once, with the number of bad rows and the
+first few of them (by line number in the file), in a single ValueError.
+Use --skip-input-checks to turn the checks off. Pyomo's own checks are
+still made during construction, so the checks here only catch problems
+earlier and report them all at once; modules that are not covered by TABLES
+are left to Pyomo.
+
+The checks can also be run without building the model, with the usual
+Switch options to select the inputs and modules:
+
+    python -m china_modules.input_checks [--inputs-dir inputs] \\
+        [--module-list inputs/modules.txt]
+
+This prints the violations and exits with status 1 if there are any.
+"""
+
+import os
+import sys
+from timeit import default_timer as timer
+
+import numpy as np
+import pandas as pd
+from .aggregate_projects import read_table, to_number
+
+# blank values, which Switch ignores
+MISSING = [".", ""]
+BOOLEAN_TEXT = ["TRUE", "True", "true", "FALSE", "False", "false"]
+# bad rows listed for each violation
+MAX_EXAMPLES = 5
+
+# tests of the distinct (text) values of a column
+DOMAINS = {
+    "text": lambda v: pd.Series(True, index=v.index),
+    "number": lambda v: to_number(v).notna(),
+    "nonnegative": lambda v: to_number(v) >= 0,
+    "positive": lambda v: to_number(v) > 0,
+    "positive_integer": lambda v: (to_number(v) > 0) & (to_number(v) % 1 == 0),
+    "fraction": lambda v: to_number(v).between(0, 1),
+    "capacity_factor": lambda v: (to_number(v) > -1) & (to_number(v) < 2),
+    "boolean": lambda v: v.isin(BOOLEAN_TEXT) | to_number(v).isin([0, 1]),
+}
+
+
+ENERGY_SOURCES = [("fuels.csv", "fuel"), ("non_fuel_energy_sources.csv", "fuel")]
+
+# Input tables read by each module: whether the file is optional, the key
+# columns (found by position, as Switch reads them), the columns that must
+# be given for every row and optional columns (both with their domains), and
+# the columns that must match a row of another table (any of those listed).
+# Modules that read no inputs have no tables. The tables of all the listed
+# modules are merged, so e.g. the gen_info.csv columns of every module are
+# checked.
+TABLES = {
+    "switch_model": {},
+    "switch_model.timescales": {
+        "periods.csv": dict(
+            key=["INVESTMENT_PERIOD"],
+            columns=dict(
+                INVESTMENT_PERIOD="number", period_start="number", period_end="number"
+            ),
+        ),
+        "timeseries.csv": dict(
+            key=["TIMESERIES"],
+            columns=dict(
+                ts_period="number",
+                ts_duration_of_tp="positive",
+                ts_num_tps="positive_integer",
+                ts_scale_to_period="positive",
+            ),
+            references={"ts_period": [("periods.csv", "INVESTMENT_PERIOD")]},
+        ),
+        "timepoints.csv": dict(
+            key=["timepoint_id"],
+            columns=dict(timeseries="text"),
+            optional_columns=dict(timestamp="text", tp_date="text"),
+            references={"timeseries": [("timeseries.csv", "TIMESERIES")]},
+        ),
+    },
+    "switch_model.financials": {
+        "financials.csv": dict(
+            columns=dict(base_financial_year="number", interest_rate="number"),
+            optional_columns=dict(discount_rate="number"),
+        ),
+    },
+    "switch_model.balancing.load_zones": {
+        "load_zones.csv": dict(
+            key=["LOAD_ZONE"],
+            optional_columns=dict(zone_ccs_distance_km="nonnegative", zone_dbid="text"),
+        ),
+        "loads.csv": dict(
+            key=["load_zone", "TIMEPOINT"],
+            columns=dict(zone_demand_mw="number"),
+            references={
+                "load_zone": [("load_zones.csv", "LOAD_ZONE")],
+                "TIMEPOINT": [("timepoints.csv", "timepoint_id")],
+            },
+        ),
+        "zone_coincident_peak_demand.csv": dict(
+            optional=True,
+            key=["LOAD_ZONE", "PERIOD"],
+            columns=dict(zone_expected_coincident_peak_demand="nonnegative"),
+            references={
+                "LOAD_ZONE": [("load_zones.csv", "LOAD_ZONE")],
+                "PERIOD": [("periods.csv", "INVESTMENT_PERIOD")],
+            },
+        ),
+    },
+    "switch_model.energy_sources.properties": {
+        "non_fuel_energy_sources.csv": dict(optional=True, key=["fuel"]),
+        "fuels.csv": dict(
+            optional=True,
+            key=["fuel"],
+            columns=dict(co2_intensity="number"),
+            optional_columns=dict(upstream_co2_intensity="number"),
+        ),
+    },
+    "switch_model.generators.core.build": {
+        "gen_info.csv": dict(
+            key=["GENERATION_PROJECT"],
+            columns=dict(
+                gen_tech="text",
+                gen_energy_source="text",
+                gen_load_zone="text",
+                gen_max_age="positive_integer",
+                gen_is_variable="boolean",
+                gen_variable_om="number",
+                gen_connect_cost_per_mw="nonnegative",
+            ),
+            optional_columns=dict(
+                gen_dbid="text",
+                gen_is_baseload="boolean",
+                gen_scheduled_outage_rate="fraction",
+                gen_forced_outage_rate="fraction",
+                gen_capacity_limit_mw="nonnegative",
+                gen_unit_size="positive",
+                gen_ccs_energy_load="fraction",
+                gen_ccs_capture_efficiency="fraction",
+                gen_full_load_heat_rate="nonnegative",
+                gen_min_build_capacity="nonnegative",
+                gen_is_cogen="boolean",
+                gen_is_distributed="boolean",
+                gen_can_suspend="boolean",
+                gen_can_retire_early="boolean",
+            ),
+            references={
+                "gen_load_zone": [("load_zones.csv", "LOAD_ZONE")],
+                "gen_energy_source": ENERGY_SOURCES,
+            },
+        ),
+        "gen_build_predetermined.csv": dict(
+            optional=True,
+            key=["GENERATION_PROJECT", "build_year"],
+            columns=dict(build_year="number", build_gen_predetermined="nonnegative"),
+            references={
+                "GENERATION_PROJECT": [("gen_info.csv", "GENERATION_PROJECT")],
+                ("GENERATION_PROJECT", "build_year"): [
+                    ("gen_build_costs.csv", ("GENERATION_PROJECT", "build_year"))
+                ],
+            },
+        ),
+        "gen_build_costs.csv": dict(
+            key=["GENERATION_PROJECT", "build_year"],
+            columns=dict(
+                build_year="number",
+                gen_overnight_cost="nonnegative",
+                gen_fixed_om="number",
+            ),
+            references={"GENERATION_PROJECT": [("gen_info.csv", "GENERATION_PROJECT")]},
+        ),
+        "gen_multiple_fuels.csv": dict(
+            optional=True,
+            key=["GENERATION_PROJECT", "fuel"],
+            references={
+                "GENERATION_PROJECT": [("gen_info.csv", "GENERATION_PROJECT")],
+                "fuel": [("fuels.csv", "fuel")],
+            },
+        ),
+    },
+    "switch_model.generators.core.dispatch": {
+        "variable_capacity_factors.csv": dict(
+            optional=True,
+            key=["GENERATION_PROJECT", "timepoint"],
+            columns=dict(gen_max_capacity_factor="capacity_factor"),
+            references={
+                "GENERATION_PROJECT": [("gen_info.csv", "GENERATION_PROJECT")],
+                "timepoint": [("timepoints.csv", "timepoint_id")],
+            },
+        ),
+    },
+    "switch_model.reporting": {},
+    "switch_model.solve": {},
+    "switch_model.transmission.local_td": {
+        "load_zones.csv": dict(
+            key=["LOAD_ZONE"],
+            columns=dict(
+                existing_local_td="nonnegative", local_td_annual_cost_per_mw="number"
+            ),
+            optional_columns=dict(local_td_loss_rate="fraction"),
+        ),
+    },
+    "switch_model.generators.core.commit.operate": {
+        "gen_info.csv": dict(
+            key=["GENERATION_PROJECT"],
+            optional_columns=dict(
+                gen_min_load_fraction="fraction",
+                gen_startup_fuel="nonnegative",
+                gen_startup_om="nonnegative",
+                gen_min_uptime="nonnegative",
+                gen_min_downtime="nonnegative",
+            ),
+        ),
+        "gen_timepoint_commit_bounds.csv": dict(
+            optional=True,
+            key=["GENERATION_PROJECT", "TIMEPOINT"],
+            optional_columns=dict(
+                gen_min_commit_fraction="fraction",
+                gen_max_commit_fraction="fraction",
+                gen_min_load_fraction_TP="fraction",
+            ),
+            references={
+                "GENERATION_PROJECT": [("gen_info.csv", "GENERATION_PROJECT")],
+                "TIMEPOINT": [("timepoints.csv", "timepoint_id")],
+            },
+        ),
+    },
+    "switch_model.generators.core.commit.fuel_use": {
+        "gen_inc_heat_rates.csv": dict(
+            optional=True,
+            references={"project": [("gen_info.csv", "GENERATION_PROJECT")]},
+        ),
+    },
+    "switch_model.generators.extensions.hydro_simple": {
+        "hydro_timeseries.csv": dict(
+            optional=True,
+            key=["hydro_project", "timeseries"],
+            columns=dict(hydro_min_flow_mw="nonnegative", hydro_avg_flow_mw="number"),
+            references={
+                "hydro_project": [("gen_info.csv", "GENERATION_PROJECT")],
+                "timeseries": [("timeseries.csv", "TIMESERIES")],
+            },
+        ),
+    },
+    "switch_model.generators.extensions.storage": {
+        "gen_info.csv": dict(
+            key=["GENERATION_PROJECT"],
+            optional_columns=dict(
+                gen_storage_efficiency="fraction",
+                gen_store_to_release_ratio="positive",
+                gen_storage_energy_to_power_ratio="nonnegative",
+                gen_storage_max_cycles_per_year="nonnegative",
+            ),
+        ),
+        "gen_build_costs.csv": dict(
+            key=["GENERATION_PROJECT", "build_year"],
+            optional_columns=dict(
+                gen_storage_energy_overnight_cost="nonnegative",
+                gen_storage_energy_fixed_om="number",
+            ),
+        ),
+        "gen_build_predetermined.csv": dict(
+            optional=True,
+            key=["GENERATION_PROJECT", "build_year"],
+            optional_columns=dict(build_gen_energy_predetermined="nonnegative"),
+        ),
+    },
+    "switch_model.energy_sources.fuel_costs.markets": {
+        "regional_fuel_markets.csv": dict(
+            key=["regional_fuel_market"],
+            columns=dict(fuel="text"),
+            references={"fuel": [("fuels.csv", "fuel")]},
+        ),
+        "fuel_supply_curves.csv": dict(
+            key=["regional_fuel_market", "period", "tier"],
+            columns=dict(unit_cost="number", max_avail_at_cost="nonnegative"),
+            references={
+                "regional_fuel_market": [
+                    ("regional_fuel_markets.csv", "regional_fuel_market")
+                ],
+                "period": [("periods.csv", "INVESTMENT_PERIOD")],
+            },
+        ),
+        "zone_to_regional_fuel_market.csv": dict(
+            key=["load_zone", "regional_fuel_market"],
+            references={
+                "load_zone": [("load_zones.csv", "LOAD_ZONE")],
+                "regional_fuel_market": [
+                    ("regional_fuel_markets.csv", "regional_fuel_market")
+                ],
+            },
+        ),
+        "zone_fuel_cost_diff.csv": dict(
+            optional=True,
+            key=["load_zone", "fuel", "period"],
+            columns=dict(fuel_cost_adder="number"),
+            references={
+                "load_zone": [("load_zones.csv", "LOAD_ZONE")],
+                "fuel": [("fuels.csv", "fuel")],
+                "period": [("periods.csv", "INVESTMENT_PERIOD")],
+            },
+        ),
+        "fuel_cost.csv": dict(
+            optional=True,
+            key=["load_zone", "fuel", "period"],
+            columns=dict(fuel_cost="number"),
+            references={
+                "load_zone": [("load_zones.csv", "LOAD_ZONE")],
+                "fuel": [("fuels.csv", "fuel")],
+                "period": [("periods.csv", "INVESTMENT_PERIOD")],
+            },
+        ),
+    },
+    "switch_model.balancing.operating_reserves.areas": {
+        "load_zones.csv": dict(
+            key=["LOAD_ZONE"], optional_columns=dict(zone_balancing_area="text")
+        ),
+    },
+    "switch_model.balancing.operating_reserves.spinning_reserves": {
+        "gen_info.csv": dict(
+            key=["GENERATION_PROJECT"],
+            optional_columns=dict(gen_can_provide_spinning_reserves="boolean"),
+        ),
+        "spinning_reserve_params.csv": dict(
+            optional=True, optional_columns=dict(contingency_safety_factor="number")
+        ),
+    },
+    "switch_model.balancing.planning_reserves": {
+        "reserve_capacity_value.csv": dict(
+            optional=True,
+            key=["GENERATION_PROJECT", "timepoint"],
+            columns=dict(gen_capacity_value="number"),
+            references={
+                "GENERATION_PROJECT": [("gen_info.csv", "GENERATION_PROJECT")],
+                "timepoint": [("timepoints.csv", "timepoint_id")],
+            },
+        ),
+        "planning_reserve_requirements.csv": dict(
+            optional=True,
+            key=["PLANNING_RESERVE_REQUIREMENTS"],
+            columns=dict(prr_cap_reserve_margin="number"),
+            optional_columns=dict(prr_enforcement_timescale="text"),
+        ),
+        "planning_reserve_requirement_zones.csv": dict(
+            optional=True,
+            key=["PLANNING_RESERVE_REQUIREMENTS", "LOAD_ZONE"],
+            references={
+                "PLANNING_RESERVE_REQUIREMENTS": [
+                    (
+                        "planning_reserve_requirements.csv",
+                        "PLANNING_RESERVE_REQUIREMENTS",
+                    )
+                ],
+                "LOAD_ZONE": [("load_zones.csv", "LOAD_ZONE")],
+            },
+        ),
+        "gen_info.csv": dict(
+            key=["GENERATION_PROJECT"],
+            optional_columns=dict(gen_can_provide_cap_reserves="boolean"),
+        ),
+    },
+    "switch_model.transmission.transport.build": {
+        "transmission_lines.csv": dict(
+            key=["TRANSMISSION_LINE"],
+            columns=dict(
+                trans_lz1="text",
+                trans_lz2="text",
+                trans_length_km="nonnegative",
+                trans_efficiency="fraction",
+                existing_trans_cap="nonnegative",
+            ),
+            optional_columns=dict(
+                trans_dbid="text",
+                trans_derating_factor="fraction",
+                trans_terrain_multiplier="positive",
+                trans_new_build_allowed="boolean",
+            ),
+            references={
+                "trans_lz1": [("load_zones.csv", "LOAD_ZONE")],
+                "trans_lz2": [("load_zones.csv", "LOAD_ZONE")],
+            },
+        ),
+        "trans_params.csv": dict(
+            optional=True,
+            optional_columns=dict(
+                trans_capital_cost_per_mw_km="nonnegative",
+                trans_lifetime_yrs="positive",
+                trans_fixed_om_fraction="nonnegative",
+                distribution_loss_rate="fraction",
+            ),
+        ),
+    },
+    "switch_model.transmission.transport.dispatch": {},
+    "switch_model.policies.carbon_policies": {
+        "carbon_policies.csv": dict(
+            optional=True,
+            key=["PERIOD"],
+            optional_columns=dict(
+                carbon_cap_tco2_per_yr="number", carbon_cost_dollar_per_tco2="number"
+            ),
+            references={"PERIOD": [("periods.csv", "INVESTMENT_PERIOD")]},
+        ),
+    },
+    "china_modules.input_cache": {},
+    "china_modules.input_checks": {},
+    "china_modules.instance_cache": {},
+    "china_modules.profiling": {},
+    "china_modules.zone_totals": {},
+    "china_modules.tech_plans": {
+        "capacity_plans.csv": dict(
+            optional=True,
+            key=["energy_sources", "load_zones", "period"],
+            columns=dict(planned_capacity_mw="nonnegative"),
+            references={
+                "energy_sources": ENERGY_SOURCES,
+                "load_zones": [("load_zones.csv", "LOAD_ZONE")],
+                "period": [("periods.csv", "INVESTMENT_PERIOD")],
+            },
+        ),
+        "tech_capacity_plans.csv": dict(
+            optional=True,
+            key=["gen_tech", "load_zones", "period"],
+            columns=dict(planned_tech_capacity_mw="nonnegative"),
+            references={
+                "gen_tech": [("gen_info.csv", "gen_tech")],
+                "load_zones": [("load_zones.csv", "LOAD_ZONE")],
+                "period": [("periods.csv", "INVESTMENT_PERIOD")],
+            },
+        ),
+        "total_capacity_limits.csv": dict(
+            optional=True,
+            key=["energy_sources", "period"],
+            columns=dict(total_capacity_limit_mw="nonnegative"),
+            references={
+                "energy_sources": ENERGY_SOURCES,
+                "period": [("periods.csv", "INVESTMENT_PERIOD")],
+            },
+        ),
+    },
+    "china_modules.water_limits": {
+        "gen_info.csv": dict(
+            key=["GENERATION_PROJECT"],
+            columns=dict(
+                gen_water_basin="text", gen_cooling_water_m3_per_mwh="number"
+            ),
+            references={
+                "gen_water_basin": [("water_limit_annual.csv", "WATER_BASINS")]
+            },
+        ),
+        "water_limit_annual.csv": dict(
+            key=["WATER_BASINS", "PERIOD"],
+            columns=dict(water_basin_limit_mm3="nonnegative"),
+            optional_columns=dict(water_basin_name_cn="text"),
+            references={"PERIOD": [("periods.csv", "INVESTMENT_PERIOD")]},
+        ),
+    },
+    "china_modules.mixed_strategy": {
+        "gen_info.csv": dict(
+            key=["GENERATION_PROJECT"],
+            optional_columns=dict(gen_is_re_connect="boolean"),
+        ),
+    },
+    "china_modules.re_connected_strategy": {
+        "load_zones.csv": dict(
+            key=["LOAD_ZONE"], optional_columns=dict(zone_is_constrained="boolean")
+        ),
+    },
+}
+
+
+def define_arguments(argparser):
+    argparser.add_argument(
+        "--skip-input-checks",
+        action="store_true",
+        default=False,
+        help="Don't check the input tables in bulk before constructing the model.",
+    )
+
+
+def load_inputs(mod, switch_data, inputs_dir):
+    if mod.options.skip_input_checks:
+        return
+    start = timer()
+    problems = check_inputs(inputs_dir, mod.module_list, mod.options)
+    if problems:
+        raise ValueError(report(inputs_dir, problems))
+    mod.logger.info(f"Input checks passed for {inputs_dir} in {timer() - start:.2f} s.")
+
+
+def table_specs(module_list):
+    """Merge the input table specifications of the listed modules."""
+    specs = {}
+    for module in module_list:
+        for name, table in TABLES.get(module, {}).items():
+            spec = specs.setdefault(
+                name,
+                dict(
+                    optional=True,
+                    key=[],
+                    columns={},
+                    optional_columns={},
+                    references={},
+                ),
+            )
+            spec["optional"] = spec["optional"] and table.get("optional", False)
+            if len(table.get("key", [])) > len(spec["key"]):
+                spec["key"] = table["key"]
+            spec["columns"].update(table.get("columns", {}))
+            spec["optional_columns"].update(table.get("optional_columns", {}))
+            spec["references"].update(table.get("references", {}))
+    for spec in specs.values():
+        for column in spec["columns"]:
+            spec["optional_columns"].pop(column, None)
+    return specs
+
+
+def read_tables(inputs_dir, specs):
+    """
+    Read the input tables that exist, as text, with key columns renamed to
+    the names used here.
+    """
+    tables = InputTables()
+    for name, spec in specs.items():
+        path = os.path.join(inputs_dir, name)
+        if not os.path.exists(path):
+            continue
+        table = read_table(path)
+        key = spec["key"]
+        if len(table.columns) >= len(key):
+            table.columns = key + list(table.columns[len(key) :])
+        tables[name] = table
+    return tables
+
+
+class InputTables(dict):
+    """
+    Input tables by file name. Each column is factorized once, into codes
+    and distinct values, so tests are applied to the distinct values only
+    and expanded to the rows with the codes (long tables such as
+    variable_capacity_factors.csv have few distinct keys).
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._factorized = {}
+        self._values = {}
+
+    def factorized(self, name, column):
+        """Return the codes of a column and its distinct values, as text."""
+        if (name, column) not in self._factorized:
+            codes, text = pd.factorize(self[name][column].to_numpy(dtype=object))
+            self._factorized[name, column] = (codes, pd.Series(text, dtype=object))
+        return self._factorized[name, column]
+
+    def distinct_values(self, name, column):
+        """
+        Return the distinct values of a column as Pyomo would read them
+        (numbers as numbers, so e.g. 2025 and 2025.0 are the same).
+        """
+        if (name, column) not in self._values:
+            text = self.factorized(name, column)[1]
+            numbers = to_number(text)
+            self._values[name, column] = text.where(numbers.isna(), numbers)
+        return self._values[name, column]
+
+    def apply(self, name, column, function, text=False):
+        """
+        Apply function to the distinct values of a column (as Pyomo would
+        read them, or as text) and return an array of its results by row.
+        """
+        codes, text_values = self.factorized(name, column)
+        if not text:
+            text_values = self.distinct_values(name, column)
+        return np.asarray(function(text_values))[codes]
+
+    def values(self, name, columns):
+        """
+        Return the values of a column as Pyomo would read them, as a
+        Series, or of several columns as a MultiIndex.
+        """
+        if not isinstance(columns, str):
+            return pd.MultiIndex.from_arrays([self.values(name, c) for c in columns])
+        return pd.Series(self.apply(name, columns, lambda v: v), index=self[name].index)
+
+    def blank(self, name, columns):
+        """Return whether each row has a blank value in any of the columns."""
+        blank = np.zeros(len(self[name]), dtype=bool)
+        for column in [columns] if isinstance(columns, str) else columns:
+            blank |= self.apply(name, column, lambda v: v.isin(MISSING), text=True)
+        return blank
+
+    def isin(self, name, columns, target_name, target_columns):
+        """
+        Return whether the values of columns in each row of table name are
+        in target_columns of table target_name.
+        """
+        if isinstance(columns, str):
+            targets = self.distinct_values(target_name, target_columns)
+            return self.apply(name, columns, lambda v: v.isin(targets))
+        return self.values(name, columns).isin(self.values(target_name, target_columns))
+
+    def duplicated(self, name, columns):
+        """Return whether each row repeats the key of an earlier row."""
+        key = np.zeros(len(self[name]), dtype=np.int64)
+        for column in columns:
+            codes = self.factorized(name, column)[0]
+            # codes of the values that Pyomo reads as equal
+            value_codes, distinct = pd.factorize(self.distinct_values(name, column))
+            key = key * (len(distinct) + 1) + value_codes[codes]
+        return pd.Series(key).duplicated().to_numpy()
+
+
+def examples(table, mask, columns):
+    """Describe the first few rows where mask is True, by line number."""
+    columns = [columns] if isinstance(columns, str) else list(dict.fromkeys(columns))
+    rows = table.loc[mask, columns].head(MAX_EXAMPLES)
+    items = [
+        f"line {i + 2}: " + ", ".join(repr(v) for v in row)
+        for i, row in zip(rows.index, rows.itertuples(index=False))
+    ]
+    if mask.sum() > MAX_EXAMPLES:
+        items.append("...")
+    return "; ".join(items)
+
+
+def check_table(name, specs, tables):
+    """Return the problems with one input table."""
+    spec = specs[name]
+    if name not in tables:
+        return [] if spec["optional"] else [f"{name}: file is missing."]
+    table = tables[name]
+    problems = []
+
+    missing_columns = [c for c in spec["key"] + list(spec["columns"]) if c not in table]
+    if missing_columns:
+        problems.append(f"{name}: missing column(s) {', '.join(missing_columns)}.")
+
+    key = [c for c in spec["key"] if c in table]
+    if key:
+        blank = tables.blank(name, key)
+        if blank.any():
+            problems.append(
+                f"{name}: {blank.sum()} row(s) with a blank key "
+                f"({examples(table, blank, key)})."
+            )
+        duplicate = tables.duplicated(name, key)
+        if duplicate.any():
+            problems.append(
+                f"{name}: {duplicate.sum()} duplicate row(s) for "
+                f"{', '.join(key)} ({examples(table, duplicate, key)})."
+            )
+
+    domains = dict(spec["optional_columns"], **spec["columns"])
+    for column, domain in domains.items():
+        if column not in table:
+            continue
+        blank = tables.blank(name, column)
+        if column in spec["columns"] and column not in spec["key"] and blank.any():
+            problems.append(
+                f"{name}: {blank.sum()} blank value(s) in {column} "
+                f"({examples(table, blank, key + [column])})."
+            )
+        bad = ~blank & ~tables.apply(name, column, DOMAINS[domain], text=True)
+        if bad.any():
+            problems.append(
+                f"{name}: {bad.sum()} value(s) of {column} are not "
+                f"{domain.replace('_', ' ')} ({examples(table, bad, key + [column])})."
+            )
+
+    for columns, targets in spec["references"].items():
+        column_list = [columns] if isinstance(columns, str) else list(columns)
+        # skip tables that are not read by the listed modules, and columns
+        # that are missing (reported above)
+        targets = [(t, c) for t, c in targets if t in specs]
+        if not targets or not all(c in table for c in column_list):
+            continue
+        if any(
+            not all(c in tables[t] for c in ([c] if isinstance(c, str) else c))
+            for t, c in targets
+            if t in tables
+        ):
+            continue
+        valid = tables.blank(name, column_list)
+        for target_name, target_columns in targets:
+            if target_name in tables:
+                valid |= tables.isin(name, columns, target_name, target_columns)
+        if not valid.all():
+            where = " or ".join(
+                f"{t} {c if isinstance(c, str) else ', '.join(c)}" for t, c in targets
+            )
+            problems.append(
+                f"{name}: {(~valid).sum()} value(s) of {', '.join(column_list)} are "
+                f"not in {where} ({examples(table, ~valid, key + column_list)})."
+            )
+    return problems
+
+
+def describe_missing(missing):
+    items = [", ".join(repr(v) for v in m) for m in missing[:MAX_EXAMPLES]]
+    if len(missing) > MAX_EXAMPLES:
+        items.append("...")
+    return "; ".join(items)
+
+
+def check_timepoints_per_timeseries(tables, options):
+    if "timeseries.csv" not in tables or "timepoints.csv" not in tables:
+        return []
+    timeseries = tables["timeseries.csv"]
+    counts = tables.values("timepoints.csv", "timeseries").value_counts()
+    expected = to_number(timeseries["ts_num_tps"])
+    found = tables.values("timeseries.csv", "TIMESERIES").map(counts).fillna(0)
+    bad = found != expected
+    if not bad.any():
+        return []
+    return [
+        f"timeseries.csv: {bad.sum()} timeseries have a different number of "
+        f"timepoints in timepoints.csv than ts_num_tps "
+        f"({examples(timeseries, bad, ['TIMESERIES', 'ts_num_tps'])})."
+    ]
+
+
+def check_loads_in_every_timepoint(tables, options):
+    if any(n not in tables for n in ["load_zones.csv", "timepoints.csv", "loads.csv"]):
+        return []
+    expected = pd.MultiIndex.from_product(
+        [
+            tables.distinct_values("load_zones.csv", "LOAD_ZONE"),
+            tables.distinct_values("timepoints.csv", "timepoint_id"),
+        ]
+    )
+    present = tables.values("loads.csv", ["load_zone", "TIMEPOINT"])
+    missing = expected[~expected.isin(present)]
+    if len(missing) == 0:
+        return []
+    return [
+        f"loads.csv: no zone_demand_mw for {len(missing)} load zone and "
+        f"timepoint combination(s) ({describe_missing(missing)})."
+    ]
+
+
+def check_build_years(tables, options):
+    """Build years must be periods or have predetermined capacity."""
+    if "gen_build_costs.csv" not in tables or "periods.csv" not in tables:
+        return []
+    costs = tables["gen_build_costs.csv"]
+    valid = tables.isin(
+        "gen_build_costs.csv", "build_year", "periods.csv", "INVESTMENT_PERIOD"
+    )
+    if "gen_build_predetermined.csv" in tables:
+        key = ("GENERATION_PROJECT", "build_year")
+        valid |= tables.isin(
+            "gen_build_costs.csv", key, "gen_build_predetermined.csv", key
+        )
+    if valid.all():
+        return []
+    return [
+        f"gen_build_costs.csv: {(~valid).sum()} build year(s) are neither an "
+        "investment period nor a year with predetermined capacity "
+        f"({examples(costs, ~valid, ['GENERATION_PROJECT', 'build_year'])})."
+    ]
+
+
+def check_fuel_heat_rates(tables, options):
+    """Fuel-based projects need a heat rate, unless given as increments."""
+    gens, fuels = tables.get("gen_info.csv"), tables.get("fuels.csv")
+    if gens is None or fuels is None or "gen_inc_heat_rates.csv" in tables:
+        return []
+    if "gen_full_load_heat_rate" not in gens:
+        heat_rate_missing = pd.Series(True, index=gens.index)
+    else:
+        heat_rate_missing = gens["gen_full_load_heat_rate"].isin(MISSING)
+    bad = gens["gen_energy_source"].isin(fuels["fuel"]) & heat_rate_missing
+    if not bad.any():
+        return []
+    return [
+        f"gen_info.csv: {bad.sum()} fuel-based project(s) have no "
+        "gen_full_load_heat_rate "
+        f"({examples(gens, bad, ['GENERATION_PROJECT', 'gen_energy_source'])})."
+    ]
+
+
+def operating_periods(tables):
+    """
+    Return (project, period) pairs for the periods when each project can
+    operate, as Switch decides by default (retire_time "late"): the build
+    year is the period, or the capacity comes online by the start of the
+    period and retires after it.
+    """
+    periods = pd.DataFrame(
+        dict(
+            period=tables.values("periods.csv", "INVESTMENT_PERIOD"),
+            start=to_number(tables["periods.csv"]["period_start"]),
+        )
+    )
+    gens = tables["gen_info.csv"]
+    max_age = pd.Series(
+        to_number(gens["gen_max_age"]).values, index=gens["GENERATION_PROJECT"]
+    )
+    costs = tables["gen_build_costs.csv"]
+    builds = pd.DataFrame(
+        dict(
+            project=costs["GENERATION_PROJECT"],
+            build_year=tables.values("gen_build_costs.csv", "build_year"),
+        )
+    )
+    online = builds["build_year"].map(periods.set_index("period")["start"])
+    builds["online"] = online.fillna(to_number(costs["build_year"]))
+    builds["retirement"] = builds["online"] + builds["project"].map(max_age)
+    pairs = builds.merge(periods, how="cross")
+    operating = (pairs["build_year"] == pairs["period"]) | (
+        (pairs["online"] <= pairs["start"]) & (pairs["start"] < pairs["retirement"])
+    )
+    return pairs.loc[operating, ["project", "period"]].drop_duplicates()
+
+
+def check_capacity_factors(tables, options):
+    """
+    Capacity factors must be for variable projects, and each variable
+    project needs one for every timepoint in the periods when it can operate.
+    """
+    needed = ["gen_info.csv", "gen_build_costs.csv", "periods.csv"]
+    needed += ["timeseries.csv", "timepoints.csv"]
+    if any(name not in tables for name in needed):
+        return []
+    gens = tables["gen_info.csv"]
+    variable = gens.loc[
+        gens["gen_is_variable"].isin(["TRUE", "True", "true", "1"]),
+        "GENERATION_PROJECT",
+    ]
+    timeseries_period = pd.Series(
+        tables.values("timeseries.csv", "ts_period").values,
+        index=tables.values("timeseries.csv", "TIMESERIES"),
+    )
+    timepoint_period = pd.Series(
+        tables.values("timepoints.csv", "timeseries").map(timeseries_period).values,
+        index=tables.values("timepoints.csv", "timepoint_id"),
+    )
+    problems = []
+
+    name = "variable_capacity_factors.csv"
+    if name in tables:
+        bad = tables.apply(
+            name,
+            "GENERATION_PROJECT",
+            lambda v: ~v.isin(variable) & v.isin(gens["GENERATION_PROJECT"]),
+            text=True,
+        )
+        if bad.any():
+            problems.append(
+                f"{name}: {bad.sum()} row(s) for projects that are not variable "
+                f"({examples(tables[name], bad, ['GENERATION_PROJECT', 'timepoint'])})."
+            )
+
+    if getattr(options, "retire_time", "late") != "late":
+        # other retirement timing is checked by Switch during construction
+        return problems
+    operating = operating_periods(tables)
+    operating = operating[operating["project"].isin(variable)].copy()
+    operating["needed"] = operating["period"].map(timepoint_period.value_counts())
+    operating["given"] = 0
+    if name in tables:
+        # count the timepoints with capacity factors for each project and
+        # period, by their codes (duplicate rows are reported by check_table)
+        codes, projects = tables.factorized(name, "GENERATION_PROJECT")
+        periods = pd.Index(tables.distinct_values("periods.csv", "INVESTMENT_PERIOD"))
+        period_codes = tables.apply(
+            name, "timepoint", lambda v: periods.get_indexer(v.map(timepoint_period))
+        )
+        keep = ~bad & (period_codes >= 0)
+        width = len(periods)
+        counts = np.bincount(
+            codes[keep] * width + period_codes[keep], minlength=len(projects) * width
+        )
+        project_codes = pd.Index(projects).get_indexer(operating["project"])
+        found = project_codes >= 0
+        operating.loc[found, "given"] = counts[
+            project_codes[found] * width
+            + periods.get_indexer(operating.loc[found, "period"])
+        ]
+    operating["missing"] = operating["needed"] - operating["given"]
+    short = operating[operating["missing"] > 0]
+    if len(short):
+        items = [
+            f"{row.project!r} in {row.period!r}: {row.missing:g} of {row.needed:g}"
+            for row in short.head(MAX_EXAMPLES).itertuples()
+        ]
+        if len(short) > MAX_EXAMPLES:
+            items.append("...")
+        problems.append(
+            f"{name}: no gen_max_capacity_factor for {short['missing'].sum():g} "
+            "timepoint(s) when variable projects can operate, for "
+            f"{len(short)} project and period combination(s) "
+            f"({'; '.join(items)} timepoints missing)."
+        )
+    return problems
+
+
+def check_water_basin_names(tables, options):
+    limits = tables.get("water_limit_annual.csv")
+    if limits is None or "water_basin_name_cn" not in limits:
+        return []
+    names = limits.loc[~limits["water_basin_name_cn"].isin(MISSING)]
+    counts = names.groupby("WATER_BASINS")["water_basin_name_cn"].nunique()
+    inconsistent = counts.index[counts > 1]
+    if len(inconsistent) == 0:
+        return []
+    return [
+        f"water_limit_annual.csv: water_basin_name_cn differs between periods "
+        f"for {len(inconsistent)} basin(s) ({', '.join(inconsistent[:MAX_EXAMPLES])})."
+    ]
+
+
+# cross-table rules checked for each module
+RULES = {
+    "switch_model.timescales": [check_timepoints_per_timeseries],
+    "switch_model.balancing.load_zones": [check_loads_in_every_timepoint],
+    "switch_model.generators.core.build": [check_build_years, check_fuel_heat_rates],
+    "switch_model.generators.core.dispatch": [check_capacity_factors],
+    "china_modules.water_limits": [check_water_basin_names],
+}
+
+
+def check_inputs(inputs_dir, module_list, options=None):
+    """
+    Check the input tables of the listed modules and return a list of the
+    problems found.
+    """
+    specs = table_specs(module_list)
+    tables = read_tables(inputs_dir, specs)
+    problems = []
+    for name in specs:
+        problems.extend(check_table(name, specs, tables))
+    for module in module_list:
+        for rule in RULES.get(module, []):
+            problems.extend(rule(tables, options))
+    return problems
+
+
+def report(inputs_dir, problems):
+    return (
+        f"Found {len(problems)} problem(s) in the input tables in {inputs_dir}:\n"
+        + ("\n".join(f"  {p}" for p in problems))
+    )
+
+
+def main(args=None):
+    from switch_model.solve import get_module_list
+    from switch_model.utilities import create_model
+
+    if args is None:
+        args = sys.argv[1:]
+    module_list = get_module_list(args)
+    model = create_model(module_list, args)
+    inputs_dir = model.options.inputs_dir
+    start = timer()
+    problems = check_inputs(inputs_dir, module_list, model.options)
+    if problems:
+        print(report(inputs_dir, problems))
+        sys.exit(1)
+    print(f"Input checks passed for {inputs_dir} in {timer() - start:.2f} s.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,389 @@
+"""
+Save the constructed model instance and reload it instead of rebuilding it.
+
+Reading the inputs and constructing the Pyomo instance is a large fixed cost
+of every run, and it is repeated unchanged when only the solver options
+change or when results are reported again with --reload-prior-solution after
+a crash. When this module is in the module list, the constructed instance is
+saved in a snapshot cache, and later runs with the same inputs, modules and
+model options load the snapshot instead of reading the inputs and building
+the model. The snapshot is taken before pre-solve processing, so pre_solve
+functions are run on the reloaded instance as usual.
+
+Snapshots are keyed by a sha256 hash of
+  * the contents of the input tables and lists (INPUT_SUFFIXES) at the top
+    level of the inputs directory, so outputs, logs or cache directories
+    kept there don't change the key,
+  * the module list and the source code of every module in the packages of
+    those modules (e.g., all of switch_model and china_modules, including
+    helper modules that are not listed in modules.txt),
+  * the command-line options, except those that only affect solving,
+    logging or reporting (RUN_OPTIONS), and
+  * the Python, Pyomo and Switch versions.
+The reloaded instance is given the options, logger and iteration modules of
+the current run, so e.g. a different --solver or --outputs-dir takes effect.
+Unlike a newly built instance, it has no DataPortal attribute.
+
+By default the cache is kept in an 'instance_cache' directory inside the
+inputs directory; use --instance-cache-dir to choose another location or
+--no-instance-cache to turn it off. The cache is limited to
+--instance-cache-size-mb; the least recently used snapshots are removed when
+a new snapshot would exceed that size.
+
+Construction rules are not needed after the instance is built and are often
+local functions that can't be saved. They are replaced in the snapshot by
+placeholders that raise an error if they are called. Param defaults given by
+rules are evaluated for all indexes before the instance is saved, since
+Pyomo evaluates them on demand.
+"""
+
+import gc
+import hashlib
+import importlib
+import json
+import os
+import pickle
+import sys
+import tempfile
+import types
+from contextlib import contextmanager
+from timeit import default_timer as timer
+
+import pyomo
+from pyomo.environ import Param
+import switch_model
+
+from .input_cache import InputCache
+
+# increase when the layout of snapshots changes
+CACHE_FORMAT = 1
+SNAPSHOT_SUFFIX = ".pickle"
+# files in the inputs directory that are part of the snapshot key
+INPUT_SUFFIXES = (".csv", ".txt", ".json")
+
+# options that don't change the constructed instance
+RUN_OPTIONS = {
+    "debug",
+    "full_traceback",
+    "include_exclude_modules",
+    "input_cache_dir",
+    "inputs_dir",
+    "instance_cache_dir",
+    "instance_cache_size_mb",
+    "interact",
+    "interact_color",
+    "iterate_list",
+    "keepfiles",
+    "log_level",
+    "log_run_to_file",
+    "logs_dir",
+    "max_iter",
+    "module_list",
+    "no_input_cache",
+    "no_instance_cache",
+    "no_load_solution",
+    "no_post_solve",
+    "no_save_solution",
+    "outputs_dir",
+    "profile_report",
+    "reload_prior_solution",
+    "retrieve_cplex_mip_duals",
+    "save_expressions",
+    "save_solution_file",
+    "scenario_name",
+    "skip_generic_output",
+    "solver",
+    "solver_io",
+    "solver_manager",
+    "solver_options_string",
+    "sorted_output",
+    "symbolic_solver_labels",
+    "tee",
+    "tempdir",
+    "verbose",
+}
+
+# instance attributes that belong to the run rather than the model; they are
+# left out of snapshots and taken from the current run when one is loaded
+RUN_ATTRIBUTES = [
+    "options",
+    "logger",
+    "iterate_modules",
+    "DataPortal",
+    "build_profile",
+    "create_instance",
+    "load_inputs",
+]
+
+
+def define_arguments(argparser):
+    argparser.add_argument(
+        "--instance-cache-dir",
+        default=None,
+        help="Directory for saved model instances (default: 'instance_cache' "
+        "inside the inputs directory).",
+    )
+    argparser.add_argument(
+        "--instance-cache-size-mb",
+        type=float,
+        default=4096,
+        help="Maximum total size of saved model instances; the least recently "
+        "used are removed first (default: 4096).",
+    )
+    argparser.add_argument(
+        "--no-instance-cache",
+        action="store_true",
+        default=False,
+        help="Always build the model instance from the inputs, without using "
+        "or saving snapshots.",
+    )
+
+
+def define_dynamic_lists(mod):
+    """
+    Replace mod.load_inputs with a version that uses the snapshot cache.
+    This is done before any components are defined, so the source code of
+    every module has been loaded when the snapshot key is calculated.
+    """
+    if mod.options.no_instance_cache:
+        return
+    load_inputs = mod.load_inputs
+    load_inputs = getattr(load_inputs, "uncached", load_inputs)
+
+    def cached_load_inputs(inputs_dir=None, attach_data_portal=True):
+        if inputs_dir is None:
+            inputs_dir = getattr(mod.options, "inputs_dir", "inputs")
+        cache_dir = mod.options.instance_cache_dir
+        if cache_dir is None:
+            cache_dir = os.path.join(inputs_dir, "instance_cache")
+        os.makedirs(cache_dir, exist_ok=True)
+        cache = InstanceCache(cache_dir, mod.options.instance_cache_size_mb)
+        key = cache.snapshot_key(mod, inputs_dir)
+
+        start = timer()
+        instance = cache.read(key)
+        if instance is not None:
+            for name in ["options", "logger", "iterate_modules"]:
+                setattr(instance, name, getattr(mod, name))
+            mod.logger.info(
+                f"Loaded model instance from snapshot {key[:12]} in "
+                f"{timer() - start:.2f} s."
+            )
+            return instance
+
+        instance = load_inputs(inputs_dir, attach_data_portal)
+        start = timer()
+        if cache.write(key, instance, mod.logger):
+            mod.logger.info(
+                f"Saved model instance as snapshot {key[:12]} in "
+                f"{timer() - start:.2f} s."
+            )
+        return instance
+
+    cached_load_inputs.uncached = load_inputs
+    mod.load_inputs = cached_load_inputs
+
+
+class InstanceCache(object):
+    def __init__(self, cache_dir, size_mb):
+        self.cache_dir = cache_dir
+        self.size_limit = size_mb * 2**20
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key + SNAPSHOT_SUFFIX)
+
+    def snapshot_key(self, model, inputs_dir):
+        """Return the cache key for building model from inputs_dir."""
+        description = {
+            "format": CACHE_FORMAT,
+            "python": sys.version,
+            "pyomo": pyomo.version.version,
+            "switch": switch_model.__version__,
+            "inputs": input_hashes(inputs_dir, self.cache_dir),
+            "modules": list(model.module_list),
+            "sources": source_hashes(model.module_list),
+            "options": {
+                k: v
+                for k, v in sorted(vars(model.options).items())
+                if k not in RUN_OPTIONS
+            },
+        }
+        return hashlib.sha256(
+            json.dumps(description, sort_keys=True, default=repr).encode()
+        ).hexdigest()
+
+    def read(self, key):
+        """Return the instance saved under key, or None if there isn't one."""
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f, garbage_collection_paused():
+                instance = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # damaged or written by incompatible code; build it again
+            remove_file(path)
+            return None
+        # mark as recently used
+        os.utime(path)
+        return instance
+
+    def write(self, key, instance, logger):
+        """
+        Save instance under key and remove the least recently used snapshots
+        if the cache is over its size limit. Returns True if the snapshot was
+        kept.
+        """
+        for component in instance.component_objects(Param, descend_into=True):
+            evaluate_default_rules(component)
+
+        saved = {}
+        for name in RUN_ATTRIBUTES:
+            if name in instance.__dict__:
+                saved[name] = instance.__dict__.pop(name)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f, garbage_collection_paused():
+                SnapshotPickler(f, protocol=pickle.HIGHEST_PROTOCOL).dump(instance)
+            os.replace(tmp_path, self.path(key))
+        except Exception as e:
+            logger.warning(f"Unable to save model instance snapshot: {e}")
+            remove_file(tmp_path)
+            return False
+        finally:
+            instance.__dict__.update(saved)
+
+        self.evict()
+        return os.path.exists(self.path(key))
+
+    def evict(self):
+        """
+        Remove the least recently used snapshots until the cache is within
+        its size limit.
+        """
+        snapshots = []
+        for filename in os.listdir(self.cache_dir):
+            if filename.endswith(SNAPSHOT_SUFFIX):
+                try:
+                    stat = os.stat(os.path.join(self.cache_dir, filename))
+                except FileNotFoundError:
+                    continue
+                snapshots.append((stat.st_mtime, stat.st_size, filename))
+        snapshots.sort()
+        total = sum(size for _, size, _ in snapshots)
+        for _, size, filename in snapshots:
+            if total <= self.size_limit:
+                break
+            remove_file(os.path.join(self.cache_dir, filename))
+            total -= size
+
+
+def input_hashes(inputs_dir, cache_dir):
+    """
+    Return the sha256 hash of every input file (INPUT_SUFFIXES) at the top
+    level of inputs_dir, keyed by filename. Subdirectories (e.g., outputs or
+    caches when --inputs-dir is the scenario directory) are not included.
+    Hashes are remembered in cache_dir (see input_cache.py), so unchanged
+    files are not read again.
+    """
+    file_hashes = InputCache(cache_dir)
+    hashes = {}
+    for filename in sorted(os.listdir(inputs_dir)):
+        path = os.path.join(inputs_dir, filename)
+        if filename.endswith(INPUT_SUFFIXES) and os.path.isfile(path):
+            hashes[filename] = file_hashes.file_hash(path)
+    file_hashes.save_file_hashes()
+    return hashes
+
+
+def source_hashes(module_list):
+    """
+    Return the sha256 hash of every Python source file in the top-level
+    packages of the modules in module_list, e.g., {"china_modules/x.py": hash}.
+    Whole packages are hashed, rather than only the listed modules, so helper
+    modules that the listed modules import are covered too.
+    """
+    hashes = {}
+    for package in sorted({name.split(".")[0] for name in module_list}):
+        module = importlib.import_module(package)
+        if hasattr(module, "__path__"):
+            paths = [
+                (os.path.dirname(root), os.path.join(dirpath, filename))
+                for root in module.__path__
+                for dirpath, dirnames, filenames in os.walk(root)
+                for filename in filenames
+                if filename.endswith(".py")
+            ]
+        else:
+            # a module that is not in a package
+            paths = [(os.path.dirname(module.__file__), module.__file__)]
+        for parent, path in paths:
+            with open(path, "rb") as f:
+                hashes[os.path.relpath(path, parent)] = hashlib.sha256(
+                    f.read()
+                ).hexdigest()
+    return hashes
+
+
+def evaluate_default_rules(param):
+    """
+    Evaluate a Param's default rule for every index that has no value, so
+    the rule is not needed after the instance is reloaded.
+    """
+    if not isinstance(param._default_val, types.FunctionType):
+        return
+    if param._mutable:
+        for index in param.index_set():
+            param[index]
+    else:
+        param._default_val = {
+            index: param[index]
+            for index in param.index_set()
+            if index not in param._data
+        }
+
+
+class SnapshotPickler(pickle.Pickler):
+    """Pickler that saves local functions (e.g., rules) as placeholders."""
+
+    def reducer_override(self, obj):
+        if isinstance(obj, types.FunctionType) and "<" in obj.__qualname__:
+            return MissingRule, (f"{obj.__module__}.{obj.__qualname__}",)
+        return NotImplemented
+
+
+class MissingRule(object):
+    """Placeholder for a function that was left out of a snapshot."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __call__(self, *args, **kwargs):
+        raise RuntimeError(
+            f"{self.name} was not saved with the model instance snapshot; "
+            "use --no-instance-cache to build the model from the inputs."
+        )
+
+
+@contextmanager
+def garbage_collection_paused():
+    """
+    Turn off Python's cyclic garbage collector while saving or loading a
+    snapshot. Loading creates millions of objects and no garbage, and the
+    collector would otherwise scan them over and over (this more than halves
+    the time to load a snapshot).
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
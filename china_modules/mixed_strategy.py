@@ -8,9 +8,17 @@ in the model. Each province can choose a mixed of these three battery deploymenn
 """
 
 from pyomo.environ import *
-import os, collections
+import os
 
-dependencies = "switch_model.generators.extensions.storage"
+from . import charge_limit, sparse_rows, zone_totals
+from .project_arrays import get_project_arrays
+
+dependencies = "switch_model.generators.extensions.storage", "china_modules.zone_totals"
+
+
+def define_arguments(argparser):
+    charge_limit.define_arguments(argparser)
+    sparse_rows.define_arguments(argparser)
 
 
 def define_components(mod):
@@ -23,64 +31,59 @@ def define_components(mod):
         mod.GENERATION_PROJECTS, within=Boolean, default=False
     )
 
+    # zone/period sets for central batteries and renewables, and
+    # RenewableDispatchZone
+    zone_totals.define_components(mod)
+
+    # central batteries that are co-located with renewable projects
+    def RE_CONNECT_BATTERIES_IN_ZONE_PERIOD_init(m, z, p):
+        re_connect = get_project_arrays(m).flagged(m.gen_is_re_connect)
+        return [g for g in m.CENTRAL_BATTERIES_IN_ZONE_PERIOD[z, p] if g in re_connect]
+
+    mod.RE_CONNECT_BATTERIES_IN_ZONE_PERIOD = Set(
+        mod.LOAD_ZONES,
+        mod.PERIODS,
+        dimen=1,
+        within=mod.STORAGE_GENS,
+        initialize=RE_CONNECT_BATTERIES_IN_ZONE_PERIOD_init,
+    )
+
     # Summarize battery storage charging
-    def battery_rule(m, z, t):
-        # Construct and cache a set for summation as needed
-        if not hasattr(m, "Battery_Storage_Central_Charge_Summation_dict"):
-            m.Battery_Storage_Central_Charge_Summation_dict = collections.defaultdict(
-                set
+    def REBatteryCentralCharge_rule(m, z, t):
+        if sparse_rows.use_matrix_construction(m):
+            return sparse_rows.pop_row(
+                m,
+                "_REBatteryCentralCharge_rows_dict",
+                lambda: zone_totals.zone_timepoint_rows(
+                    m,
+                    m.ChargeStorage,
+                    zone_totals.central_batteries(m)
+                    & get_project_arrays(m).flags(m.gen_is_re_connect),
+                ),
+                (z, t),
             )
-            for g, t2 in m.STORAGE_GEN_TPS:
-                # must be re-connect
-                if (
-                    m.gen_tech[g] == "Battery_Storage"
-                    and not m.gen_is_distributed[g]
-                    and m.gen_is_re_connect[g]
-                ):
-                    # only add battery in central
-                    z2 = m.gen_load_zone[g]
-                    m.Battery_Storage_Central_Charge_Summation_dict[z2, t2].add(g)
-        # Use pop to free memory
-        relevant_projects = m.Battery_Storage_Central_Charge_Summation_dict.pop(
-            (z, t), {}
+        return sum(
+            m.ChargeStorage[g, t]
+            for g in m.RE_CONNECT_BATTERIES_IN_ZONE_PERIOD[z, m.tp_period[t]]
         )
-        return sum(m.ChargeStorage[g, t] for g in relevant_projects)
 
     mod.REBatteryCentralCharge = Expression(
-        mod.LOAD_ZONES, mod.TIMEPOINTS, rule=battery_rule
-    )
-
-    mod.Renewable_GEN_TPS = Set(
-        dimen=2,
-        initialize=lambda m: (
-            (g, tp) for g in m.VARIABLE_GENS for tp in m.TPS_FOR_GEN[g]
-        ),
+        mod.LOAD_ZONES, mod.TIMEPOINTS, rule=REBatteryCentralCharge_rule
     )
 
-    def rule(m, z, t):
-        if not hasattr(m, "Renewable_Gen_Summation_dict"):
-            m.Renewable_Gen_Summation_dict = collections.defaultdict(set)
-            for g, t2 in m.Renewable_GEN_TPS:
-                z2 = m.gen_load_zone[g]
-                m.Renewable_Gen_Summation_dict[z2, t2].add(g)
-        # Use pop to free memory
-        relevant_projects = m.Renewable_Gen_Summation_dict.pop((z, t), {})
-        return sum(m.DispatchGen[g, t] for g in relevant_projects)
-
-    mod.RenewableDispatchZone = Expression(mod.LOAD_ZONES, mod.TIMEPOINTS, rule=rule)
-
-    mod.Charge_Storage_Upper_Limit_Zone = Constraint(
-        mod.ZONE_TIMEPOINTS,
-        rule=lambda m, z, t: m.REBatteryCentralCharge[z, t]
-        <= m.RenewableDispatchZone[z, t],
-    )
+    # charging limit, optionally added lazily (see charge_limit.py)
+    charge_limit.define_components(mod, "ZONE_TIMEPOINTS", "REBatteryCentralCharge")
 
 
 def load_inputs(mod, switch_data, inputs_dir):
     # which batteries are re-connected
     switch_data.load_aug(
-        filename=os.path.join(inputs_dir, "generation_projects_info.csv"),
+        filename=os.path.join(inputs_dir, "gen_info.csv"),
         optional_params=["gen_is_re_connect"],
         index=mod.GENERATION_PROJECTS,
         param=(mod.gen_is_re_connect),
     )
+
+
+def post_solve(instance, outdir):
+    charge_limit.write_outputs(instance, outdir)
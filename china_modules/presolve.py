@@ -0,0 +1,70 @@
+"""
+Presolve checks shared by 'tech_plans' and 'water_limits'.
+
+Some plan and limit rows can be settled from the input data before any
+build decision is made:
+
+- a capacity plan (>=) is already met by predetermined capacity that cannot
+  be suspended or retired early;
+- a total capacity limit (<=) can never be exceeded because the largest
+  possible capacity is within it;
+- a water basin limit (<=) can never be exceeded because the largest
+  possible cooling water withdrawal is within it.
+
+With --drop-redundant-constraints, the modules that own these constraints
+use `capacity_bounds` to detect such rows and skip them (return
+Constraint.Skip), logging each dropped row with the reason. This gives the
+solver a smaller model and leaves only rows that can actually bind when
+diagnosing an infeasible model. By default every row is built, so outputs
+and duals stay comparable with earlier runs.
+
+This module is used by the modules that own the constraints, so it does not
+need to be listed in modules.txt; those modules should call
+`define_arguments` from their own define_arguments.
+"""
+
+def define_arguments(argparser):
+    # several modules use the presolve and add this argument
+    if any(
+        "--drop-redundant-constraints" in a.option_strings for a in argparser._actions
+    ):
+        return
+    argparser.add_argument(
+        "--drop-redundant-constraints",
+        action="store_true",
+        default=False,
+        help="Skip capacity plan, total capacity limit and water limit rows "
+        "that the input data show cannot bind.",
+    )
+
+
+def enabled(m):
+    return m.options.drop_redundant_constraints
+
+
+def capacity_bounds(m, g, p):
+    """
+    Return the smallest and largest values that GenCapacity[g, p] can take,
+    based on the input data. The smallest is the predetermined capacity in
+    service in period p, or 0 if the project can be suspended or retired
+    early. The largest is gen_capacity_limit_mw for capacity-limited
+    projects, the predetermined capacity in service if no new capacity can
+    be built that would be in service in period p, and unbounded otherwise.
+    """
+    removable = m.gen_can_suspend[g] or m.gen_can_retire_early[g]
+    low = high = 0.0
+    for bld_yr in m.BLD_YRS_FOR_GEN_PERIOD[g, p]:
+        if (g, bld_yr) in m.PREDETERMINED_GEN_BLD_YRS:
+            mw = m.build_gen_predetermined[g, bld_yr]
+            high += mw
+            if not removable:
+                low += mw
+        else:
+            high = float("inf")
+    if g in m.CAPACITY_LIMITED_GENS:
+        high = min(high, m.gen_capacity_limit_mw[g])
+    return low, high
+
+
+def log_dropped(m, component, index, reason):
+    m.logger.info(f"Presolve: dropped {component}{list(index)}: {reason}.")
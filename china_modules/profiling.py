@@ -0,0 +1,249 @@
+"""
+Measure the time and memory used by each module while building the model.
+
+Add this module to the end of the module list, e.g.,
+
+    switch solve --include-modules china_modules.profiling
+
+It records, for every other module, the wall time, process memory (resident
+set size, RSS) and peak RSS after each call to define_dynamic_lists,
+define_components, define_dynamic_components, load_inputs, pre_solve and
+post_solve, plus the number of model components each define_* function
+added. While the model instance is constructed, it also records the time and
+number of rows (indexed members) of every component, e.g.,
+Enforce_Capacity_Plan or Charge_Storage_Upper_Limit_Zone, and attributes
+each component to the module that defined it, so construction time can be
+totaled by module.
+
+The results are written to build_profile.json in the outputs directory
+(--profile-report) just before the model is solved, and again after
+post-solve processing. The report has:
+
+    steps       one entry per module function call, in the order called
+    modules     totals for each module, including construction of the
+                components it defined
+    components  construction time and rows for each component, slowest first
+
+Memory figures come from /proc and the resource module, so they are only
+available on Linux and macOS; elsewhere they are reported as null.
+"""
+
+import json
+import logging
+import os
+import sys
+from timeit import default_timer as timer
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# module functions that are timed
+PROFILED_HOOKS = [
+    "define_dynamic_lists",
+    "define_components",
+    "define_dynamic_components",
+    "load_inputs",
+    "pre_solve",
+    "post_solve",
+]
+
+
+def define_arguments(argparser):
+    argparser.add_argument(
+        "--profile-report",
+        default="build_profile.json",
+        help="Name of the file in the outputs directory for the build "
+        "profile (default: build_profile.json).",
+    )
+
+
+def define_dynamic_lists(mod):
+    """
+    Start profiling. All modules' define_dynamic_lists functions are called
+    before any define_components, so the other modules' functions can be
+    wrapped here no matter where this module is in the module list.
+    """
+    profile = BuildProfile()
+    for module in mod.get_modules():
+        if module.__name__ == __name__:
+            continue
+        for hook in PROFILED_HOOKS:
+            if hasattr(module, hook):
+                profile.wrap(module, hook)
+    profile.wrap_create_instance(mod)
+    mod.build_profile = profile
+
+
+def pre_solve(instance):
+    save_report(instance, instance.options.outputs_dir)
+
+
+def post_solve(instance, outdir):
+    save_report(instance, outdir)
+
+
+def save_report(instance, outdir):
+    profile = getattr(instance, "build_profile", None)
+    if profile is None:
+        return
+    os.makedirs(outdir, exist_ok=True)
+    path = os.path.join(outdir, instance.options.profile_report)
+    with open(path, "w") as f:
+        json.dump(profile.report(), f, indent=2)
+
+
+def memory_mb():
+    """
+    Return the current and peak resident set size of this process in MB, or
+    None for values that are unavailable on this platform.
+    """
+    current = peak = None
+    try:
+        with open("/proc/self/statm") as f:
+            current = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is reported in bytes on macOS and kB elsewhere
+        peak = peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+    return current, peak
+
+
+class BuildProfile(object):
+    def __init__(self):
+        self.steps = []
+        self.components = []
+        # module that defined each component
+        self.component_module = {}
+
+    def measure(self, module_name, hook, func, args, kwargs, model=None):
+        """Call func(*args, **kwargs) and record the time and memory used."""
+        if model is not None:
+            before = set(model.component_map())
+        rss_before, _ = memory_mb()
+        start = timer()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            seconds = timer() - start
+            rss, peak = memory_mb()
+            step = dict(
+                module=module_name,
+                hook=hook,
+                seconds=round(seconds, 4),
+                rss_mb=rss,
+                rss_change_mb=None if rss is None else rss - rss_before,
+                peak_rss_mb=peak,
+            )
+            if model is not None:
+                added = [n for n in model.component_map() if n not in before]
+                step["components_added"] = len(added)
+                for name in added:
+                    self.component_module[name] = module_name
+            self.steps.append(step)
+
+    def wrap(self, module, hook):
+        # unwrap functions left over from a model built earlier in this process
+        func = getattr(module, hook)
+        func = getattr(func, "unprofiled", func)
+        profile = self
+        defines = hook in {"define_components", "define_dynamic_components"}
+
+        def profiled(*args, **kwargs):
+            return profile.measure(
+                module.__name__,
+                hook,
+                func,
+                args,
+                kwargs,
+                model=args[0] if defines else None,
+            )
+
+        profiled.unprofiled = func
+        setattr(module, hook, profiled)
+
+    def wrap_create_instance(self, model):
+        """
+        Time construction of the whole instance and of each component, using
+        the construction timers that Pyomo reports to the
+        pyomo.common.timing.construction logger.
+        """
+        create_instance = model.create_instance
+        profile = self
+
+        def profiled_create_instance(*args, **kwargs):
+            logger = logging.getLogger("pyomo.common.timing.construction")
+            handler = ConstructionHandler(profile)
+            old_level, old_propagate = logger.level, logger.propagate
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            logger.addHandler(handler)
+            try:
+                instance = profile.measure(
+                    "(model)", "create_instance", create_instance, args, kwargs
+                )
+            finally:
+                logger.removeHandler(handler)
+                logger.setLevel(old_level)
+                logger.propagate = old_propagate
+            instance.build_profile = profile
+            return instance
+
+        model.create_instance = profiled_create_instance
+
+    def report(self):
+        """Return the profile as a dict that can be saved as JSON."""
+        modules = {}
+        for step in self.steps:
+            m = modules.setdefault(
+                step["module"],
+                dict(module=step["module"], seconds=0.0, construct_seconds=0.0),
+            )
+            m[step["hook"] + "_seconds"] = step["seconds"]
+            if step["hook"] != "create_instance":
+                m["seconds"] += step["seconds"]
+        components = sorted(self.components, key=lambda c: -c["seconds"])
+        for c in components:
+            c["module"] = self.component_module.get(c["name"])
+            if c["module"] is not None:
+                m = modules[c["module"]]
+                m["construct_seconds"] += c["seconds"]
+                m["construct_rows"] = m.get("construct_rows", 0) + (c["rows"] or 0)
+                m["seconds"] += c["seconds"]
+        for m in modules.values():
+            m["seconds"] = round(m["seconds"], 4)
+            m["construct_seconds"] = round(m["construct_seconds"], 4)
+        return dict(
+            peak_rss_mb=memory_mb()[1],
+            steps=self.steps,
+            modules=sorted(modules.values(), key=lambda m: -m["seconds"]),
+            components=components,
+        )
+
+
+class ConstructionHandler(logging.Handler):
+    """Collect Pyomo's component construction timers."""
+
+    def __init__(self, profile):
+        logging.Handler.__init__(self, level=logging.INFO)
+        self.profile = profile
+
+    def emit(self, record):
+        obj = getattr(record.msg, "obj", None)
+        if obj is None or not hasattr(obj, "ctype"):
+            return
+        try:
+            rows = len(obj) if obj.is_indexed() else 1
+        except TypeError:
+            rows = None
+        self.profile.components.append(
+            dict(
+                name=obj.name,
+                type=obj.ctype.__name__,
+                seconds=round(record.msg.timer, 4),
+                rows=rows,
+            )
+        )
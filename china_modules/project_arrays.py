@@ -0,0 +1,139 @@
+"""
+Per-project attributes of the China modules as NumPy arrays.
+
+The China modules add attributes to each generation project (e.g.,
+gen_water_basin and gen_cooling_water_m3_per_mwh for 'water_limits' and
+gen_is_re_connect for 'mixed_strategy') and group or filter the projects by
+them and by core attributes such as gen_load_zone. With tens of thousands of
+projects, looking up each value with m.param[g] in the construction loops
+takes most of the construction time of these modules.
+
+Instead, each project gets a dense integer id (its position in
+GENERATION_PROJECTS), and the values of a Param indexed by project are read
+once, in bulk, into an array in id order:
+
+  * `numbers` and `flags` return float and boolean arrays, and `flagged`
+    the set of projects with a true flag;
+  * `codes` returns the position of each project's value in a list of
+    categories (e.g., the water basins or load zones), or -1;
+  * `groups` lists the projects with each code, which replaces a pass
+    through the projects that appends each one to a dict of lists.
+
+The arrays are built when they are first needed while the model is
+constructed, and kept with the model (see `get_project_arrays`). The Params
+must not change after that, which holds for the immutable Params used here.
+
+This module is used by the modules above, so it does not need to be listed in
+modules.txt.
+"""
+
+import numpy as np
+import pandas as pd
+from pyomo.environ import Param
+
+
+def get_project_arrays(m):
+    """Return the ProjectArrays of model m, creating it on the first call."""
+    if not hasattr(m, "_project_arrays"):
+        m._project_arrays = ProjectArrays(m.GENERATION_PROJECTS)
+    return m._project_arrays
+
+
+class ProjectArrays(object):
+    """
+    Dense integer ids for a list of projects, and the values of Params
+    indexed by project as arrays in id order.
+    """
+
+    def __init__(self, projects):
+        self.projects = list(projects)
+        self.index = pd.Index(self.projects)
+        self._arrays = {}
+
+    def ids(self, gens):
+        """Return an array of the ids of gens (-1 for any unknown project)."""
+        return self.index.get_indexer(list(gens))
+
+    def mask(self, gens):
+        """
+        Return a boolean array that is True for the ids of gens. Raises
+        KeyError if any of gens is not a known project.
+        """
+        gens = list(gens)
+        ids = self.ids(gens)
+        if (ids < 0).any():
+            unknown = [g for g, i in zip(gens, ids.tolist()) if i < 0]
+            raise KeyError(
+                f"Unknown project(s): {', '.join(map(str, unknown[:5]))}"
+                + (", ..." if len(unknown) > 5 else "")
+            )
+        result = np.zeros(len(self.projects), dtype=bool)
+        result[ids] = True
+        return result
+
+    def values(self, param):
+        """
+        Return an object array of the values of param for each project,
+        reading the values Pyomo stores and filling in the default for the
+        rest.
+        """
+        key = ("values", param.name)
+        if key not in self._arrays:
+            data = pd.Series(param.extract_values_sparse(), dtype=object)
+            data = data.reindex(self.index)
+            missing = data.isna().to_numpy()
+            if missing.any():
+                default = param.default()
+                if default is Param.NoValue:
+                    examples = ", ".join(map(str, data.index[missing][:5]))
+                    raise ValueError(
+                        f"No value of {param.name} is given for "
+                        f"{missing.sum()} project(s) ({examples})."
+                    )
+                if np.isscalar(default):
+                    data[missing] = default
+                else:
+                    # e.g., a default rule
+                    data[missing] = [param[g] for g in data.index[missing]]
+            self._arrays[key] = data.to_numpy()
+        return self._arrays[key]
+
+    def numbers(self, param):
+        """Return a float array of the values of param for each project."""
+        key = ("numbers", param.name)
+        if key not in self._arrays:
+            self._arrays[key] = self.values(param).astype(float)
+        return self._arrays[key]
+
+    def flags(self, param):
+        """Return a boolean array of the values of param for each project."""
+        key = ("flags", param.name)
+        if key not in self._arrays:
+            self._arrays[key] = self.values(param).astype(bool)
+        return self._arrays[key]
+
+    def flagged(self, param):
+        """Return the set of projects for which the value of param is true."""
+        key = ("flagged", param.name)
+        if key not in self._arrays:
+            flags = self.flags(param)
+            self._arrays[key] = {g for g, f in zip(self.projects, flags.tolist()) if f}
+        return self._arrays[key]
+
+    def codes(self, param, categories):
+        """
+        Return an integer array with the position in categories of the value
+        of param for each project, or -1 if it is not one of them.
+        """
+        return pd.Index(list(categories)).get_indexer(self.values(param))
+
+    def groups(self, codes, count):
+        """
+        Return a list with the projects whose code is 0, 1, ... count - 1, in
+        id order. Projects with a negative code are left out, so codes can be
+        combined with a filter with np.where(keep, codes, -1).
+        """
+        order = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[order], np.arange(count + 1)).tolist()
+        projects = [self.projects[i] for i in order.tolist()]
+        return [projects[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
@@ -9,9 +9,16 @@ column in 'load_zone.csv'.
 """
 
 from pyomo.environ import *
-import os, collections
+import os
 
-dependencies = "switch_model.generators.extensions.storage"
+from . import charge_limit, sparse_rows, zone_totals
+
+dependencies = "switch_model.generators.extensions.storage", "china_modules.zone_totals"
+
+
+def define_arguments(argparser):
+    charge_limit.define_arguments(argparser)
+    sparse_rows.define_arguments(argparser)
 
 
 def define_components(mod):
@@ -27,51 +34,33 @@ def define_components(mod):
         doc="only include those zones which should be constrained",
     )
 
+    # zone/period sets for central batteries and renewables, and
+    # RenewableDispatchZone
+    zone_totals.define_components(mod)
+
     # Summarize battery storage charging
-    def battery_rule(m, z, t):
-        # Construct and cache a set for summation as needed
-        if not hasattr(m, "Battery_Storage_Central_Charge_Summation_dict"):
-            m.Battery_Storage_Central_Charge_Summation_dict = collections.defaultdict(
-                set
+    def BatteryCentralCharge_rule(m, z, t):
+        if sparse_rows.use_matrix_construction(m):
+            return sparse_rows.pop_row(
+                m,
+                "_BatteryCentralCharge_rows_dict",
+                lambda: zone_totals.zone_timepoint_rows(
+                    m, m.ChargeStorage, zone_totals.central_batteries(m)
+                ),
+                (z, t),
             )
-            for g, t2 in m.STORAGE_GEN_TPS:
-                if m.gen_tech[g] == "Battery_Storage" and not m.gen_is_distributed[g]:
-                    # only add battery in central
-                    z2 = m.gen_load_zone[g]
-                    m.Battery_Storage_Central_Charge_Summation_dict[z2, t2].add(g)
-        # Use pop to free memory
-        relevant_projects = m.Battery_Storage_Central_Charge_Summation_dict.pop(
-            (z, t), {}
+        return sum(
+            m.ChargeStorage[g, t]
+            for g in m.CENTRAL_BATTERIES_IN_ZONE_PERIOD[z, m.tp_period[t]]
         )
-        return sum(m.ChargeStorage[g, t] for g in relevant_projects)
 
     mod.BatteryCentralCharge = Expression(
-        mod.LOAD_ZONES, mod.TIMEPOINTS, rule=battery_rule
+        mod.LOAD_ZONES, mod.TIMEPOINTS, rule=BatteryCentralCharge_rule
     )
 
-    mod.Renewable_GEN_TPS = Set(
-        dimen=2,
-        initialize=lambda m: (
-            (g, tp) for g in m.VARIABLE_GENS for tp in m.TPS_FOR_GEN[g]
-        ),
-    )
-
-    def rule(m, z, t):
-        if not hasattr(m, "Renewable_Gen_Summation_dict"):
-            m.Renewable_Gen_Summation_dict = collections.defaultdict(set)
-            for g, t2 in m.Renewable_GEN_TPS:
-                z2 = m.gen_load_zone[g]
-                m.Renewable_Gen_Summation_dict[z2, t2].add(g)
-        # Use pop to free memory
-        relevant_projects = m.Renewable_Gen_Summation_dict.pop((z, t), {})
-        return sum(m.DispatchGen[g, t] for g in relevant_projects)
-
-    mod.RenewableDispatchZone = Expression(mod.LOAD_ZONES, mod.TIMEPOINTS, rule=rule)
-
-    mod.Charge_Storage_Upper_Limit_Zone = Constraint(
-        mod.CONSTRAINED_ZONE_TIMEPOINTS,
-        rule=lambda m, z, t: m.BatteryCentralCharge[z, t]
-        <= m.RenewableDispatchZone[z, t],
+    # charging limit, optionally added lazily (see charge_limit.py)
+    charge_limit.define_components(
+        mod, "CONSTRAINED_ZONE_TIMEPOINTS", "BatteryCentralCharge"
     )
 
 
@@ -83,3 +72,7 @@ def load_inputs(mod, switch_data, inputs_dir):
         index=mod.LOAD_ZONES,
         param=(mod.zone_is_constrained),
     )
+
+
+def post_solve(instance, outdir):
+    charge_limit.write_outputs(instance, outdir)
@@ -0,0 +1,304 @@
+"""
+Select representative days for each investment period to control model size.
+
+This script builds the full-year hourly load of every load zone from the
+provincial load profiles in `database/` (see
+`compile_inputs.zone_demand_mw`), optionally adds hourly renewable
+availability, and clusters the days of each period's representative year into
+a given number of groups. One actual day (the medoid) is kept from each group
+and weighted by the number of days it represents, so the weights of each
+period add up to the length of the period. The selected days are written to
+timeseries.csv, timepoints.csv and loads.csv.
+
+Fewer days give a smaller LP at the cost of a coarser picture of the year;
+the script reports how much of the annual energy and the peak load of each
+zone the selected days reproduce, which can be used to choose --days.
+
+Two clustering methods are available: 'kmedoids' (Voronoi iteration from a
+k-medoids++ start, with a fixed seed) and 'hierarchical' (Ward linkage, with
+the member closest to each cluster mean as its medoid).
+
+The representative year for a period is the middle year of the period, e.g.,
+2025 for 2023-2027. Note that the provincial load profiles in the database
+give one daily shape per province and a monthly scaling, so on their own they
+distinguish at most 12 kinds of day; renewable availability (or
+--include-peak-day) is needed to make use of more days than that.
+
+The optional renewable profile file has columns month, day and hour (0-23)
+and one numeric column per resource (e.g., Anhui_wind, Anhui_solar), giving
+typical-year availability that is used as additional clustering features.
+
+Usage:
+    python -m china_modules.representative_days --days 24 \\
+        [--method kmedoids|hierarchical] [--renewable-profiles file.csv]
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+from scipy.cluster.hierarchy import fcluster, linkage
+from scipy.spatial.distance import cdist
+
+from .compile_inputs import zone_demand_mw
+
+
+def kmedoids(X, k, seed=0, max_iter=100):
+    """
+    Cluster the rows of X into k groups. Returns (medoids, labels), where
+    medoids are row indices of X and labels give the position in medoids of
+    the cluster each row belongs to.
+    """
+    rng = np.random.default_rng(seed)
+    dist = cdist(X, X)
+    # k-medoids++ initialization
+    medoids = [int(rng.integers(len(X)))]
+    for _ in range(1, k):
+        d2 = dist[:, medoids].min(axis=1) ** 2
+        if d2.sum() == 0:
+            # all remaining days duplicate an existing medoid
+            break
+        medoids.append(int(rng.choice(len(X), p=d2 / d2.sum())))
+    medoids = np.array(medoids)
+    for _ in range(max_iter):
+        labels = dist[:, medoids].argmin(axis=1)
+        new_medoids = medoids.copy()
+        for c in range(len(medoids)):
+            members = np.flatnonzero(labels == c)
+            within = dist[np.ix_(members, members)].sum(axis=1)
+            new_medoids[c] = members[within.argmin()]
+        if (new_medoids == medoids).all():
+            break
+        medoids = new_medoids
+    return medoids, dist[:, medoids].argmin(axis=1)
+
+
+def hierarchical(X, k):
+    """
+    Cluster the rows of X into (at most) k groups with Ward linkage. Returns
+    (medoids, labels) as for kmedoids.
+    """
+    if len(X) == 1:
+        return np.array([0]), np.array([0])
+    clusters = fcluster(linkage(X, method="ward"), t=k, criterion="maxclust")
+    medoids = []
+    labels = np.empty(len(X), dtype=int)
+    for c, cluster in enumerate(np.unique(clusters)):
+        members = np.flatnonzero(clusters == cluster)
+        center = X[members].mean(axis=0)
+        medoids.append(members[((X[members] - center) ** 2).sum(axis=1).argmin()])
+        labels[members] = c
+    return np.array(medoids), labels
+
+
+def day_features(load, renewables, days, hours):
+    """
+    Return a matrix with one row per day: zone loads (and renewable
+    availability, if given) at each hour, each column scaled to unit
+    variance so no zone or resource dominates the distances.
+    """
+    # load has one row per zone and one column per hour of the year
+    features = [load.reshape(load.shape[0], len(days), 24)[:, :, hours]]
+    if renewables is not None:
+        features.append(
+            renewables.reshape(renewables.shape[0], len(days), 24)[:, :, hours]
+        )
+    X = np.concatenate(features).transpose(1, 0, 2).reshape(len(days), -1)
+    std = X.std(axis=0)
+    keep = std > 0
+    return (X[:, keep] - X[:, keep].mean(axis=0)) / std[keep]
+
+
+def select_days(options):
+    """
+    Select representative days for every period and return the timeseries,
+    timepoints and loads tables, plus a table of accuracy statistics.
+    """
+    dirs = {"database": options.database_dir, "inputs": options.inputs_dir}
+
+    def read(kind, filename):
+        return pd.read_csv(
+            os.path.join(dirs[kind], filename), na_values=".", encoding="utf-8-sig"
+        )
+
+    zones = list(read("inputs", "load_zones.csv")["LOAD_ZONE"])
+    periods = read("inputs", "periods.csv")
+    if options.renewable_profiles:
+        profiles = pd.read_csv(options.renewable_profiles).set_index(
+            ["month", "day", "hour"]
+        )
+    hours = np.arange(0, 24, options.hours_per_timepoint)
+
+    timeseries, timepoints, loads, stats = [], [], [], []
+    for p in periods.itertuples():
+        year = (p.period_start + p.period_end) // 2
+        stamps = pd.date_range(f"{year}-01-01", f"{year}-12-31 23:00", freq="h")
+        days = stamps[::24]
+        load = zone_demand_mw(read, options, zones, stamps)
+        renewables = None
+        if options.renewable_profiles:
+            # typical-year profiles have no Feb 29; reuse Feb 28 in leap years
+            day_of_month = np.where(
+                (stamps.month == 2) & (stamps.day == 29), 28, stamps.day
+            )
+            key = pd.MultiIndex.from_arrays([stamps.month, day_of_month, stamps.hour])
+            renewables = profiles.reindex(key).values.T
+        X = day_features(load, renewables, days, hours)
+
+        if options.method == "kmedoids":
+            medoids, labels = kmedoids(X, options.days, seed=options.seed)
+        else:
+            medoids, labels = hierarchical(X, options.days)
+        weights = np.bincount(labels, minlength=len(medoids)).astype(float)
+        if options.include_peak_day:
+            # keep the day with the highest system load as its own timeseries
+            peak = load.sum(axis=0).reshape(len(days), 24).max(axis=1).argmax()
+            if peak not in medoids:
+                weights[labels[peak]] -= 1
+                medoids = np.append(medoids, peak)
+                weights = np.append(weights, 1.0)
+
+        # days in the period represented by each selected day
+        scale = weights * (p.period_end - p.period_start + 1) * 365.25 / len(days)
+        daily = load.reshape(len(zones), len(days), 24)
+        for d in np.argsort(medoids):
+            day = days[medoids[d]]
+            ts = day.strftime("%Y.%m.%d")
+            timeseries.append(
+                (
+                    ts,
+                    p.INVESTMENT_PERIOD,
+                    options.hours_per_timepoint,
+                    len(hours),
+                    scale[d],
+                )
+            )
+            for h in hours:
+                tp = f"{ts}.{h:02d}"
+                timepoints.append((tp, day.strftime(f"%Y-%m-%d_{h:02d}:00"), ts))
+                for i, z in enumerate(zones):
+                    loads.append((z, tp, daily[i, medoids[d], h]))
+
+        # compare the selected days with the full year
+        sampled = daily[:, medoids][:, :, hours]
+        represented = (sampled.sum(axis=2) * options.hours_per_timepoint) @ weights
+        for i, z in enumerate(zones):
+            stats.append(
+                (
+                    p.INVESTMENT_PERIOD,
+                    z,
+                    represented[i] / load[i].sum(),
+                    sampled[i].max() / load[i].max(),
+                )
+            )
+
+    return (
+        pd.DataFrame(
+            timeseries,
+            columns=[
+                "TIMESERIES",
+                "ts_period",
+                "ts_duration_of_tp",
+                "ts_num_tps",
+                "ts_scale_to_period",
+            ],
+        ),
+        pd.DataFrame(timepoints, columns=["timepoint_id", "timestamp", "timeseries"]),
+        pd.DataFrame(loads, columns=["load_zone", "TIMEPOINT", "zone_demand_mw"]),
+        pd.DataFrame(
+            stats, columns=["period", "load_zone", "energy_ratio", "peak_ratio"]
+        ),
+    )
+
+
+def define_arguments(argparser):
+    argparser.add_argument(
+        "--database-dir",
+        default="database",
+        help="Directory with the SWITCH-China database tables (default: database).",
+    )
+    argparser.add_argument(
+        "--inputs-dir",
+        default="inputs",
+        help="Directory with periods.csv and load_zones.csv (default: inputs).",
+    )
+    argparser.add_argument(
+        "--outputs-dir",
+        default=None,
+        help="Directory to write timeseries.csv, timepoints.csv and loads.csv "
+        "to (default: the inputs directory).",
+    )
+    argparser.add_argument(
+        "--days",
+        type=int,
+        default=12,
+        help="Number of representative days per period (default: 12).",
+    )
+    argparser.add_argument(
+        "--method",
+        choices=["kmedoids", "hierarchical"],
+        default="kmedoids",
+        help="Clustering method (default: kmedoids).",
+    )
+    argparser.add_argument(
+        "--hours-per-timepoint",
+        type=int,
+        default=4,
+        choices=[1, 2, 3, 4, 6, 8, 12, 24],
+        help="Length of each timepoint in hours (default: 4).",
+    )
+    argparser.add_argument(
+        "--renewable-profiles",
+        default=None,
+        help="Optional CSV of hourly typical-year renewable availability "
+        "(columns month, day, hour and one column per resource).",
+    )
+    argparser.add_argument(
+        "--include-peak-day",
+        action="store_true",
+        help="Add the day with the highest system load as an extra timeseries "
+        "with a weight of one day per year.",
+    )
+    argparser.add_argument(
+        "--demand-scenario",
+        default="Scenario_3",
+        help="Demand scenario column prefix in "
+        "china_electricity_demand_projection.csv (default: Scenario_3).",
+    )
+    argparser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Random seed for k-medoids initialization (default: 0).",
+    )
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Select representative days and write timeseries, "
+        "timepoints and loads for Switch."
+    )
+    define_arguments(parser)
+    options = parser.parse_args(args)
+    outputs_dir = options.outputs_dir or options.inputs_dir
+
+    timeseries, timepoints, loads, stats = select_days(options)
+    os.makedirs(outputs_dir, exist_ok=True)
+    timeseries.to_csv(os.path.join(outputs_dir, "timeseries.csv"), index=False)
+    timepoints.to_csv(os.path.join(outputs_dir, "timepoints.csv"), index=False)
+    loads.to_csv(os.path.join(outputs_dir, "loads.csv"), index=False)
+
+    print(
+        f"Wrote {len(timeseries)} timeseries and {len(timepoints)} timepoints "
+        f"to {outputs_dir}."
+    )
+    summary = stats.groupby("period")[["energy_ratio", "peak_ratio"]].agg(
+        ["min", "max"]
+    )
+    print("Share of annual energy and peak load reproduced by the selected days:")
+    print(summary.to_string(float_format=lambda v: f"{v:.3f}"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""
+Reuse the outputs of an earlier run instead of solving the same model again.
+
+Scenarios are often run again with nothing changed, e.g., when a notebook is
+re-executed or a batch is restarted after one job failed. This script
+fingerprints the whole run and keeps a copy of the outputs of each completed
+run under its fingerprint. When a run with the same fingerprint is requested
+again, the saved outputs are copied to the outputs directory and the model
+is neither built nor solved.
+
+Use it in place of `switch solve`, with the usual arguments after `--`:
+
+    python -m china_modules.result_cache -- --inputs-dir inputs --solver gurobi
+
+As with `switch solve`, arguments in options.txt are used too. The
+fingerprint is a sha256 hash of
+  * the contents of every file in the inputs directory,
+  * the module list and the source code of every module in the packages of
+    those modules (including China helper modules that are not listed in
+    modules.txt),
+  * the solver and its options, and all other command-line options except
+    those that don't change the outputs (IGNORED_OPTIONS), and
+  * the Python, Pyomo and Switch versions.
+The solver's threads setting (see batch.SOLVER_THREADS_OPTIONS) is left out
+of the fingerprint, since the batch runner sets it from the cores that
+happen to be free.
+
+Only the files that the run wrote in the outputs directory are saved, and
+only if the solver reports an optimal solution. Saved runs are kept in
+--cache-dir (default: 'result_cache' next to the inputs directory); they
+can be removed by deleting that directory. Use --refresh to solve again and
+replace the saved outputs.
+
+china_modules.batch uses this script for every scenario when given
+--result-cache-dir.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import pyomo
+from pyomo.opt import TerminationCondition
+import switch_model
+import switch_model.solve
+from switch_model.utilities import create_model
+
+from .batch import SOLVER_THREADS_OPTIONS
+from .instance_cache import input_hashes, source_hashes
+
+# increase when the layout of saved runs changes
+CACHE_FORMAT = 1
+MANIFEST_FILE = "result_cache_manifest.json"
+
+# options that don't change the outputs of a run
+IGNORED_OPTIONS = {
+    "debug",
+    "full_traceback",
+    "include_exclude_modules",
+    "input_cache_dir",
+    "inputs_dir",
+    "instance_cache_dir",
+    "instance_cache_size_mb",
+    "interact",
+    "interact_color",
+    "keepfiles",
+    "log_level",
+    "log_run_to_file",
+    "logs_dir",
+    "module_list",
+    "no_input_cache",
+    "no_instance_cache",
+    "outputs_dir",
+    "tee",
+    "tempdir",
+    "verbose",
+}
+
+
+def run_fingerprint(model, cache_dir):
+    """
+    Return the fingerprint of a run of model (a model defined with the run's
+    arguments, but not loaded) and a description of what it covers.
+    """
+    options = vars(model.options)
+    run_options = {k: v for k, v in options.items() if k not in IGNORED_OPTIONS}
+    solver_options = switch_model.solve.options_string_to_dict(
+        options.get("solver_options_string") or ""
+    )
+    solver_options.pop(SOLVER_THREADS_OPTIONS.get(options.get("solver")), None)
+    run_options["solver_options_string"] = solver_options
+    description = {
+        "format": CACHE_FORMAT,
+        "python": sys.version,
+        "pyomo": pyomo.version.version,
+        "switch": switch_model.__version__,
+        "inputs": input_hashes(model.options.inputs_dir, cache_dir),
+        "modules": list(model.module_list),
+        "sources": source_hashes(model.module_list),
+        "options": run_options,
+    }
+    key = hashlib.sha256(
+        json.dumps(description, sort_keys=True, default=repr).encode()
+    ).hexdigest()
+    return key, description
+
+
+def list_files(directory):
+    """Return {relative path: (size, modification time)} for files in directory."""
+    files = {}
+    for dirpath, dirnames, filenames in os.walk(directory):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            stat = os.stat(path)
+            files[os.path.relpath(path, directory)] = (stat.st_size, stat.st_mtime_ns)
+    return files
+
+
+def copy_files(source_dir, dest_dir, files):
+    for name in files:
+        dest = os.path.join(dest_dir, name)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        shutil.copy2(os.path.join(source_dir, name), dest)
+
+
+def restore_run(entry_dir, outputs_dir):
+    """Copy the outputs saved in entry_dir to outputs_dir."""
+    with open(os.path.join(entry_dir, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    copy_files(entry_dir, outputs_dir, manifest["files"])
+    return manifest
+
+
+def save_run(entry_dir, outputs_dir, files, description, switch_args):
+    """
+    Save copies of files from outputs_dir in entry_dir. The copies are made
+    in a temporary directory and then renamed into place, so runs in
+    parallel can share a cache.
+    """
+    parent = os.path.dirname(entry_dir)
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=parent)
+    copy_files(outputs_dir, tmp_dir, files)
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), "w") as f:
+        json.dump(
+            {"files": sorted(files), "args": switch_args, "fingerprint": description},
+            f,
+            indent=2,
+            default=repr,
+        )
+    if os.path.isdir(entry_dir):
+        # replaced with --refresh, or saved by another run in the meantime
+        shutil.rmtree(entry_dir, ignore_errors=True)
+    try:
+        os.rename(tmp_dir, entry_dir)
+    except OSError:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def run_cached(options, switch_args):
+    """
+    Restore the outputs of an earlier identical run, or solve the model and
+    save its outputs. Returns True if the outputs were restored.
+    """
+    switch_args = switch_model.solve.get_option_file_args(extra_args=switch_args)
+    # define the model (quick) to get the modules and all their options
+    model = create_model(switch_model.solve.get_module_list(switch_args), switch_args)
+    cache_dir = options.cache_dir
+    if cache_dir is None:
+        cache_dir = os.path.join(
+            os.path.dirname(os.path.abspath(model.options.inputs_dir)),
+            "result_cache",
+        )
+    os.makedirs(cache_dir, exist_ok=True)
+    key, description = run_fingerprint(model, cache_dir)
+    entry_dir = os.path.join(cache_dir, key[:2], key)
+    outputs_dir = model.options.outputs_dir
+
+    if os.path.isdir(entry_dir) and not options.refresh:
+        manifest = restore_run(entry_dir, outputs_dir)
+        print(
+            f"Restored {len(manifest['files'])} output files from identical run "
+            f"{key[:12]} to {outputs_dir}; the model was not solved again."
+        )
+        return True
+
+    before = list_files(outputs_dir) if os.path.isdir(outputs_dir) else {}
+    instance = switch_model.solve.main(args=switch_args)
+    results = getattr(instance, "last_results", None)
+    if (
+        results is None
+        or results.solver.termination_condition != TerminationCondition.optimal
+    ):
+        print("Outputs were not saved in the result cache (no optimal solution).")
+        return False
+    after = list_files(outputs_dir)
+    written = [name for name, stat in after.items() if before.get(name) != stat]
+    save_run(entry_dir, outputs_dir, written, description, switch_args)
+    print(f"Saved {len(written)} output files in the result cache as {key[:12]}.")
+    return False
+
+
+def define_arguments(argparser):
+    argparser.add_argument(
+        "--cache-dir",
+        default=None,
+        help="Directory for saved runs (default: 'result_cache' next to the "
+        "inputs directory).",
+    )
+    argparser.add_argument(
+        "--refresh",
+        action="store_true",
+        default=False,
+        help="Solve the model even if an identical run was saved, and replace "
+        "the saved outputs.",
+    )
+
+
+def main(args=None):
+    if args is None:
+        args = sys.argv[1:]
+    # arguments after "--" are passed to switch solve
+    if "--" in args:
+        split = args.index("--")
+        args, switch_args = args[:split], args[split + 1 :]
+    else:
+        switch_args = []
+    parser = argparse.ArgumentParser(
+        description="Solve a Switch model, or restore the outputs of an "
+        "identical earlier run."
+    )
+    define_arguments(parser)
+    options = parser.parse_args(args)
+    run_cached(options, switch_args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,369 @@
+"""
+Solve the investment periods a few at a time (myopic or rolling-horizon
+planning) instead of as one perfect-foresight model.
+
+The periods in periods.csv are split into windows of --window-size periods,
+starting every --step periods. Each window is solved as a separate Switch
+model, in its own process, with an inputs directory that holds only the
+window's periods: the rows of period-indexed tables (timeseries, timepoints,
+loads, capacity factors, fuel costs, carbon caps, capacity plans and limits
+for china_modules.tech_plans, basin budgets for china_modules.water_limits,
+etc.) for other periods are left out, so each window meets the plans,
+limits and water budgets of its own periods. Peak memory is then set by the
+largest window instead of the whole study.
+
+After a window is solved, the capacity it built in its first --step periods
+is committed and carried into the next window:
+  * generation (BuildGen, plus BuildStorageEnergy for storage) is added to
+    gen_build_predetermined.csv with the period as its build year, and the
+    matching rows of gen_build_costs.csv are kept, so later windows still pay
+    for it and retire it at the end of its life (builds that are already in
+    gen_build_predetermined.csv are kept as they are, and new rows get the
+    project's gen_can_retire_early setting);
+  * new transmission (BuildTx) is added to existing_trans_cap in
+    transmission_lines.csv and new local T&D (BuildLocalTD) to
+    existing_local_td in load_zones.csv. Switch treats these as sunk, so
+    their capital cost is only counted in the window that built them.
+Builds in the later periods of a window are decided again by the next
+window, which sees further ahead. With the default --window-size 1 the
+solution is fully myopic.
+
+The inputs for each window are written to <outputs-dir>/<window>/inputs and
+its outputs to <outputs-dir>/<window>, with a log in <outputs-dir>/logs. A
+summary of the windows is saved in <outputs-dir>/rolling_horizon.csv.
+
+Usage:
+    python -m china_modules.rolling_horizon --window-size 2 --step 1 \\
+        -- --solver gurobi --inputs-dir inputs
+"""
+
+import argparse
+import csv
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+import pandas as pd
+
+# columns that tie rows of each input table to periods, and whether they hold
+# periods, timeseries, timepoints or build years
+PERIOD_COLUMNS = {
+    "periods.csv": ("INVESTMENT_PERIOD", "period"),
+    "timeseries.csv": ("ts_period", "period"),
+    "timepoints.csv": ("timeseries", "timeseries"),
+    "loads.csv": ("TIMEPOINT", "timepoint"),
+    "variable_capacity_factors.csv": ("timepoint", "timepoint"),
+    "hydro_timeseries.csv": ("timeseries", "timeseries"),
+    "capacity_plans.csv": ("period", "period"),
+    "tech_capacity_plans.csv": ("period", "period"),
+    "total_capacity_limits.csv": ("period", "period"),
+    "carbon_policies.csv": ("PERIOD", "period"),
+    "fuel_cost.csv": ("period", "period"),
+    "fuel_supply_curves.csv": ("period", "period"),
+    "water_limit_annual.csv": ("PERIOD", "period"),
+    "zone_coincident_peak_demand.csv": ("PERIOD", "period"),
+    "gen_build_costs.csv": ("build_year", "build_year"),
+}
+
+# capacity below this (MW or MWh) is not carried forward
+MIN_CAPACITY = 1e-6
+
+SUMMARY_COLUMNS = [
+    "window",
+    "periods",
+    "committed_periods",
+    "status",
+    "wall_s",
+    "total_cost",
+    "log",
+]
+
+
+def read_table(path):
+    """Read an input table as text, so values are written back unchanged."""
+    return pd.read_csv(path, dtype=str, keep_default_na=False, encoding="utf-8-sig")
+
+
+def to_float(text):
+    """Convert a table value to a float, treating blank or '.' as zero."""
+    return 0.0 if text in {"", "."} else float(text)
+
+
+def write_table(df, path):
+    df.to_csv(path, index=False)
+
+
+def read_output(path):
+    """Read a Switch output table as (index columns..., value) tuples."""
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        next(reader)
+        return [tuple(row[:-1]) + (float(row[-1]),) for row in reader]
+
+
+def make_windows(periods, window_size, step):
+    """
+    Return a list of (window periods, committed periods). Each window commits
+    its first `step` periods, except the last, which commits all of them.
+    """
+    windows = []
+    for start in range(0, len(periods), step):
+        window = periods[start : start + window_size]
+        if start + window_size >= len(periods):
+            windows.append((window, window))
+            break
+        windows.append((window, window[:step]))
+    return windows
+
+
+class WindowState(object):
+    """Capacity committed by earlier windows."""
+
+    def __init__(self):
+        self.gen = {}  # (project, period) -> MW
+        self.storage_energy = {}  # (project, period) -> MWh
+        self.tx = {}  # line -> MW
+        self.local_td = {}  # zone -> MW
+
+    def commit(self, outputs_dir, periods):
+        """Add the builds for the given periods from a window's outputs."""
+        periods = set(periods)
+        for g, year, mw in read_output(os.path.join(outputs_dir, "BuildGen.csv")):
+            if year in periods:
+                self.gen[g, year] = mw
+        path = os.path.join(outputs_dir, "BuildStorageEnergy.csv")
+        if os.path.exists(path):
+            for g, year, mwh in read_output(path):
+                if year in periods:
+                    self.storage_energy[g, year] = mwh
+        for kind, filename in [("tx", "BuildTx.csv"), ("local_td", "BuildLocalTD.csv")]:
+            path = os.path.join(outputs_dir, filename)
+            if not os.path.exists(path):
+                continue
+            added = getattr(self, kind)
+            for key, year, mw in read_output(path):
+                if year in periods:
+                    added[key] = added.get(key, 0.0) + mw
+
+    def built_gens(self):
+        """Return the (project, period) builds large enough to carry forward."""
+        return [
+            k
+            for k, mw in self.gen.items()
+            if mw > MIN_CAPACITY or self.storage_energy.get(k, 0.0) > MIN_CAPACITY
+        ]
+
+
+def write_window_inputs(inputs_dir, window_dir, window, all_periods, state):
+    """Write the inputs for a window of periods to window_dir."""
+    os.makedirs(window_dir, exist_ok=True)
+    window = set(window)
+    tables = {}
+    for filename in os.listdir(inputs_dir):
+        path = os.path.join(inputs_dir, filename)
+        if not os.path.isfile(path):
+            continue
+        if filename.endswith(".csv"):
+            tables[filename] = read_table(path)
+        else:
+            shutil.copy2(path, os.path.join(window_dir, filename))
+
+    # timeseries and timepoints in the window
+    keep = {"period": window}
+    if "timeseries.csv" in tables:
+        ts = tables["timeseries.csv"]
+        keep["timeseries"] = set(ts.loc[ts["ts_period"].isin(window), "TIMESERIES"])
+    if "timepoints.csv" in tables:
+        tp = tables["timepoints.csv"]
+        keep["timepoint"] = set(
+            tp.loc[tp["timeseries"].isin(keep["timeseries"]), "timepoint_id"]
+        )
+
+    # generation built by earlier windows becomes predetermined; builds that
+    # were already predetermined (BuildGen is fixed for them) are left as they
+    # are, and new rows get the project's gen_can_retire_early setting, if it
+    # has one
+    pre = tables["gen_build_predetermined.csv"]
+    base = set(zip(pre["GENERATION_PROJECT"], pre["build_year"]))
+    built = [k for k in state.built_gens() if k not in base]
+    if built:
+        new = pd.DataFrame(
+            {
+                "GENERATION_PROJECT": [g for g, y in built],
+                "build_year": [y for g, y in built],
+                "build_gen_predetermined": [repr(state.gen[k]) for k in built],
+            }
+        )
+        if "gen_can_retire_early" in pre.columns:
+            retire_early = pre.groupby("GENERATION_PROJECT")[
+                "gen_can_retire_early"
+            ].first()
+            new["gen_can_retire_early"] = (
+                new["GENERATION_PROJECT"].map(retire_early).fillna(".").values
+            )
+        if any(k in state.storage_energy for k in built):
+            if "build_gen_energy_predetermined" not in pre.columns:
+                pre["build_gen_energy_predetermined"] = "."
+            new["build_gen_energy_predetermined"] = [
+                repr(state.storage_energy[k]) if k in state.storage_energy else "."
+                for k in built
+            ]
+        tables["gen_build_predetermined.csv"] = pd.concat(
+            [pre, new], ignore_index=True
+        ).fillna(".")
+    predetermined = set(
+        zip(
+            tables["gen_build_predetermined.csv"]["GENERATION_PROJECT"],
+            tables["gen_build_predetermined.csv"]["build_year"],
+        )
+    )
+
+    for filename, df in tables.items():
+        if filename == "gen_build_costs.csv":
+            # keep costs for builds that can happen in this window or were
+            # made earlier
+            year = df["build_year"]
+            df = df[
+                year.isin(window)
+                | ~year.isin(all_periods)
+                | pd.Series(
+                    list(zip(df["GENERATION_PROJECT"], year)), index=df.index
+                ).isin(predetermined)
+            ]
+        elif filename in PERIOD_COLUMNS:
+            column, kind = PERIOD_COLUMNS[filename]
+            if column in df.columns:
+                df = df[df[column].isin(keep[kind])]
+        elif filename == "transmission_lines.csv" and state.tx:
+            df = df.copy()
+            df["existing_trans_cap"] = [
+                repr(to_float(cap) + state.tx.get(tx, 0.0))
+                for tx, cap in zip(df["TRANSMISSION_LINE"], df["existing_trans_cap"])
+            ]
+        elif filename == "load_zones.csv" and state.local_td:
+            df = df.copy()
+            df["existing_local_td"] = [
+                repr(to_float(cap) + state.local_td.get(z, 0.0))
+                for z, cap in zip(df["LOAD_ZONE"], df["existing_local_td"])
+            ]
+        write_table(df, os.path.join(window_dir, filename))
+
+
+def run_rolling_horizon(options, switch_args):
+    inputs_dir = options.inputs_dir
+    periods = list(
+        read_table(os.path.join(inputs_dir, "periods.csv"))["INVESTMENT_PERIOD"]
+    )
+    windows = make_windows(periods, options.window_size, options.step)
+    log_dir = os.path.join(options.outputs_dir, "logs")
+    os.makedirs(log_dir, exist_ok=True)
+    summary_path = os.path.join(options.outputs_dir, "rolling_horizon.csv")
+    state = WindowState()
+    summary = []
+
+    for window, committed in windows:
+        name = f"window_{window[0]}" + (f"_{window[-1]}" if len(window) > 1 else "")
+        window_outputs = os.path.join(options.outputs_dir, name)
+        window_inputs = os.path.join(window_outputs, "inputs")
+        write_window_inputs(inputs_dir, window_inputs, window, periods, state)
+        cmd = [
+            sys.executable,
+            "-m",
+            "switch_model.main",
+            "solve",
+            "--inputs-dir",
+            window_inputs,
+            "--outputs-dir",
+            window_outputs,
+        ] + switch_args
+        log_path = os.path.join(log_dir, f"{name}.log")
+        print(f"Solving {name} (periods {', '.join(window)})...")
+        start = time.time()
+        with open(log_path, "w") as log:
+            returncode = subprocess.call(cmd, stdout=log, stderr=subprocess.STDOUT)
+        wall_s = round(time.time() - start, 2)
+        row = dict(
+            window=name,
+            periods=" ".join(window),
+            committed_periods=" ".join(committed),
+            status="ok" if returncode == 0 else "failed",
+            wall_s=wall_s,
+            total_cost="",
+            log=log_path,
+        )
+        try:
+            with open(os.path.join(window_outputs, "total_cost.txt")) as f:
+                row["total_cost"] = float(f.read())
+        except (OSError, ValueError):
+            pass
+        summary.append(row)
+        with open(summary_path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=SUMMARY_COLUMNS)
+            writer.writeheader()
+            writer.writerows(summary)
+        if returncode != 0:
+            raise RuntimeError(
+                f"Window {name} could not be solved; see {log_path} for details."
+            )
+        state.commit(window_outputs, committed)
+        print(f"Solved {name} in {wall_s:.1f} s.")
+
+    print(f"Rolling-horizon solve complete. Summary saved in {summary_path}.")
+    return summary
+
+
+def define_arguments(argparser):
+    argparser.add_argument(
+        "--inputs-dir",
+        default="inputs",
+        help="Directory with the inputs for all periods (default: inputs).",
+    )
+    argparser.add_argument(
+        "--outputs-dir",
+        default="outputs",
+        help="Directory for the inputs, outputs and logs of each window "
+        "(default: outputs).",
+    )
+    argparser.add_argument(
+        "--window-size",
+        type=int,
+        default=1,
+        help="Number of periods solved together in each window (default: 1).",
+    )
+    argparser.add_argument(
+        "--step",
+        type=int,
+        default=None,
+        help="Number of periods committed by each window before moving on "
+        "(default: the window size, i.e., windows don't overlap).",
+    )
+
+
+def main(args=None):
+    if args is None:
+        args = sys.argv[1:]
+    # arguments after "--" are passed to switch solve for every window
+    if "--" in args:
+        split = args.index("--")
+        args, switch_args = args[:split], args[split + 1 :]
+    else:
+        switch_args = []
+    parser = argparse.ArgumentParser(
+        description="Solve a Switch model one window of periods at a time."
+    )
+    define_arguments(parser)
+    options = parser.parse_args(args)
+    if options.step is None:
+        options.step = options.window_size
+    if not 1 <= options.step <= options.window_size:
+        parser.error("--step must be between 1 and --window-size.")
+    for option in ["--inputs-dir", "--outputs-dir"]:
+        if option in switch_args:
+            parser.error(f"Give {option} before '--'; it is set for each window.")
+    run_rolling_horizon(options, switch_args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,12 @@
+"""
+Messages that identify solver errors, shared by the runners that start Switch
+(china_modules.batch reads them from job logs, china_modules.carbon_sweep
+from the errors raised in process).
+"""
+
+# errors raised by switch_model.solve when the model has no feasible solution
+# (the second one comes from appsi_* solvers)
+INFEASIBLE_MESSAGES = (
+    "Infeasible model",
+    "A feasible solution was not found",
+)
@@ -0,0 +1,104 @@
+"""
+Build linear expressions for the China modules from sparse coefficient arrays.
+
+With --matrix-construction, the water withdrawal totals in 'water_limits' and
+the zone totals of renewable dispatch and battery charging used by
+'mixed_strategy' and 're_connected_strategy' are assembled with NumPy: the
+terms of all rows are collected from the variable index in one pass, their
+coefficients are computed with array operations, and the terms are sorted
+into rows (compressed sparse row format). Each row is then attached to the
+model as a single LinearExpression built directly from its slice of the
+coefficient and variable arrays, which skips Pyomo's term-by-term expression
+construction. The constraints and expressions keep the same names and
+indexes, so duals, reporting and other modules work the same either way.
+
+The rows are built on the first call to the rule of the indexed component and
+popped as the component is constructed, following the 'construction
+dictionary' pattern used elsewhere in these modules (see `pop_row`).
+
+This module is used by the modules above, so it does not need to be listed in
+modules.txt.
+"""
+
+import numpy as np
+import pandas as pd
+from pyomo.core.expr import LinearExpression
+
+
+def define_arguments(argparser):
+    # several modules add this argument
+    if any("--matrix-construction" in a.option_strings for a in argparser._actions):
+        return
+    argparser.add_argument(
+        "--matrix-construction",
+        action="store_true",
+        default=False,
+        help="Build the water withdrawal and zone renewable/battery totals of "
+        "the China modules from sparse coefficient arrays instead of "
+        "term-by-term Pyomo expressions.",
+    )
+
+
+def use_matrix_construction(m):
+    return getattr(m.options, "matrix_construction", False)
+
+
+def linear_rows(row_keys, term_rows, coefs, variables):
+    """
+    Return a dict mapping each key in row_keys to the sum of
+    coefs[i] * variables[i] over the terms i whose term_rows[i] is the
+    position of the key in row_keys. Terms with a negative row or a zero
+    coefficient are dropped; rows with no terms are 0.
+    """
+    term_rows = np.asarray(term_rows, dtype=np.int64)
+    coefs = np.asarray(coefs, dtype=float)
+    terms = np.flatnonzero((term_rows >= 0) & (coefs != 0))
+    terms = terms[np.argsort(term_rows[terms], kind="stable")]
+    indptr = np.searchsorted(term_rows[terms], np.arange(len(row_keys) + 1))
+    coef_list = coefs[terms].tolist()
+    var_list = [variables[i] for i in terms.tolist()]
+    rows = {}
+    for key, start, end in zip(row_keys, indptr[:-1].tolist(), indptr[1:].tolist()):
+        if start == end:
+            rows[key] = 0
+        else:
+            rows[key] = LinearExpression(
+                constant=0,
+                linear_coefs=coef_list[start:end],
+                linear_vars=var_list[start:end],
+            )
+    return rows
+
+
+def variable_terms(var):
+    """
+    Return the index of an indexed variable as a DataFrame with one column per
+    index position (0, 1, ...), and a list of its variable data objects in the
+    same order.
+    """
+    keys = list(var.keys())
+    return pd.DataFrame.from_records(keys), list(var.values())
+
+
+def row_positions(row_keys, *columns):
+    """
+    Return the position in row_keys of each tuple formed by the given arrays,
+    or -1 if it is not a row.
+    """
+    rows = pd.MultiIndex.from_tuples(list(row_keys))
+    return rows.get_indexer(pd.MultiIndex.from_arrays(columns))
+
+
+def pop_row(m, name, build, key):
+    """
+    Return the row for key from the construction dictionary m.<name>, which is
+    created with build() on the first call and deleted after the last row is
+    popped.
+    """
+    if not hasattr(m, name):
+        setattr(m, name, build())
+    rows = getattr(m, name)
+    result = rows.pop(key)
+    if not rows:
+        delattr(m, name)
+    return result
@@ -0,0 +1,916 @@
+"""
+Write a synthetic Switch inputs directory at a chosen scale, for testing and
+benchmarking the China modules on models larger (or smaller) than inputs/.
+
+    python -m china_modules.synthetic_inputs --outputs-dir inputs_x4 \\
+        --zones 128 --days 24 --timepoints-per-day 12 --projects-per-zone 400
+
+Technology, cost and fuel data are taken from a template inputs directory
+(--template-dir, default: inputs), so the synthetic model has realistic
+coefficients; its structure is generated:
+
+  * periods: --periods periods with the template's period length, starting
+    at the template's first period; later periods reuse the costs of the
+    template's last period;
+  * timescales: --days sample days per period, spread over the year, with
+    --timepoints-per-day timepoints each, weighted to fill the period;
+  * load zones: --zones zones copied from the template zones in turn, named
+    after them (Anhui, ..., Anhui_2, ...), each with the template zone's
+    attributes, fuel costs, fuel market and planning reserve requirement;
+    zone_is_constrained is set for --constrained-zone-share of the zones;
+  * loads: a daily and seasonal profile scaled to the template zone's
+    average load in each period, with random variation; coincident peak
+    demand is the highest load of each zone and period;
+  * projects: --projects-per-zone projects drawn from the template zone's
+    projects (all of them, if not given), with their build costs,
+    predetermined builds and heat rate curves; gen_is_re_connect is set for
+    --re-connect-share of the storage projects;
+  * capacity factors: daily solar and wind profiles with random variation
+    for every variable project and timepoint;
+  * transmission: the template lines between zones of the same copy, plus
+    lines linking each copy of the zones to the previous copy;
+  * water: zones are assigned to --water-basins basins in blocks; thermal
+    projects get cooling water rates by energy source (much higher for
+    once-through cooling) and each basin's limit is a random fraction of the
+    withdrawals of its existing thermal plants at a 60% capacity factor, but
+    at least enough for its baseload plants at full output and for meeting
+    its demand with recirculating thermal plants;
+  * plans: --plan-rows rows of capacity_plans.csv and --tech-plan-rows rows
+    of tech_capacity_plans.csv, for zones and energy sources (technologies)
+    with buildable projects, growing over the periods and never above what
+    those projects can provide;
+  * national limits: total_capacity_limits.csv is scaled from the template
+    by total demand, but never below 1.2 times the predetermined capacity;
+    carbon caps are scaled the same way, but never below CARBON_CAP_MARGIN
+    times a rough estimate of the least emissions the synthetic projects can
+    reach within those limits and the regional fuel supply (see
+    least_emissions), so the caps can be met.
+
+The same --seed always gives the same inputs. The options used are saved in
+synthetic_inputs.json in the new directory, and modules.txt is copied from
+the template; add china_modules.water_limits, mixed_strategy or
+re_connected_strategy with --include-modules. See china_modules.benchmark
+for timing model construction on the new inputs.
+"""
+
+import argparse
+import datetime
+import json
+import math
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from china_modules.aggregate_projects import format_number, read_table, to_number
+
+# files copied from the template unchanged
+COPIED_FILES = [
+    "financials.csv",
+    "fuels.csv",
+    "non_fuel_energy_sources.csv",
+    "trans_params.csv",
+    "switch_inputs_version.txt",
+    "modules.txt",
+]
+
+# cooling water withdrawal (m3/MWh) of thermal plants by energy source, for
+# recirculating cooling; technologies with once-through cooling ('_OT' in the
+# name) withdraw ONCE_THROUGH_FACTOR times as much
+COOLING_WATER_M3_PER_MWH = {"Coal": 2.0, "Gas": 1.0, "Uranium": 3.0}
+ONCE_THROUGH_FACTOR = 50
+
+# number of template lines used to link each copy of the zones to the last
+LINKS_PER_COPY = 3
+
+# when estimating the least emissions of the synthetic system, variable
+# renewables serve at most this share of the annual demand (the rest of their
+# output is assumed to be curtailed), and carbon caps are set to at least
+# CARBON_CAP_MARGIN times the estimate
+VARIABLE_SHARE = 0.3
+CARBON_CAP_MARGIN = 1.1
+
+
+def period_table(template, options):
+    """
+    Return periods.csv and a dict giving the template period whose data are
+    used for each new period.
+    """
+    periods = template["periods.csv"]
+    starts = to_number(periods["period_start"]).astype(int).tolist()
+    length = int(to_number(periods["period_end"]).iloc[0]) - starts[0] + 1
+    n = len(periods) if options.periods is None else options.periods
+    rows, period_map = [], {}
+    for i in range(n):
+        start = starts[0] + i * length
+        rows.append((str(start), str(start), str(start + length - 1)))
+        period_map[str(start)] = periods["INVESTMENT_PERIOD"].iloc[
+            min(i, len(periods) - 1)
+        ]
+    return pd.DataFrame(rows, columns=periods.columns), period_map, length
+
+
+def timescale_tables(periods, length, options):
+    """Return timeseries.csv and timepoints.csv, plus the hour of day, day of
+    year and period of each timepoint."""
+    tpd = options.timepoints_per_day
+    if 24 % tpd:
+        raise ValueError("--timepoints-per-day must divide 24.")
+    hours = 24 // tpd
+    series, points = [], []
+    for p in periods["INVESTMENT_PERIOD"]:
+        for d in range(options.days):
+            date = datetime.date(int(p), 1, 1) + datetime.timedelta(
+                days=int((d + 0.5) * 365 / options.days)
+            )
+            ts = date.strftime("%Y.%m.%d")
+            series.append(
+                (
+                    ts,
+                    p,
+                    str(hours),
+                    str(tpd),
+                    format_number(length * 365 / options.days),
+                )
+            )
+            for h in range(0, 24, hours):
+                points.append(
+                    (
+                        f"{ts}.{h:02d}",
+                        date.strftime("%Y-%m-%d") + f"_{h:02d}:00",
+                        ts,
+                        p,
+                        h + hours / 2,
+                        date.timetuple().tm_yday,
+                    )
+                )
+    timeseries = pd.DataFrame(
+        series,
+        columns=[
+            "TIMESERIES",
+            "ts_period",
+            "ts_duration_of_tp",
+            "ts_num_tps",
+            "ts_scale_to_period",
+        ],
+    )
+    points = pd.DataFrame(
+        points,
+        columns=["timepoint_id", "timestamp", "timeseries", "period", "hour", "day"],
+    )
+    return timeseries, points
+
+
+def zone_table(template, options, rng):
+    """Return load_zones.csv with a template_zone column (not saved)."""
+    template_zones = template["load_zones.csv"]
+    rows = []
+    for i in range(options.zones):
+        row = template_zones.iloc[i % len(template_zones)].copy()
+        copy = i // len(template_zones)
+        row["template_zone"] = row["LOAD_ZONE"]
+        row["copy"] = copy
+        row["LOAD_ZONE"] = suffixed(row["LOAD_ZONE"], copy)
+        row["zone_dbid"] = str(i + 1)
+        rows.append(row)
+    zones = pd.DataFrame(rows).reset_index(drop=True)
+    constrained = rng.random(len(zones)) < options.constrained_zone_share
+    zones["zone_is_constrained"] = np.where(constrained, "TRUE", "FALSE")
+    return zones
+
+
+def suffixed(name, copy):
+    """Name of the copy'th copy of a template zone, market, etc."""
+    return name if copy == 0 else f"{name}_{copy + 1}"
+
+
+def template_period_loads(template):
+    """Average load of each template zone in each template period."""
+    loads = template["loads.csv"]
+    tp_period = (
+        template["timepoints.csv"]
+        .merge(template["timeseries.csv"], left_on="timeseries", right_on="TIMESERIES")
+        .set_index("timepoint_id")["ts_period"]
+    )
+    loads = loads.assign(
+        period=loads["TIMEPOINT"].map(tp_period),
+        mw=to_number(loads["zone_demand_mw"]),
+    )
+    return loads.groupby(["load_zone", "period"])["mw"].mean()
+
+
+def load_tables(template, zones, points, period_map, rng):
+    """Return loads.csv and zone_coincident_peak_demand.csv."""
+    average = template_period_loads(template)
+    scale = rng.uniform(0.8, 1.2, len(zones))
+    daily = 1 + 0.15 * np.cos(2 * np.pi * (points["hour"].to_numpy() - 19) / 24)
+    seasonal = 1 + 0.1 * np.cos(2 * np.pi * (points["day"].to_numpy() - 200) / 365)
+    template_period = points["period"].map(period_map).to_numpy()
+    frames = []
+    for i, zone in zones.iterrows():
+        base = average.loc[zone["template_zone"]].reindex(template_period).to_numpy()
+        mw = base * scale[i] * daily * seasonal * rng.uniform(0.97, 1.03, len(points))
+        frames.append(
+            pd.DataFrame(
+                {
+                    "load_zone": zone["LOAD_ZONE"],
+                    "TIMEPOINT": points["timepoint_id"].to_numpy(),
+                    "zone_demand_mw": mw,
+                    "period": points["period"].to_numpy(),
+                }
+            )
+        )
+    loads = pd.concat(frames, ignore_index=True)
+    peaks = (
+        loads.groupby(["load_zone", "period"], sort=False)["zone_demand_mw"]
+        .max()
+        .reset_index()
+        .rename(
+            columns={
+                "load_zone": "LOAD_ZONE",
+                "period": "PERIOD",
+                "zone_demand_mw": "zone_expected_coincident_peak_demand",
+            }
+        )
+    )
+    return loads.drop(columns="period"), peaks
+
+
+def project_tables(template, zones, period_map, options, rng):
+    """
+    Return gen_info.csv, gen_build_costs.csv, gen_build_predetermined.csv and
+    gen_part_load_heat_rates.csv for the synthetic projects.
+    """
+    gen_info = template["gen_info.csv"]
+    costs = template["gen_build_costs.csv"]
+    in_periods = costs["build_year"].isin(template["periods.csv"]["INVESTMENT_PERIOD"])
+    # one project per technology that can be built without limit is kept in
+    # every zone, so each zone can always meet its demand
+    unlimited = gen_info[
+        gen_info["GENERATION_PROJECT"].isin(costs.loc[in_periods, "GENERATION_PROJECT"])
+        & to_number(gen_info["gen_capacity_limit_mw"]).isna()
+    ].drop_duplicates(["gen_load_zone", "gen_tech"])
+    required_by_zone = {
+        z: rows.to_numpy()
+        for z, rows in unlimited.groupby("gen_load_zone").groups.items()
+    }
+    by_zone = gen_info.groupby("gen_load_zone").indices
+    names, sources = [], []
+    for _, zone in zones.iterrows():
+        rows = by_zone[zone["template_zone"]]
+        n = (
+            len(rows)
+            if options.projects_per_zone is None
+            else options.projects_per_zone
+        )
+        if n > len(rows):
+            extra = rng.choice(rows, n - len(rows))
+            rows = np.sort(np.concatenate([rows, extra]))
+        elif n < len(rows):
+            required = required_by_zone.get(zone["template_zone"], rows[:0])[:n]
+            others = np.setdiff1d(rows, required)
+            chosen = rng.choice(others, n - len(required), replace=False)
+            rows = np.sort(np.concatenate([required, chosen]))
+        projects = gen_info.iloc[rows]
+        names.extend(
+            f"{zone['LOAD_ZONE']}-{tech}-{j + 1}"
+            for j, tech in enumerate(projects["gen_tech"])
+        )
+        sources.append(projects.assign(gen_load_zone=zone["LOAD_ZONE"]))
+    new_info = pd.concat(sources, ignore_index=True)
+    project_map = pd.DataFrame(
+        {"template_project": new_info["GENERATION_PROJECT"], "project": names}
+    )
+    new_info["GENERATION_PROJECT"] = names
+
+    def renamed(df):
+        df = df.merge(
+            project_map, left_on="GENERATION_PROJECT", right_on="template_project"
+        )
+        df["GENERATION_PROJECT"] = df.pop("project")
+        return df.drop(columns="template_project")
+
+    periods = pd.DataFrame(
+        {"new_year": list(period_map), "build_year": list(period_map.values())}
+    )
+    future_costs = costs[in_periods].merge(periods, on="build_year")
+    future_costs["build_year"] = future_costs.pop("new_year")
+    costs = pd.concat([costs[~in_periods], future_costs], ignore_index=True)
+    costs = renamed(costs).sort_values(["GENERATION_PROJECT", "build_year"])
+
+    # water basins and battery strategies used by the China modules
+    zone_basin = {
+        zone: f"Basin_{i * options.water_basins // len(zones) + 1}"
+        for i, zone in enumerate(zones["LOAD_ZONE"])
+    }
+    new_info["gen_water_basin"] = new_info["gen_load_zone"].map(zone_basin)
+    rate = new_info["gen_energy_source"].map(COOLING_WATER_M3_PER_MWH).fillna(0.0)
+    rate = rate.where(
+        ~new_info["gen_tech"].str.contains("_OT"), rate * ONCE_THROUGH_FACTOR
+    )
+    new_info["gen_cooling_water_m3_per_mwh"] = (
+        rate * rng.uniform(0.8, 1.2, len(new_info))
+    ).map(format_number)
+    is_storage = new_info["gen_energy_source"] == "Storage"
+    re_connect = is_storage & (rng.random(len(new_info)) < options.re_connect_share)
+    new_info["gen_is_re_connect"] = np.where(re_connect, "TRUE", "FALSE")
+
+    return (
+        new_info,
+        costs,
+        renamed(template["gen_build_predetermined.csv"]),
+        renamed(template["gen_part_load_heat_rates.csv"]),
+    )
+
+
+def capacity_factor_table(gen_info, points, rng):
+    """Return variable_capacity_factors.csv."""
+    variable = gen_info[gen_info["gen_is_variable"].str.upper() == "TRUE"]
+    n, t = len(variable), len(points)
+    hour = points["hour"].to_numpy()[None, :]
+    source = variable["gen_energy_source"].to_numpy()[:, None]
+    # one random weather factor per zone and day, shared by the zone's projects
+    zone_codes = pd.factorize(variable["gen_load_zone"])[0]
+    day_codes = pd.factorize(points["timeseries"])[0]
+    weather = rng.uniform(0.5, 1.0, (zone_codes.max() + 1, day_codes.max() + 1))[
+        zone_codes[:, None], day_codes[None, :]
+    ]
+    solar = (
+        np.maximum(0.0, np.sin(np.pi * (hour - 6) / 12))
+        * rng.uniform(0.7, 1.0, (n, 1))
+        * weather
+    )
+    wind = np.clip(
+        rng.uniform(0.2, 0.4, (n, 1))
+        + 0.15 * np.sin(2 * np.pi * (hour + rng.uniform(0, 24, (n, 1))) / 24)
+        + rng.normal(0.0, 0.1, (n, t)),
+        0.0,
+        1.0,
+    )
+    factors = np.where(source == "Solar", solar, np.where(source == "Wind", wind, 0.5))
+    return pd.DataFrame(
+        {
+            "GENERATION_PROJECT": np.repeat(
+                variable["GENERATION_PROJECT"].to_numpy(), t
+            ),
+            "timepoint": np.tile(points["timepoint_id"].to_numpy(), n),
+            "gen_max_capacity_factor": factors.ravel().round(4),
+        }
+    )
+
+
+def transmission_table(template, zones):
+    """Return transmission_lines.csv."""
+    lines = template["transmission_lines.csv"]
+    zone_names = set(zones["LOAD_ZONE"])
+    copies = zones["copy"].max() + 1
+    frames = []
+    for copy in range(copies):
+        # lines within this copy of the zones
+        frames.append(
+            lines.assign(
+                trans_lz1=lines["trans_lz1"].map(lambda z: suffixed(z, copy)),
+                trans_lz2=lines["trans_lz2"].map(lambda z: suffixed(z, copy)),
+            )
+        )
+        if copy > 0:
+            # links to the previous copy
+            links = lines.head(LINKS_PER_COPY)
+            frames.append(
+                links.assign(
+                    trans_lz1=links["trans_lz1"].map(lambda z: suffixed(z, copy)),
+                    trans_lz2=links["trans_lz2"].map(lambda z: suffixed(z, copy - 1)),
+                )
+            )
+    lines = pd.concat(frames, ignore_index=True)
+    lines = lines[
+        lines["trans_lz1"].isin(zone_names) & lines["trans_lz2"].isin(zone_names)
+    ].reset_index(drop=True)
+    lines["TRANSMISSION_LINE"] = lines["trans_lz1"] + "-" + lines["trans_lz2"]
+    lines["trans_dbid"] = [str(i + 1) for i in range(len(lines))]
+    return lines
+
+
+def zone_copies(df, zones, zone_column, renamed_columns=()):
+    """
+    Copy the rows of df for each template zone to the synthetic zones made
+    from it, adding copy suffixes to zone_column and renamed_columns.
+    """
+    frames = []
+    for copy, group in zones.groupby("copy"):
+        rows = df[df[zone_column].isin(group["template_zone"])].copy()
+        for column in [zone_column, *renamed_columns]:
+            rows[column] = rows[column].map(lambda x: suffixed(x, copy))
+        frames.append(rows)
+    return pd.concat(frames, ignore_index=True)
+
+
+def remap_periods(df, column, period_map):
+    """Repeat the rows of df for each new period, using the mapped template
+    period's rows."""
+    periods = pd.DataFrame({"new": list(period_map), column: list(period_map.values())})
+    df = df.merge(periods, on=column)
+    df[column] = df.pop("new")
+    return df
+
+
+def copied_rows(df, column, names, copy):
+    """Rows of df with column in names, renamed for the copy'th copy."""
+    rows = df[df[column].isin(names)].copy()
+    rows[column] = rows[column].map(lambda x: suffixed(x, copy))
+    return rows
+
+
+def fuel_tables(template, zones, period_map):
+    """Return fuel_cost.csv and the regional fuel market tables."""
+    fuel_cost = remap_periods(
+        zone_copies(template["fuel_cost.csv"], zones, "load_zone"), "period", period_map
+    )
+    zone_markets = template["zone_to_regional_fuel_market.csv"]
+    markets, supply = [], []
+    for copy, group in zones.groupby("copy"):
+        names = zone_markets.loc[
+            zone_markets["load_zone"].isin(group["template_zone"]),
+            "regional_fuel_market",
+        ].unique()
+        markets.append(
+            copied_rows(
+                template["regional_fuel_markets.csv"],
+                "regional_fuel_market",
+                names,
+                copy,
+            )
+        )
+        supply.append(
+            copied_rows(
+                template["fuel_supply_curves.csv"], "regional_fuel_market", names, copy
+            )
+        )
+    return (
+        fuel_cost,
+        zone_copies(zone_markets, zones, "load_zone", ["regional_fuel_market"]),
+        pd.concat(markets, ignore_index=True),
+        remap_periods(pd.concat(supply, ignore_index=True), "period", period_map),
+    )
+
+
+def reserve_tables(template, zones):
+    """Return the planning reserve requirement tables."""
+    req_zones = template["planning_reserve_requirement_zones.csv"]
+    requirements = []
+    for copy, group in zones.groupby("copy"):
+        names = req_zones.loc[
+            req_zones["LOAD_ZONE"].isin(group["template_zone"]),
+            "PLANNING_RESERVE_REQUIREMENTS",
+        ].unique()
+        requirements.append(
+            copied_rows(
+                template["planning_reserve_requirements.csv"],
+                "PLANNING_RESERVE_REQUIREMENTS",
+                names,
+                copy,
+            )
+        )
+    return (
+        zone_copies(req_zones, zones, "LOAD_ZONE", ["PLANNING_RESERVE_REQUIREMENTS"]),
+        pd.concat(requirements, ignore_index=True),
+    )
+
+
+def capacity_potential(gen_info, costs, predetermined, key):
+    """
+    Return the predetermined capacity and the most capacity that can be built
+    (inf if unlimited) for each (key, zone), for zones and keys with projects
+    that can be built in the study periods.
+    """
+    buildable = set(costs["GENERATION_PROJECT"]) - set(
+        predetermined["GENERATION_PROJECT"]
+    )
+    info = gen_info.assign(
+        limit=to_number(gen_info["gen_capacity_limit_mw"]).fillna(np.inf)
+    )
+    existing = (
+        predetermined.assign(mw=to_number(predetermined["build_gen_predetermined"]))
+        .merge(info[["GENERATION_PROJECT", key, "gen_load_zone"]])
+        .groupby([key, "gen_load_zone"])["mw"]
+        .sum()
+    )
+    potential = (
+        info[info["GENERATION_PROJECT"].isin(buildable)]
+        .groupby([key, "gen_load_zone"])["limit"]
+        .sum()
+    )
+    potential = potential[potential > 0]
+    return pd.DataFrame(
+        {
+            "existing": existing.reindex(potential.index).fillna(0.0),
+            "potential": potential,
+        }
+    )
+
+
+def plan_table(potential, periods, n_rows, columns, rng):
+    """
+    Return n_rows plan rows for randomly chosen (key, zone) pairs in
+    potential, with plans growing over the periods.
+    """
+    if n_rows == 0 or potential.empty:
+        return pd.DataFrame(columns=columns)
+    n_periods = len(periods)
+    n_pairs = min(len(potential), math.ceil(n_rows / n_periods))
+    chosen = potential.iloc[np.sort(rng.choice(len(potential), n_pairs, replace=False))]
+    rows = []
+    for (key, zone), pair in chosen.iterrows():
+        growth = rng.uniform(0.1, 0.5) * min(pair["potential"], pair["existing"] + 1000)
+        for i, p in enumerate(periods):
+            planned = min(
+                pair["existing"] + growth * (i + 1) / n_periods,
+                0.9 * pair["potential"],
+            )
+            rows.append((key, zone, p, format_number(round(planned, 1))))
+    return pd.DataFrame(rows[:n_rows], columns=columns)
+
+
+def water_table(gen_info, predetermined, zone_energy, options, rng):
+    """
+    Return water_limit_annual.csv. zone_energy is the annual energy demand
+    (MWh) of each zone in each period.
+    """
+    mw = (
+        predetermined.assign(mw=to_number(predetermined["build_gen_predetermined"]))
+        .groupby("GENERATION_PROJECT")["mw"]
+        .sum()
+    )
+    info = gen_info.set_index("GENERATION_PROJECT")
+    full_output_mm3 = (
+        mw.reindex(info.index).fillna(0.0)
+        * to_number(info["gen_cooling_water_m3_per_mwh"])
+        * 8760
+        / 1e6
+    )
+    basin = info["gen_water_basin"]
+    withdrawal_mm3 = (0.6 * full_output_mm3).groupby(basin).sum()
+    # limits always leave room for baseload plants, which must run, and for
+    # serving all demand in the basin with recirculating thermal plants
+    baseload = info["gen_is_baseload"].str.upper() == "TRUE"
+    baseload_mm3 = full_output_mm3[baseload].groupby(basin[baseload]).sum()
+    zone_basin = gen_info.groupby("gen_load_zone")["gen_water_basin"].first()
+    demand_mm3 = (
+        zone_energy.groupby(
+            [zone_energy.index.get_level_values(0).map(zone_basin), "period"]
+        ).sum()
+        * 1.2
+        * max(COOLING_WATER_M3_PER_MWH.values())
+        / 1e6
+    )
+    rows = []
+    for b in range(options.water_basins):
+        name = f"Basin_{b + 1}"
+        base = withdrawal_mm3.get(name, 0.0)
+        for p in zone_energy.index.unique("period"):
+            least = max(
+                1.1 * baseload_mm3.get(name, 0.0), demand_mm3.get((name, p), 0.0)
+            )
+            limit = max(base * rng.uniform(0.6, 0.9), least, 1.0)
+            rows.append((name, p, f"流域{b + 1}", format_number(round(limit, 3))))
+    return pd.DataFrame(
+        rows,
+        columns=[
+            "WATER_BASINS",
+            "PERIOD",
+            "water_basin_name_cn",
+            "water_basin_limit_mm3",
+        ],
+    )
+
+
+def scaled_limits(template, gen_info, predetermined, period_map, ratio):
+    """Return total_capacity_limits.csv, scaled by ratio, but never below
+    1.2 times the predetermined capacity of each energy source."""
+    limits = remap_periods(template["total_capacity_limits.csv"], "period", period_map)
+    existing = (
+        predetermined.assign(mw=to_number(predetermined["build_gen_predetermined"]))
+        .merge(gen_info[["GENERATION_PROJECT", "gen_energy_source"]])
+        .groupby("gen_energy_source")["mw"]
+        .sum()
+    )
+    limit = np.maximum(
+        to_number(limits["total_capacity_limit_mw"]) * ratio,
+        1.2 * limits["energy_sources"].map(existing).fillna(0.0),
+    )
+    limits["total_capacity_limit_mw"] = limit.round(1).map(format_number)
+    return limits
+
+
+def least_emissions(
+    gen_info, costs, predetermined, factors, limits, template, supply, zone_energy
+):
+    """
+    Return a rough, deliberately high estimate of the least annual emissions
+    (tCO2) the synthetic projects can reach in each period. Each energy
+    source can produce its capacity (predetermined builds still in service,
+    plus the capacity limits of projects that can be built by then, capped
+    by total_capacity_limits.csv) at its average availability and capacity
+    factor, and fuels sold in regional markets are also limited by their
+    supply. The annual demand is served by the sources in order of their
+    emission rates, variable renewables serve at most VARIABLE_SHARE of it,
+    and each source emits at the highest rate of its projects.
+    """
+    # storage only shifts energy between timepoints
+    info = gen_info.set_index("GENERATION_PROJECT")
+    info = info[to_number(info["gen_storage_efficiency"]).isna()]
+    source = info["gen_energy_source"]
+    heat_rate = to_number(info["gen_full_load_heat_rate"])
+    co2 = to_number(template["fuels.csv"].set_index("fuel")["co2_intensity"])
+    factor = (
+        (1 - to_number(info["gen_forced_outage_rate"]).fillna(0.0))
+        * (1 - to_number(info["gen_scheduled_outage_rate"]).fillna(0.0))
+        * factors.groupby("GENERATION_PROJECT")["gen_max_capacity_factor"]
+        .mean()
+        .reindex(info.index)
+        .fillna(1.0)
+    )
+    sources = pd.DataFrame(
+        {
+            "factor": factor.groupby(source).mean(),
+            "heat_rate": heat_rate.groupby(source).max(),
+            "rate": (heat_rate * source.map(co2)).fillna(0.0).groupby(source).max(),
+            "variable": (info["gen_is_variable"].str.upper() == "TRUE")
+            .groupby(source)
+            .any(),
+        }
+    ).sort_values("rate")
+    fuel_supply = (
+        supply.assign(mmbtu=to_number(supply["max_avail_at_cost"]).fillna(np.inf))
+        .merge(template["regional_fuel_markets.csv"])
+        .groupby(["fuel", "period"])["mmbtu"]
+        .sum()
+        .unstack("period")
+    )
+    mw = predetermined.assign(
+        mw=to_number(predetermined["build_gen_predetermined"]),
+        retired=to_number(predetermined["build_year"])
+        + to_number(predetermined["GENERATION_PROJECT"].map(info["gen_max_age"])),
+    )
+    new_projects = costs.loc[
+        ~costs["GENERATION_PROJECT"].isin(predetermined["GENERATION_PROJECT"])
+    ]
+    limit = to_number(info["gen_capacity_limit_mw"]).fillna(np.inf)
+    estimate = {}
+    for period, demand in zone_energy.groupby(level="period").sum().items():
+        year = float(period)
+        existing = mw[mw["retired"] > year].groupby("GENERATION_PROJECT")["mw"].sum()
+        buildable = new_projects.loc[
+            to_number(new_projects["build_year"]) <= year, "GENERATION_PROJECT"
+        ]
+        capacity = (
+            existing.reindex(info.index).fillna(0.0)
+            + limit.where(info.index.isin(buildable), 0.0)
+        ).groupby(source).sum()
+        period_limits = limits[limits["period"] == period].set_index("energy_sources")
+        capacity = np.minimum(
+            capacity,
+            to_number(period_limits["total_capacity_limit_mw"])
+            .reindex(capacity.index)
+            .fillna(np.inf),
+        )
+        mwh = np.minimum(
+            (capacity * 8760 * sources["factor"]).fillna(0.0),
+            (
+                fuel_supply.get(period, pd.Series(dtype=float)).reindex(sources.index)
+                / sources["heat_rate"]
+            ).fillna(np.inf),
+        )
+        remaining, variable_left, emissions = demand, VARIABLE_SHARE * demand, 0.0
+        for name, row in sources.iterrows():
+            used = min(remaining, mwh[name])
+            if row["variable"]:
+                used = min(used, variable_left)
+                variable_left -= used
+            emissions += used * row["rate"]
+            remaining -= used
+        estimate[period] = emissions + remaining * sources["rate"].max()
+    return pd.Series(estimate)
+
+
+def synthetic_inputs(options):
+    rng = np.random.default_rng(options.seed)
+    template = {}
+    for filename in os.listdir(options.template_dir):
+        if filename.endswith(".csv"):
+            template[filename] = read_table(
+                os.path.join(options.template_dir, filename)
+            )
+
+    periods, period_map, length = period_table(template, options)
+    timeseries, points = timescale_tables(periods, length, options)
+    zones = zone_table(template, options, rng)
+    loads, peaks = load_tables(template, zones, points, period_map, rng)
+    gen_info, costs, predetermined, heat_rates = project_tables(
+        template, zones, period_map, options, rng
+    )
+    fuel_cost, zone_markets, markets, supply = fuel_tables(template, zones, period_map)
+    req_zones, requirements = reserve_tables(template, zones)
+
+    # national caps and limits are scaled by total demand, with carbon caps
+    # no lower than the synthetic projects can reach (see least_emissions)
+    template_loads = template_period_loads(template)
+    ratio = (
+        loads["zone_demand_mw"].sum()
+        / len(points)
+        / template_loads.groupby(level="period")
+        .sum()
+        .reindex(points["period"].map(period_map))
+        .mean()
+    )
+    hours_per_year = (24 // options.timepoints_per_day) * 365 / options.days
+    zone_energy = (
+        loads.assign(
+            period=loads["TIMEPOINT"].map(points.set_index("timepoint_id")["period"])
+        )
+        .groupby(["load_zone", "period"])["zone_demand_mw"]
+        .sum()
+        * hours_per_year
+    )
+    factors = capacity_factor_table(gen_info, points, rng)
+    limits = scaled_limits(template, gen_info, predetermined, period_map, ratio)
+    least = least_emissions(
+        gen_info, costs, predetermined, factors, limits, template, supply, zone_energy
+    )
+    carbon = remap_periods(template["carbon_policies.csv"], "PERIOD", period_map)
+    carbon["carbon_cap_tco2_per_yr"] = np.maximum(
+        to_number(carbon["carbon_cap_tco2_per_yr"]) * ratio,
+        CARBON_CAP_MARGIN * carbon["PERIOD"].map(least),
+    ).map(format_number)
+
+    n_plans = options.plan_rows
+    if n_plans is None:
+        n_plans = round(
+            len(template["capacity_plans.csv"])
+            / len(template["load_zones.csv"])
+            * options.zones
+        )
+    n_tech_plans = options.tech_plan_rows
+    if n_tech_plans is None:
+        n_tech_plans = n_plans // 2
+    period_list = periods["INVESTMENT_PERIOD"].tolist()
+
+    tables = {
+        "periods.csv": periods,
+        "timeseries.csv": timeseries,
+        "timepoints.csv": points[["timepoint_id", "timestamp", "timeseries"]],
+        "load_zones.csv": zones.drop(columns=["template_zone", "copy"]),
+        "loads.csv": loads,
+        "zone_coincident_peak_demand.csv": peaks,
+        "gen_info.csv": gen_info,
+        "gen_build_costs.csv": costs,
+        "gen_build_predetermined.csv": predetermined,
+        "gen_part_load_heat_rates.csv": heat_rates,
+        "variable_capacity_factors.csv": factors,
+        "transmission_lines.csv": transmission_table(template, zones),
+        "fuel_cost.csv": fuel_cost,
+        "zone_to_regional_fuel_market.csv": zone_markets,
+        "regional_fuel_markets.csv": markets,
+        "fuel_supply_curves.csv": supply,
+        "planning_reserve_requirement_zones.csv": req_zones,
+        "planning_reserve_requirements.csv": requirements,
+        "carbon_policies.csv": carbon,
+        "total_capacity_limits.csv": limits,
+        "capacity_plans.csv": plan_table(
+            capacity_potential(gen_info, costs, predetermined, "gen_energy_source"),
+            period_list,
+            n_plans,
+            ["energy_sources", "load_zones", "period", "planned_capacity_mw"],
+            rng,
+        ),
+        "tech_capacity_plans.csv": plan_table(
+            capacity_potential(gen_info, costs, predetermined, "gen_tech"),
+            period_list,
+            n_tech_plans,
+            ["gen_tech", "load_zones", "period", "planned_tech_capacity_mw"],
+            rng,
+        ),
+        "water_limit_annual.csv": water_table(
+            gen_info, predetermined, zone_energy, options, rng
+        ),
+    }
+
+    os.makedirs(options.outputs_dir, exist_ok=True)
+    for filename in COPIED_FILES:
+        path = os.path.join(options.template_dir, filename)
+        if os.path.exists(path):
+            shutil.copy(path, os.path.join(options.outputs_dir, filename))
+    for filename, df in tables.items():
+        df.to_csv(
+            os.path.join(options.outputs_dir, filename),
+            index=False,
+            float_format="%.6g",
+        )
+    with open(os.path.join(options.outputs_dir, "synthetic_inputs.json"), "w") as f:
+        json.dump(vars(options), f, indent=2)
+
+    print(
+        f"Wrote synthetic inputs to {options.outputs_dir}: {len(zones)} zones, "
+        f"{len(periods)} periods, {len(points)} timepoints, {len(gen_info)} "
+        f"projects, {len(tables['transmission_lines.csv'])} transmission lines, "
+        f"{options.water_basins} water basins, "
+        f"{len(tables['capacity_plans.csv'])} capacity plan rows and "
+        f"{len(tables['tech_capacity_plans.csv'])} technology plan rows."
+    )
+
+
+def define_arguments(argparser):
+    argparser.add_argument(
+        "--template-dir",
+        default="inputs",
+        help="Inputs directory to take technology, cost and fuel data from "
+        "(default: inputs).",
+    )
+    argparser.add_argument(
+        "--outputs-dir",
+        required=True,
+        help="Directory to write the synthetic inputs to.",
+    )
+    argparser.add_argument(
+        "--zones",
+        type=int,
+        default=32,
+        help="Number of load zones (default: 32).",
+    )
+    argparser.add_argument(
+        "--periods",
+        type=int,
+        default=None,
+        help="Number of investment periods (default: as in the template).",
+    )
+    argparser.add_argument(
+        "--days",
+        type=int,
+        default=12,
+        help="Number of sample days per period (default: 12).",
+    )
+    argparser.add_argument(
+        "--timepoints-per-day",
+        type=int,
+        default=6,
+        help="Number of timepoints per sample day; must divide 24 (default: 6).",
+    )
+    argparser.add_argument(
+        "--projects-per-zone",
+        type=int,
+        default=None,
+        help="Number of generation projects per zone (default: as many as the "
+        "template zone has).",
+    )
+    argparser.add_argument(
+        "--water-basins",
+        type=int,
+        default=8,
+        help="Number of water basins (default: 8).",
+    )
+    argparser.add_argument(
+        "--plan-rows",
+        type=int,
+        default=None,
+        help="Number of rows in capacity_plans.csv (default: as many per zone "
+        "as the template).",
+    )
+    argparser.add_argument(
+        "--tech-plan-rows",
+        type=int,
+        default=None,
+        help="Number of rows in tech_capacity_plans.csv (default: half of "
+        "--plan-rows).",
+    )
+    argparser.add_argument(
+        "--re-connect-share",
+        type=float,
+        default=0.5,
+        help="Share of storage projects with gen_is_re_connect set (default: 0.5).",
+    )
+    argparser.add_argument(
+        "--constrained-zone-share",
+        type=float,
+        default=0.5,
+        help="Share of load zones with zone_is_constrained set (default: 0.5).",
+    )
+    argparser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Seed for the random numbers (default: 0).",
+    )
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Write a synthetic Switch inputs directory at a chosen scale."
+    )
+    define_arguments(parser)
+    options = parser.parse_args(args)
+    synthetic_inputs(options)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 # This module was prepared by Josiah Johnston in collaboration with Gang He
 # This module can incorperate two types of technological plans: 1)technology plan by tech, period, and load zones, such as wind, solar development plan in each province; 2) national total tech plan/limit by period, such as national total coal capacity limit
+# Provincial plans can be given per energy source (capacity_plans.csv) or per generation technology (tech_capacity_plans.csv)
 # You can use either or both constraints but make sure plans are larger than actual historical data
 # Add switch_model.china.tech_plans to the modules.txt file to use this module
 # You can cite below two papers to use this module:
@@ -10,15 +11,32 @@
 import os
 from pyomo.environ import *
 
+from . import bulk_export, presolve
+
 """
 Enable capacity plans which establish a minimum capacity target for a
 particular technology in given province & period. This supports both the wind, solar, & nuclear plans.
+Plans may be specified per energy source or, for finer plans, per generation
+technology.
 
 Also enable upper limits on total generation capacity of particular
 technologies per period. This supports plans of national nuclear limits.
+
+With --drop-redundant-constraints, plans that are already met by
+predetermined capacity, and limits that the projects could never reach, are
+not added to the model (see presolve.py).
+
+After solving, the planned and built capacity (and the duals of the plans,
+if available) are saved in capacity_plans.npz, tech_capacity_plans.npz and
+total_capacity_limits.npz (see bulk_export.py).
 """
 
 
+def define_arguments(argparser):
+    presolve.define_arguments(argparser)
+    bulk_export.define_arguments(argparser)
+
+
 def define_components(mod):
     mod.CAPACITY_PLAN_INDEX = Set(
         dimen=3, within=mod.ENERGY_SOURCES * mod.LOAD_ZONES * mod.PERIODS
@@ -30,6 +48,87 @@ def define_components(mod):
     )
     mod.total_capacity_limit_mw = Param(mod.TOTAL_CAPACITY_LIMIT_INDEX)
 
+    mod.TECH_CAPACITY_PLAN_INDEX = Set(
+        dimen=3, within=mod.GENERATION_TECHNOLOGIES * mod.LOAD_ZONES * mod.PERIODS
+    )
+    mod.planned_tech_capacity_mw = Param(mod.TECH_CAPACITY_PLAN_INDEX)
+
+    """Index projects by (energy source, zone) and (technology, zone) with a
+    single traversal of the projects, instead of scanning every project of an
+    energy source for each plan row. Only combinations that actually have
+    projects are included, so these sets stay sparse. The construction
+    dictionaries are created with the key sets, popped as the indexed sets
+    are initialized and deleted after the last call."""
+
+    def ENERGY_SOURCE_ZONES_init(m):
+        m._GENS_BY_ENERGY_SOURCE_ZONE_dict = d = {}
+        for e in m.ENERGY_SOURCES:
+            for g in m.GENS_BY_ENERGY_SOURCE[e]:
+                d.setdefault((e, m.gen_load_zone[g]), []).append(g)
+        return list(d)
+
+    mod.ENERGY_SOURCE_ZONES = Set(
+        dimen=2,
+        within=mod.ENERGY_SOURCES * mod.LOAD_ZONES,
+        initialize=ENERGY_SOURCE_ZONES_init,
+    )
+
+    def GENS_BY_ENERGY_SOURCE_ZONE_init(m, e, z):
+        result = m._GENS_BY_ENERGY_SOURCE_ZONE_dict.pop((e, z))
+        if not m._GENS_BY_ENERGY_SOURCE_ZONE_dict:
+            del m._GENS_BY_ENERGY_SOURCE_ZONE_dict
+        return result
+
+    mod.GENS_BY_ENERGY_SOURCE_ZONE = Set(
+        mod.ENERGY_SOURCE_ZONES,
+        dimen=1,
+        within=mod.GENERATION_PROJECTS,
+        initialize=GENS_BY_ENERGY_SOURCE_ZONE_init,
+    )
+
+    # zones with projects for each energy source, for the total limits
+    def ZONES_BY_ENERGY_SOURCE_init(m, e):
+        if not hasattr(m, "_ZONES_BY_ENERGY_SOURCE_dict"):
+            m._ZONES_BY_ENERGY_SOURCE_dict = d = {}
+            for _e, z in m.ENERGY_SOURCE_ZONES:
+                d.setdefault(_e, []).append(z)
+        result = m._ZONES_BY_ENERGY_SOURCE_dict.pop(e, [])
+        if e == m.ENERGY_SOURCES.last():
+            del m._ZONES_BY_ENERGY_SOURCE_dict
+        return result
+
+    mod.ZONES_BY_ENERGY_SOURCE = Set(
+        mod.ENERGY_SOURCES,
+        dimen=1,
+        within=mod.LOAD_ZONES,
+        initialize=ZONES_BY_ENERGY_SOURCE_init,
+    )
+
+    def TECHNOLOGY_ZONES_init(m):
+        m._GENS_BY_TECHNOLOGY_ZONE_dict = d = {}
+        for g in m.GENERATION_PROJECTS:
+            d.setdefault((m.gen_tech[g], m.gen_load_zone[g]), []).append(g)
+        return list(d)
+
+    mod.TECHNOLOGY_ZONES = Set(
+        dimen=2,
+        within=mod.GENERATION_TECHNOLOGIES * mod.LOAD_ZONES,
+        initialize=TECHNOLOGY_ZONES_init,
+    )
+
+    def GENS_BY_TECHNOLOGY_ZONE_init(m, t, z):
+        result = m._GENS_BY_TECHNOLOGY_ZONE_dict.pop((t, z))
+        if not m._GENS_BY_TECHNOLOGY_ZONE_dict:
+            del m._GENS_BY_TECHNOLOGY_ZONE_dict
+        return result
+
+    mod.GENS_BY_TECHNOLOGY_ZONE = Set(
+        mod.TECHNOLOGY_ZONES,
+        dimen=1,
+        within=mod.GENERATION_PROJECTS,
+        initialize=GENS_BY_TECHNOLOGY_ZONE_init,
+    )
+
     # Only track for entries we are tracking to save time & RAM
     mod.CapacityByEnergySourceZonePeriod = Expression(
         mod.CAPACITY_PLAN_INDEX,
@@ -37,41 +136,136 @@ def define_components(mod):
         rule=lambda m, e, z, p: (
             sum(
                 m.GenCapacity[g, p]
-                # use GENS_BY_TECHNOLOGY if using technology plan
-                for g in m.GENS_BY_ENERGY_SOURCE[e]
-                if m.gen_load_zone[g] == z
+                for g in (
+                    m.GENS_BY_ENERGY_SOURCE_ZONE[e, z]
+                    if (e, z) in m.ENERGY_SOURCE_ZONES
+                    else []
+                )
             )
         ),
     )
-    mod.Enforce_Capacity_Plan = Constraint(
-        mod.CAPACITY_PLAN_INDEX,
-        rule=lambda m, e, z, p: (
+
+    def Enforce_Capacity_Plan_rule(m, e, z, p):
+        gens = (
+            m.GENS_BY_ENERGY_SOURCE_ZONE[e, z]
+            if (e, z) in m.ENERGY_SOURCE_ZONES
+            else []
+        )
+        if plan_is_met(
+            m, "Enforce_Capacity_Plan", (e, z, p), gens, m.planned_capacity_mw[e, z, p]
+        ):
+            return Constraint.Skip
+        return (
             m.CapacityByEnergySourceZonePeriod[e, z, p]
             >= m.planned_capacity_mw[e, z, p]
+        )
+
+    mod.Enforce_Capacity_Plan = Constraint(
+        mod.CAPACITY_PLAN_INDEX, rule=Enforce_Capacity_Plan_rule
+    )
+
+    # Technology plans use the same sparse (technology, zone) index
+    mod.CapacityByTechnologyZonePeriod = Expression(
+        mod.TECH_CAPACITY_PLAN_INDEX,
+        # m:model; t: technology; z: zone; p: period
+        rule=lambda m, t, z, p: (
+            sum(
+                m.GenCapacity[g, p]
+                for g in (
+                    m.GENS_BY_TECHNOLOGY_ZONE[t, z]
+                    if (t, z) in m.TECHNOLOGY_ZONES
+                    else []
+                )
+            )
         ),
     )
 
+    def Enforce_Tech_Capacity_Plan_rule(m, t, z, p):
+        gens = m.GENS_BY_TECHNOLOGY_ZONE[t, z] if (t, z) in m.TECHNOLOGY_ZONES else []
+        if plan_is_met(
+            m,
+            "Enforce_Tech_Capacity_Plan",
+            (t, z, p),
+            gens,
+            m.planned_tech_capacity_mw[t, z, p],
+        ):
+            return Constraint.Skip
+        return (
+            m.CapacityByTechnologyZonePeriod[t, z, p]
+            >= m.planned_tech_capacity_mw[t, z, p]
+        )
+
+    mod.Enforce_Tech_Capacity_Plan = Constraint(
+        mod.TECH_CAPACITY_PLAN_INDEX, rule=Enforce_Tech_Capacity_Plan_rule
+    )
+
     mod.TotalCapByEnergySource = Expression(
         mod.TOTAL_CAPACITY_LIMIT_INDEX,
         rule=lambda m, e, p: (
-            sum(m.GenCapacity[g, p] for g in m.GENS_BY_ENERGY_SOURCE[e])
+            sum(
+                m.GenCapacity[g, p]
+                for z in m.ZONES_BY_ENERGY_SOURCE[e]
+                for g in m.GENS_BY_ENERGY_SOURCE_ZONE[e, z]
+            )
         ),
     )
+
+    def Enforce_Total_Capacity_Limit_rule(m, e, p):
+        limit = m.total_capacity_limit_mw[e, p]
+        if presolve.enabled(m):
+            most = sum(
+                presolve.capacity_bounds(m, g, p)[1]
+                for z in m.ZONES_BY_ENERGY_SOURCE[e]
+                for g in m.GENS_BY_ENERGY_SOURCE_ZONE[e, z]
+            )
+            if most <= limit:
+                presolve.log_dropped(
+                    m,
+                    "Enforce_Total_Capacity_Limit",
+                    (e, p),
+                    f"largest possible capacity ({most:g} MW) is within the "
+                    f"limit ({limit:g} MW)",
+                )
+                return Constraint.Skip
+        return m.TotalCapByEnergySource[e, p] <= limit
+
     mod.Enforce_Total_Capacity_Limit = Constraint(
-        mod.TOTAL_CAPACITY_LIMIT_INDEX,
-        rule=lambda m, e, p: (
-            m.TotalCapByEnergySource[e, p] <= m.total_capacity_limit_mw[e, p]
-        ),
+        mod.TOTAL_CAPACITY_LIMIT_INDEX, rule=Enforce_Total_Capacity_Limit_rule
+    )
+
+
+def plan_is_met(m, component, index, gens, planned):
+    """
+    Return True (and log it) if predetermined capacity of gens that cannot be
+    suspended or retired early already meets the planned capacity for the
+    period, so the plan row can be left out of the model.
+    """
+    if not presolve.enabled(m):
+        return False
+    p = index[-1]
+    least = sum(presolve.capacity_bounds(m, g, p)[0] for g in gens)
+    if least < planned:
+        return False
+    presolve.log_dropped(
+        m,
+        component,
+        index,
+        f"predetermined capacity that cannot retire ({least:g} MW) already "
+        f"meets the plan ({planned:g} MW)",
     )
+    return True
 
 
 def load_inputs(mod, switch_data, inputs_dir):
     """
-    Both files are optional.
+    All files are optional.
 
     capacity_plans.csv
     ENERGY_SOURCES LOAD_ZONES PERIOD planned_capacity_mw
 
+    tech_capacity_plans.csv
+    GENERATION_TECHNOLOGIES LOAD_ZONES PERIOD planned_tech_capacity_mw
+
     total_capacity_limits.csv
     ENERGY_SOURCES PERIOD total_capacity_limit_mw
     """
@@ -87,3 +281,49 @@ def load_inputs(mod, switch_data, inputs_dir):
         index=mod.TOTAL_CAPACITY_LIMIT_INDEX,
         param=(mod.total_capacity_limit_mw,),
     )
+    switch_data.load_aug(
+        filename=os.path.join(inputs_dir, "tech_capacity_plans.csv"),
+        optional=True,
+        index=mod.TECH_CAPACITY_PLAN_INDEX,
+        param=(mod.planned_tech_capacity_mw,),
+    )
+
+
+def post_solve(instance, outdir):
+    m = instance
+    bulk_export.write_table(
+        m,
+        outdir,
+        "capacity_plans",
+        ["ENERGY_SOURCE", "LOAD_ZONE", "PERIOD"],
+        m.CAPACITY_PLAN_INDEX,
+        {
+            "planned_capacity_mw": m.planned_capacity_mw,
+            "CapacityByEnergySourceZonePeriod": m.CapacityByEnergySourceZonePeriod,
+            "Enforce_Capacity_Plan_dual": m.Enforce_Capacity_Plan,
+        },
+    )
+    bulk_export.write_table(
+        m,
+        outdir,
+        "tech_capacity_plans",
+        ["GENERATION_TECHNOLOGY", "LOAD_ZONE", "PERIOD"],
+        m.TECH_CAPACITY_PLAN_INDEX,
+        {
+            "planned_tech_capacity_mw": m.planned_tech_capacity_mw,
+            "CapacityByTechnologyZonePeriod": m.CapacityByTechnologyZonePeriod,
+            "Enforce_Tech_Capacity_Plan_dual": m.Enforce_Tech_Capacity_Plan,
+        },
+    )
+    bulk_export.write_table(
+        m,
+        outdir,
+        "total_capacity_limits",
+        ["ENERGY_SOURCE", "PERIOD"],
+        m.TOTAL_CAPACITY_LIMIT_INDEX,
+        {
+            "total_capacity_limit_mw": m.total_capacity_limit_mw,
+            "TotalCapByEnergySource": m.TotalCapByEnergySource,
+            "Enforce_Total_Capacity_Limit_dual": m.Enforce_Total_Capacity_Limit,
+        },
+    )
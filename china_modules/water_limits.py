@@ -8,48 +8,74 @@
 # - Zhang, Chao, Gang He, Josiah Johnston, and Lijin Zhong. 2021. “Long-Term Transition of China’s Power Sector under Carbon Neutrality Target and Water Withdrawal Constraint.” Journal of Cleaner Production 329 (December): 129765. https://doi.org/10.1016/j.jclepro.2021.129765.
 
 import os
+import numpy as np
 import pandas as pd
 
 from pyomo.environ import *
 
+from . import bulk_export, presolve, sparse_rows
+from .project_arrays import get_project_arrays
+
 """
 Limit cooling water withdrawals for thermal power plants based on annual water
-withdrawals goals per water basin.
+withdrawals goals per water basin. With --drop-redundant-constraints, limits
+that the basin's plants could not reach even running at full capacity in
+every timepoint are not added to the model (see presolve.py).
 """
 
 
+def define_arguments(argparser):
+    presolve.define_arguments(argparser)
+    sparse_rows.define_arguments(argparser)
+    bulk_export.define_arguments(argparser)
+
+
 def define_components(mod):
     mod.WATER_BASIN_PERIODS = Set(dimen=2, validate=lambda m, b, p: p in m.PERIODS)
-    mod.WATER_BASINS = Set(
-        initialize=lambda m: set([b for b, p in m.WATER_BASIN_PERIODS])
-    )
-
     mod.water_basin_limit_mm3 = Param(mod.WATER_BASIN_PERIODS)
     mod._water_basin_name_cn_raw = Param(mod.WATER_BASIN_PERIODS)
 
+    """Group the basin records with a single traversal of WATER_BASIN_PERIODS
+    when WATER_BASINS is constructed. This collects the periods and the
+    Chinese names reported for each basin; the construction dictionaries are
+    popped as the indexed components below are initialized and deleted after
+    the last call."""
+
+    def WATER_BASINS_init(m):
+        m._PERIODS_FOR_WATER_BASIN_dict = periods = {}
+        m._water_basin_names_cn_dict = names = {}
+        for wb, p in m.WATER_BASIN_PERIODS:
+            periods.setdefault(wb, []).append(p)
+            names.setdefault(wb, set())
+            if (wb, p) in m._water_basin_name_cn_raw:
+                names[wb].add(m._water_basin_name_cn_raw[wb, p])
+        return list(periods)
+
+    mod.WATER_BASINS = Set(dimen=1, initialize=WATER_BASINS_init)
+
+    def PERIODS_FOR_WATER_BASIN_init(m, wb):
+        result = m._PERIODS_FOR_WATER_BASIN_dict.pop(wb)
+        if not m._PERIODS_FOR_WATER_BASIN_dict:
+            del m._PERIODS_FOR_WATER_BASIN_dict
+        return result
+
+    mod.PERIODS_FOR_WATER_BASIN = Set(
+        mod.WATER_BASINS,
+        dimen=1,
+        within=mod.PERIODS,
+        initialize=PERIODS_FOR_WATER_BASIN_init,
+    )
+
     # Validate water basin english-Chinese names are consistent in every record
     mod.consistent_water_basin_names = BuildCheck(
         mod.WATER_BASINS,
-        rule=lambda m, wb: len(
-            set(
-                [
-                    m._water_basin_name_cn_raw[wb, p]
-                    for _wb, p in m.WATER_BASIN_PERIODS
-                    if _wb == wb
-                ]
-            )
-        )
-        == 1,
+        rule=lambda m, wb: len(m._water_basin_names_cn_dict[wb]) <= 1,
     )
 
     def default_water_basin_name_cn(m, wb):
-        names = set(
-            [
-                m._water_basin_name_cn_raw[wb, p]
-                for _wb, p in m.WATER_BASIN_PERIODS
-                if _wb == wb
-            ]
-        )
+        names = m._water_basin_names_cn_dict.pop(wb)
+        if not m._water_basin_names_cn_dict:
+            del m._water_basin_names_cn_dict
         if names:
             return names.pop()
         else:
@@ -62,37 +88,136 @@ def define_components(mod):
     mod.gen_water_basin = Param(mod.GENERATION_PROJECTS, within=mod.WATER_BASINS)
     mod.gen_cooling_water_m3_per_mwh = Param(mod.GENERATION_PROJECTS)
 
+    def GENS_IN_WATER_BASIN_init(m, wb):
+        if not hasattr(m, "_GENS_IN_WATER_BASIN_dict"):
+            projects = get_project_arrays(m)
+            basins = list(m.WATER_BASINS)
+            basin = projects.codes(m.gen_water_basin, basins)
+            m._GENS_IN_WATER_BASIN_dict = dict(
+                zip(basins, projects.groups(basin, len(basins)))
+            )
+        result = m._GENS_IN_WATER_BASIN_dict.pop(wb)
+        if not m._GENS_IN_WATER_BASIN_dict:
+            del m._GENS_IN_WATER_BASIN_dict
+        return result
+
     mod.GENS_IN_WATER_BASIN = Set(
         mod.WATER_BASINS,
-        initialize=lambda m, wb: set(
-            g for g in m.GENERATION_PROJECTS if m.gen_water_basin[g] == wb
-        ),
+        dimen=1,
+        within=mod.GENERATION_PROJECTS,
+        initialize=GENS_IN_WATER_BASIN_init,
     )
+
+    def AnnualCoolingWaterWithdrawals_mm3_rule(m, wb, p):
+        if sparse_rows.use_matrix_construction(m):
+            return sparse_rows.pop_row(
+                m, "_cooling_water_rows_dict", lambda: cooling_water_rows(m), (wb, p)
+            )
+        # On the first call, make one pass through the basins to collect the
+        # dispatch terms for every basin and period, with coefficients
+        # gen_cooling_water_m3_per_mwh * tp_weight_in_year already multiplied
+        # out. Plants that use no cooling water are left out.
+        if not hasattr(m, "_cooling_water_terms_dict"):
+            tp_weight_mm3 = {
+                t: m.tp_weight_in_year[t] / 1000000.0 for t in m.TIMEPOINTS
+            }
+            m._cooling_water_terms_dict = d = {
+                _wb_p: [] for _wb_p in m.WATER_BASIN_PERIODS
+            }
+            projects = get_project_arrays(m)
+            basins = list(m.WATER_BASINS)
+            cooling_water = projects.numbers(m.gen_cooling_water_m3_per_mwh)
+            basin = projects.codes(m.gen_water_basin, basins)
+            cooled_gens = projects.groups(
+                np.where(cooling_water != 0, basin, -1), len(basins)
+            )
+            for _wb, gens in zip(basins, cooled_gens):
+                for g, cooling in zip(gens, cooling_water[projects.ids(gens)].tolist()):
+                    for _p in m.PERIODS_FOR_WATER_BASIN[_wb]:
+                        d[_wb, _p].extend(
+                            (g, t, cooling * tp_weight_mm3[t])
+                            for t in m.TPS_FOR_GEN_IN_PERIOD[g, _p]
+                        )
+        terms = m._cooling_water_terms_dict.pop((wb, p))
+        if not m._cooling_water_terms_dict:
+            del m._cooling_water_terms_dict
+        return sum(coef * m.DispatchGen[g, t] for g, t, coef in terms)
+
     mod.AnnualCoolingWaterWithdrawals_mm3 = Expression(
         mod.WATER_BASIN_PERIODS,
-        rule=lambda m, wb, p: sum(
-            m.gen_cooling_water_m3_per_mwh[g]
-            * sum(
-                m.DispatchGen[g, t] * m.tp_weight_in_year[t]
-                for t in m.TPS_FOR_GEN_IN_PERIOD[g, p]
-            )
-            for g in m.GENS_IN_WATER_BASIN[wb]
-        )
-        / 1000000.0,
+        rule=AnnualCoolingWaterWithdrawals_mm3_rule,
         doc="Total cooling water withdrawals per basin by thermal plants, "
         "scaled to annual average in units of million cubic meters.",
     )
+
+    def Enforce_Cooling_Water_Limits_rule(m, wb, p):
+        limit = m.water_basin_limit_mm3[wb, p]
+        if presolve.enabled(m):
+            most = max_cooling_water_mm3(m, wb, p)
+            if most <= limit:
+                presolve.log_dropped(
+                    m,
+                    "Enforce_Cooling_Water_Limits",
+                    (wb, p),
+                    f"largest possible withdrawal ({most:g} million m3) is "
+                    f"within the limit ({limit:g} million m3)",
+                )
+                return Constraint.Skip
+        return m.AnnualCoolingWaterWithdrawals_mm3[wb, p] <= limit
+
     mod.Enforce_Cooling_Water_Limits = Constraint(
-        mod.WATER_BASIN_PERIODS,
-        rule=lambda m, wb, p: (
-            m.AnnualCoolingWaterWithdrawals_mm3[wb, p] <= m.water_basin_limit_mm3[wb, p]
-        ),
+        mod.WATER_BASIN_PERIODS, rule=Enforce_Cooling_Water_Limits_rule
     )
 
 
+def max_cooling_water_mm3(m, wb, p):
+    """
+    Return the largest possible AnnualCoolingWaterWithdrawals_mm3[wb, p],
+    with every plant in the basin dispatched at its largest possible capacity
+    (see presolve.capacity_bounds) in every timepoint of the period.
+    """
+    projects = get_project_arrays(m)
+    gens = list(m.GENS_IN_WATER_BASIN[wb])
+    cooling_water = projects.numbers(m.gen_cooling_water_m3_per_mwh)
+    cooling_water = cooling_water[projects.ids(gens)]
+    if (cooling_water < 0).any():
+        # withdrawals can't be bounded this way
+        return float("inf")
+    hours_mm3 = sum(m.tp_weight_in_year[t] for t in m.TPS_IN_PERIOD[p]) / 1000000.0
+    total = 0.0
+    for g, cooling in zip(gens, cooling_water.tolist()):
+        if cooling:
+            total += cooling * presolve.capacity_bounds(m, g, p)[1] * hours_mm3
+    return total
+
+
+def cooling_water_rows(m):
+    """
+    Return AnnualCoolingWaterWithdrawals_mm3 for every basin and period,
+    assembled from arrays of the DispatchGen terms (see sparse_rows.py).
+    """
+    gen_tps, dispatch = sparse_rows.variable_terms(m.DispatchGen)
+    projects = get_project_arrays(m)
+    gen_ids = projects.ids(gen_tps[0].values)
+    timepoints = list(m.TIMEPOINTS)
+    tp_ids = pd.Index(timepoints).get_indexer(gen_tps[1].values)
+    tp_weight_mm3 = np.array([m.tp_weight_in_year[t] for t in timepoints]) / 1000000.0
+    period = np.array([m.tp_period[t] for t in timepoints])
+    rows = sparse_rows.row_positions(
+        m.WATER_BASIN_PERIODS,
+        projects.values(m.gen_water_basin)[gen_ids],
+        period[tp_ids],
+    )
+    coefs = (
+        projects.numbers(m.gen_cooling_water_m3_per_mwh)[gen_ids]
+        * tp_weight_mm3[tp_ids]
+    )
+    return sparse_rows.linear_rows(list(m.WATER_BASIN_PERIODS), rows, coefs, dispatch)
+
+
 def load_inputs(mod, switch_data, inputs_dir):
     """
-    generation_projects_info.csv needs these extra columns:
+    gen_info.csv needs these extra columns:
         gen_water_basin, gen_cooling_water_m3_per_mwh
 
     water_limit_annual.csv
@@ -105,11 +230,7 @@ def load_inputs(mod, switch_data, inputs_dir):
     consistency during model creation.
     """
     switch_data.load_aug(
-<<<<<<< HEAD
-        filename=os.path.join(inputs_dir, "generation_projects_info.csv"),
-=======
         filename=os.path.join(inputs_dir, "gen_info.csv"),
->>>>>>> abab594 (Update for Switch 2.0.8+ and remove gen_min_build_capacity)
         param=(mod.gen_water_basin, mod.gen_cooling_water_m3_per_mwh),
     )
     switch_data.load_aug(
@@ -144,3 +265,20 @@ def post_solve(instance, outdir):
     df.sort_values(by=["WATER_BASIN", "PERIOD"], inplace=True)
     df.set_index(["WATER_BASIN", "PERIOD"], inplace=True)
     df.to_csv(os.path.join(outdir, "cooling_water.csv"))
+    # the same table plus the duals of the limits, in bulk; cooling_water.csv
+    # keeps its original format, so the .csv copy is not written
+    keys = sorted(m.WATER_BASIN_PERIODS)
+    bulk_export.write_table(
+        m,
+        outdir,
+        "cooling_water",
+        ["WATER_BASIN", "PERIOD"],
+        keys,
+        {
+            "water_basin_name_cn": [m.water_basin_name_cn[wb] for wb, p in keys],
+            "water_basin_limit_mm3": m.water_basin_limit_mm3,
+            "AnnualCoolingWaterWithdrawals_mm3": m.AnnualCoolingWaterWithdrawals_mm3,
+            "Enforce_Cooling_Water_Limits_dual": m.Enforce_Cooling_Water_Limits,
+        },
+        csv=False,
+    )
@@ -0,0 +1,156 @@
+"""
+Shared zone-level aggregation sets and expressions for the China modules.
+
+This module indexes variable renewable projects and central (non-distributed)
+battery storage projects by load zone and investment period, and uses that
+index to total renewable dispatch per zone and timepoint. A project is active
+in every timepoint of a period it operates in, so the projects that apply to
+(zone, timepoint) are found through the timepoint's period:
+
+    VARIABLE_GENS_IN_ZONE_PERIOD[z, tp_period[t]]
+
+This keeps one small set per zone and period instead of one per timepoint.
+
+The sets are built in a single pass through the projects when the model is
+constructed. Modules that need zone totals (e.g., 'mixed_strategy' and
+'re_connected_strategy') define these components by calling
+`define_components` from their own `define_components`, so this module does
+not need to be listed in modules.txt; it is safe to list it anyway.
+"""
+
+import numpy as np
+import pandas as pd
+from pyomo.environ import *
+
+from . import sparse_rows
+from .project_arrays import get_project_arrays
+
+dependencies = "switch_model.generators.core.dispatch"
+
+
+def define_components(mod):
+    """
+    VARIABLE_GENS_IN_ZONE_PERIOD[z, p] is the set of variable renewable
+    projects in load zone z that are active in period p.
+
+    CENTRAL_BATTERIES_IN_ZONE_PERIOD[z, p] is the set of central battery
+    projects (gen_tech 'Battery_Storage', not distributed) in load zone z that
+    are active in period p. It is only defined when the storage module is
+    used.
+
+    RenewableDispatchZone[z, t] is the total dispatch of variable renewable
+    projects in load zone z during timepoint t.
+    """
+    # components may already have been defined by another module
+    if hasattr(mod, "VARIABLE_GENS_IN_ZONE_PERIOD"):
+        return
+
+    """Construct the zone-period sets efficiently with a 'construction
+    dictionary' pattern: on the first call, make a single traversal through
+    all the relevant projects to generate a complete index, use that for
+    subsequent lookups, and clean up at the last call."""
+
+    def VARIABLE_GENS_IN_ZONE_PERIOD_init(m, z, p):
+        if not hasattr(m, "_VARIABLE_GENS_IN_ZONE_PERIOD_dict"):
+            m._VARIABLE_GENS_IN_ZONE_PERIOD_dict = {
+                (_z, _p): [] for _z in m.LOAD_ZONES for _p in m.PERIODS
+            }
+            for g in m.VARIABLE_GENS:
+                _z = m.gen_load_zone[g]
+                for _p in m.PERIODS_FOR_GEN[g]:
+                    m._VARIABLE_GENS_IN_ZONE_PERIOD_dict[_z, _p].append(g)
+        result = m._VARIABLE_GENS_IN_ZONE_PERIOD_dict.pop((z, p))
+        if not m._VARIABLE_GENS_IN_ZONE_PERIOD_dict:
+            del m._VARIABLE_GENS_IN_ZONE_PERIOD_dict
+        return result
+
+    mod.VARIABLE_GENS_IN_ZONE_PERIOD = Set(
+        mod.LOAD_ZONES,
+        mod.PERIODS,
+        dimen=1,
+        within=mod.VARIABLE_GENS,
+        initialize=VARIABLE_GENS_IN_ZONE_PERIOD_init,
+    )
+
+    if hasattr(mod, "STORAGE_GENS"):
+
+        def CENTRAL_BATTERIES_IN_ZONE_PERIOD_init(m, z, p):
+            if not hasattr(m, "_CENTRAL_BATTERIES_IN_ZONE_PERIOD_dict"):
+                m._CENTRAL_BATTERIES_IN_ZONE_PERIOD_dict = {
+                    (_z, _p): [] for _z in m.LOAD_ZONES for _p in m.PERIODS
+                }
+                for g, _p in m.STORAGE_GEN_PERIODS:
+                    # only add battery in central
+                    if (
+                        m.gen_tech[g] == "Battery_Storage"
+                        and not m.gen_is_distributed[g]
+                    ):
+                        m._CENTRAL_BATTERIES_IN_ZONE_PERIOD_dict[
+                            m.gen_load_zone[g], _p
+                        ].append(g)
+            result = m._CENTRAL_BATTERIES_IN_ZONE_PERIOD_dict.pop((z, p))
+            if not m._CENTRAL_BATTERIES_IN_ZONE_PERIOD_dict:
+                del m._CENTRAL_BATTERIES_IN_ZONE_PERIOD_dict
+            return result
+
+        mod.CENTRAL_BATTERIES_IN_ZONE_PERIOD = Set(
+            mod.LOAD_ZONES,
+            mod.PERIODS,
+            dimen=1,
+            within=mod.STORAGE_GENS,
+            initialize=CENTRAL_BATTERIES_IN_ZONE_PERIOD_init,
+        )
+
+    def RenewableDispatchZone_rule(m, z, t):
+        if sparse_rows.use_matrix_construction(m):
+            return sparse_rows.pop_row(
+                m,
+                "_RenewableDispatchZone_rows_dict",
+                lambda: zone_timepoint_rows(
+                    m, m.DispatchGen, get_project_arrays(m).mask(m.VARIABLE_GENS)
+                ),
+                (z, t),
+            )
+        return sum(
+            m.DispatchGen[g, t]
+            for g in m.VARIABLE_GENS_IN_ZONE_PERIOD[z, m.tp_period[t]]
+        )
+
+    mod.RenewableDispatchZone = Expression(
+        mod.LOAD_ZONES, mod.TIMEPOINTS, rule=RenewableDispatchZone_rule
+    )
+
+
+def central_batteries(m):
+    """
+    Return a boolean array that is True for the ids of the central battery
+    projects (see define_components and project_arrays.py).
+    """
+    projects = get_project_arrays(m)
+    return (
+        projects.mask(m.STORAGE_GENS)
+        & (projects.values(m.gen_tech) == "Battery_Storage")
+        & ~projects.flags(m.gen_is_distributed)
+    )
+
+
+def zone_timepoint_rows(m, var, selected):
+    """
+    Return a dict with the sum of var[g, t] for the projects g selected by
+    the boolean array selected (indexed by project id, see project_arrays.py)
+    in each load zone z and timepoint t, for every (z, t), built from arrays
+    of the var index (see sparse_rows.py). var must be indexed by project and
+    timepoint and only include the timepoints when each project is active.
+    """
+    gen_tps, variables = sparse_rows.variable_terms(var)
+    projects = get_project_arrays(m)
+    zones, timepoints = list(m.LOAD_ZONES), list(m.TIMEPOINTS)
+    gen_ids = projects.ids(gen_tps[0].values)
+    tp_ids = pd.Index(timepoints).get_indexer(gen_tps[1].values)
+    # rows are ordered by zone, then timepoint
+    zone_ids = np.where(
+        selected[gen_ids], projects.codes(m.gen_load_zone, zones)[gen_ids], -1
+    )
+    rows = np.where(zone_ids >= 0, zone_ids * len(timepoints) + tp_ids, -1)
+    row_keys = [(z, t) for z in zones for t in timepoints]
+    return sparse_rows.linear_rows(row_keys, rows, np.ones(len(variables)), variables)
@@ -0,0 +1,69 @@
+import os
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SHIPPED_INPUTS = os.path.join(REPO_DIR, "inputs")
+
+# a small synthetic model that solves in a few seconds
+SMALL_MODEL = dict(
+    zones=4, days=2, timepoints_per_day=4, projects_per_zone=30, periods=2
+)
+
+
+@pytest.fixture
+def make_inputs(tmp_path):
+    """Write synthetic inputs (see china_modules.synthetic_inputs) under
+    tmp_path and return their directory; keyword arguments are options."""
+    from china_modules import synthetic_inputs
+
+    def make(name="inputs", **options):
+        outputs_dir = str(tmp_path / name)
+        args = ["--template-dir", SHIPPED_INPUTS, "--outputs-dir", outputs_dir]
+        for option, value in options.items():
+            args += ["--" + option.replace("_", "-"), str(value)]
+        synthetic_inputs.main(args)
+        return outputs_dir
+
+    return make
+
+
+@pytest.fixture
+def solve(tmp_path):
+    """Solve a Switch model with HiGHS and return the instance."""
+    pytest.importorskip("switch_model")
+    pytest.importorskip("highspy")
+    import switch_model.solve
+
+    def solve(inputs_dir, *args, outputs_dir=None):
+        if outputs_dir is None:
+            outputs_dir = str(tmp_path / (os.path.basename(inputs_dir) + "_outputs"))
+        return switch_model.solve.main(
+            args=[
+                "--inputs-dir",
+                inputs_dir,
+                "--outputs-dir",
+                outputs_dir,
+                "--solver",
+                "appsi_highs",
+                *args,
+            ]
+        )
+
+    return solve
+
+
+@pytest.fixture
+def build(tmp_path):
+    """Construct a Switch model without solving it and return the instance."""
+    pytest.importorskip("switch_model")
+    import switch_model.solve
+
+    def build(inputs_dir, *args):
+        outputs_dir = str(tmp_path / (os.path.basename(inputs_dir) + "_outputs"))
+        return switch_model.solve.main(
+            args=["--inputs-dir", inputs_dir, "--outputs-dir", outputs_dir, *args],
+            return_instance=True,
+        )
+
+    return build
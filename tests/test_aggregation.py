@@ -0,0 +1,112 @@
+import os
+
+import pandas as pd
+import pytest
+
+from conftest import SHIPPED_INPUTS, SMALL_MODEL
+from china_modules import aggregate_projects, aggregate_zones
+
+
+def read(directory, filename):
+    return pd.read_csv(os.path.join(directory, filename), na_values=".")
+
+
+def capacity_by_source(inputs_dir):
+    info = read(inputs_dir, "gen_info.csv")
+    predetermined = read(inputs_dir, "gen_build_predetermined.csv").merge(info)
+    return predetermined.groupby("gen_energy_source")["build_gen_predetermined"].sum()
+
+
+def total_load(inputs_dir):
+    return read(inputs_dir, "loads.csv")["zone_demand_mw"].sum()
+
+
+def test_aggregate_projects_shipped_inputs(tmp_path):
+    outputs_dir = str(tmp_path / "aggregated")
+    aggregate_projects.main(
+        ["aggregate", "--inputs-dir", SHIPPED_INPUTS, "--outputs-dir", outputs_dir]
+    )
+    assert len(read(outputs_dir, "gen_info.csv")) < len(
+        read(SHIPPED_INPUTS, "gen_info.csv")
+    )
+    pd.testing.assert_series_equal(
+        capacity_by_source(outputs_dir), capacity_by_source(SHIPPED_INPUTS)
+    )
+
+
+def test_aggregate_projects_synthetic_inputs(tmp_path, make_inputs, solve):
+    # synthetic projects have cooling water rates, used by water_limits
+    inputs_dir = make_inputs(seed=0, **SMALL_MODEL)
+    aggregated = str(tmp_path / "aggregated")
+    aggregate_projects.main(
+        ["aggregate", "--inputs-dir", inputs_dir, "--outputs-dir", aggregated]
+    )
+    info = read(aggregated, "gen_info.csv")
+    assert info["gen_cooling_water_m3_per_mwh"].notna().all()
+    pd.testing.assert_series_equal(
+        capacity_by_source(aggregated), capacity_by_source(inputs_dir)
+    )
+
+    outputs_dir = str(tmp_path / "outputs")
+    solve(
+        aggregated,
+        "--include-modules",
+        "china_modules.water_limits",
+        outputs_dir=outputs_dir,
+    )
+    aggregate_projects.main(
+        ["disaggregate", "--inputs-dir", aggregated, "--outputs-dir", outputs_dir]
+    )
+    split = read(os.path.join(outputs_dir, "disaggregated"), "BuildGen.csv")
+    projects = read(inputs_dir, "gen_info.csv")["GENERATION_PROJECT"]
+    assert set(split["GEN_BLD_YRS_1"]) <= set(projects)
+    assert split["BuildGen"].sum() == pytest.approx(
+        read(outputs_dir, "BuildGen.csv")["BuildGen"].sum()
+    )
+
+
+def test_aggregate_zones_shipped_inputs(tmp_path):
+    outputs_dir = str(tmp_path / "aggregated")
+    aggregate_zones.main(
+        ["aggregate", "--inputs-dir", SHIPPED_INPUTS, "--outputs-dir", outputs_dir]
+    )
+    zones = read(SHIPPED_INPUTS, "load_zones.csv")
+    regions = read(outputs_dir, "load_zones.csv")
+    assert set(regions["LOAD_ZONE"]) == set(zones["zone_balancing_area"])
+    assert total_load(outputs_dir) == pytest.approx(total_load(SHIPPED_INPUTS))
+    lines = read(outputs_dir, "transmission_lines.csv")
+    assert len(lines) > 0
+    assert (lines["trans_lz1"] != lines["trans_lz2"]).all()
+    pairs = lines[["trans_lz1", "trans_lz2"]].apply(frozenset, axis=1)
+    assert pairs.is_unique
+
+
+def test_aggregate_zones_into_one_region(tmp_path, make_inputs, solve):
+    # the four zones of the small model are all in Central_China
+    inputs_dir = make_inputs(seed=0, **SMALL_MODEL)
+    aggregated = str(tmp_path / "aggregated")
+    # transmission tables left from an earlier run must not be kept
+    os.makedirs(aggregated)
+    with open(os.path.join(aggregated, "transmission_lines.csv"), "w") as f:
+        f.write("TRANSMISSION_LINE,trans_lz1,trans_lz2\n")
+    aggregate_zones.main(
+        ["aggregate", "--inputs-dir", inputs_dir, "--outputs-dir", aggregated]
+    )
+    assert len(read(aggregated, "load_zones.csv")) == 1
+    assert not os.path.exists(os.path.join(aggregated, "transmission_lines.csv"))
+    assert not os.path.exists(os.path.join(aggregated, "trans_params.csv"))
+    assert total_load(aggregated) == pytest.approx(total_load(inputs_dir))
+
+    modules_path = os.path.join(aggregated, "modules.txt")
+    with open(modules_path) as f:
+        modules = [m for m in f if "switch_model.transmission.transport" not in m]
+    with open(modules_path, "w") as f:
+        f.writelines(modules)
+    outputs_dir = str(tmp_path / "outputs")
+    solve(aggregated, outputs_dir=outputs_dir)
+    aggregate_zones.main(
+        ["disaggregate", "--inputs-dir", aggregated, "--outputs-dir", outputs_dir]
+    )
+    balance = read(os.path.join(outputs_dir, "disaggregated"), "load_balance.csv")
+    zones = read(inputs_dir, "load_zones.csv")["LOAD_ZONE"]
+    assert set(balance["load_zone"]) == set(zones)
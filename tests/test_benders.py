@@ -0,0 +1,44 @@
+import csv
+
+import pytest
+from pyomo.environ import value
+
+from conftest import SMALL_MODEL
+
+
+@pytest.mark.parametrize(
+    "split, modules",
+    [
+        ("period", []),
+        ("timeseries", ["--include-modules", "china_modules.water_limits"]),
+    ],
+)
+def test_benders_matches_monolithic(make_inputs, solve, tmp_path, split, modules):
+    from china_modules import benders
+
+    inputs_dir = make_inputs(seed=0, **SMALL_MODEL)
+    monolithic = value(solve(inputs_dir, *modules).SystemCost)
+
+    outputs_dir = tmp_path / "benders"
+    instance = benders.main(
+        [
+            "--split",
+            split,
+            "--workers",
+            "2",
+            "--",
+            "--inputs-dir",
+            inputs_dir,
+            "--outputs-dir",
+            str(outputs_dir),
+            *modules,
+        ]
+    )
+    with open(outputs_dir / "benders_progress.csv") as f:
+        last = list(csv.DictReader(f))[-1]
+
+    assert float(last["gap"]) <= 1e-4
+    # the lower bound never passes the optimum
+    assert float(last["lower_bound"]) <= monolithic * (1 + 1e-6)
+    assert value(instance.SystemCost) == pytest.approx(monolithic, rel=1e-3)
+    assert (outputs_dir / "gen_cap.csv").exists()
@@ -0,0 +1,37 @@
+import pytest
+from pyomo.environ import value
+
+from conftest import SMALL_MODEL
+from china_modules.charge_limit import VIOLATION_TOLERANCE_MW
+
+
+@pytest.mark.parametrize(
+    "strategy", ["china_modules.mixed_strategy", "china_modules.re_connected_strategy"]
+)
+def test_lazy_charge_limit_matches_full_build(make_inputs, solve, strategy):
+    # with every battery re-connected and every zone constrained, the limit
+    # binds in some timepoints of these inputs
+    inputs_dir = make_inputs(
+        seed=1, re_connect_share=1, constrained_zone_share=1, **SMALL_MODEL
+    )
+    modules = ["--include-modules", "china_modules.zone_totals", strategy]
+    without = value(solve(inputs_dir).SystemCost)
+    full = value(solve(inputs_dir, *modules).SystemCost)
+    assert full > without * (1 + 1e-6)
+
+    for lazy in [
+        ["--lazy-charge-limit"],
+        ["--lazy-charge-limit", "--lazy-charge-limit-seed-cf", "0.1"],
+    ]:
+        instance = solve(inputs_dir, *modules, *lazy)
+        assert value(instance.SystemCost) == pytest.approx(full, rel=1e-6)
+
+        index = getattr(instance, instance.charge_limit_index)
+        active = instance.CHARGE_LIMIT_ZONE_TIMEPOINTS
+        assert 0 < len(active) < len(index)
+        charge = getattr(instance, instance.charge_limit_expression)
+        for z, t in index:
+            assert (
+                value(charge[z, t]) - value(instance.RenewableDispatchZone[z, t])
+                <= VIOLATION_TOLERANCE_MW
+            ), (z, t)
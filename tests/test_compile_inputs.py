@@ -0,0 +1,82 @@
+import os
+import shutil
+
+import pandas as pd
+import pytest
+
+from conftest import REPO_DIR, SHIPPED_INPUTS
+from china_modules import compile_inputs
+
+# provinces whose shipped loads use profiles that are not in database/ (see
+# the compile_inputs docstring)
+DIFFERENT_PROFILES = ["Hebei", "Jilin", "Liaoning"]
+# periods (with the year of their sample days) that the database covers
+REPRODUCED_PERIODS = {2023: "2025", 2028: "2030"}
+
+
+@pytest.fixture(scope="module")
+def rebuilt(tmp_path_factory):
+    inputs_dir = str(tmp_path_factory.mktemp("compile") / "inputs")
+    shutil.copytree(SHIPPED_INPUTS, inputs_dir)
+    compile_inputs.main(
+        [
+            "--database-dir",
+            os.path.join(REPO_DIR, "database"),
+            "--inputs-dir",
+            inputs_dir,
+            "--force",
+            "loads.csv",
+            "zone_coincident_peak_demand.csv",
+        ]
+    )
+    return inputs_dir
+
+
+def compare(name, keys, rebuilt_dir):
+    shipped = pd.read_csv(os.path.join(SHIPPED_INPUTS, name))
+    rebuilt = pd.read_csv(os.path.join(rebuilt_dir, name))
+    assert len(rebuilt) == len(shipped)
+    return shipped.merge(rebuilt, on=keys, suffixes=("_shipped", "_rebuilt"))
+
+
+def test_loads_match_shipped_inputs(rebuilt):
+    both = compare("loads.csv", ["load_zone", "TIMEPOINT"], rebuilt)
+    year = both["TIMEPOINT"].str[:4]
+    same = both[
+        year.isin(REPRODUCED_PERIODS.values())
+        & ~both["load_zone"].isin(DIFFERENT_PROFILES)
+    ]
+    assert len(same)
+    pd.testing.assert_series_equal(
+        same["zone_demand_mw_rebuilt"],
+        same["zone_demand_mw_shipped"],
+        check_names=False,
+        rtol=1e-4,
+    )
+    # the documented differences
+    different = both[
+        year.isin(REPRODUCED_PERIODS.values())
+        & both["load_zone"].isin(DIFFERENT_PROFILES)
+    ]
+    ratio = different["zone_demand_mw_rebuilt"] / different["zone_demand_mw_shipped"]
+    assert ratio.between(0.78, 1.2).all()
+    assert (abs(ratio - 1) > 1e-3).any()
+
+
+def test_peak_demand_matches_shipped_inputs(rebuilt):
+    both = compare(
+        "zone_coincident_peak_demand.csv",
+        ["LOAD_ZONE", "PERIOD"],
+        rebuilt,
+    )
+    same = both[
+        both["PERIOD"].isin(list(REPRODUCED_PERIODS))
+        & ~both["LOAD_ZONE"].isin(DIFFERENT_PROFILES)
+    ]
+    assert len(same)
+    pd.testing.assert_series_equal(
+        same["zone_expected_coincident_peak_demand_rebuilt"],
+        same["zone_expected_coincident_peak_demand_shipped"],
+        check_names=False,
+        rtol=1e-4,
+    )
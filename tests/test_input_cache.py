@@ -0,0 +1,49 @@
+import os
+
+import pandas as pd
+import pytest
+
+from conftest import SMALL_MODEL
+
+
+@pytest.fixture
+def cached_inputs(make_inputs, tmp_path):
+    """Synthetic inputs and a module list that puts the input cache first."""
+    inputs_dir = make_inputs(seed=0, **SMALL_MODEL)
+    module_list = str(tmp_path / "modules.txt")
+    with open(os.path.join(inputs_dir, "modules.txt")) as f:
+        modules = f.read()
+    with open(module_list, "w") as f:
+        f.write("china_modules.input_cache\n" + modules)
+    return inputs_dir, ["--module-list", module_list]
+
+
+def series(instance):
+    return (
+        instance.zone_demand_mw.extract_values(),
+        instance.gen_max_capacity_factor.extract_values(),
+        list(instance.VARIABLE_GEN_TPS_RAW),
+    )
+
+
+def test_series_are_read_like_the_dataportal(cached_inputs, build):
+    inputs_dir, args = cached_inputs
+    expected = series(build(inputs_dir, *args, "--no-input-cache"))
+    # the first run reads the series with pandas, the second from the cache
+    for _ in range(2):
+        assert series(build(inputs_dir, *args)) == expected
+
+
+def test_aliased_series_are_read(cached_inputs, build):
+    inputs_dir, args = cached_inputs
+    loads = pd.read_csv(os.path.join(inputs_dir, "loads.csv"))
+    loads["zone_demand_mw"] *= 1.3
+    loads.to_csv(os.path.join(inputs_dir, "loads.high.csv"), index=False)
+
+    base = sum(build(inputs_dir, *args).zone_demand_mw.extract_values().values())
+    for _ in range(2):
+        instance = build(
+            inputs_dir, *args, "--input-aliases", "loads.csv=loads.high.csv"
+        )
+        demand = sum(instance.zone_demand_mw.extract_values().values())
+        assert demand == pytest.approx(1.3 * base)
@@ -0,0 +1,21 @@
+import pytest
+from pyomo.environ import value
+
+from conftest import SMALL_MODEL
+
+
+def test_dropping_redundant_constraints_keeps_the_optimum(make_inputs, solve):
+    # these inputs have capacity plans that predetermined capacity already
+    # meets and water basin limits that can't be reached
+    inputs_dir = make_inputs(seed=2, **SMALL_MODEL)
+    modules = ["--include-modules", "china_modules.water_limits"]
+    full = solve(inputs_dir, *modules)
+    dropped = solve(inputs_dir, *modules, "--drop-redundant-constraints")
+
+    assert len(dropped.Enforce_Capacity_Plan) < len(full.Enforce_Capacity_Plan)
+    assert len(dropped.Enforce_Cooling_Water_Limits) < len(
+        full.Enforce_Cooling_Water_Limits
+    )
+    assert value(dropped.SystemCost) == pytest.approx(
+        value(full.SystemCost), rel=1e-6
+    )
@@ -0,0 +1,17 @@
+import numpy as np
+import pytest
+
+from china_modules.project_arrays import ProjectArrays
+
+
+def test_mask():
+    projects = ProjectArrays(["a", "b", "c"])
+    assert projects.mask(["c", "a"]).tolist() == [True, False, True]
+    assert not projects.mask([]).any()
+
+
+def test_mask_rejects_unknown_projects():
+    projects = ProjectArrays(["a", "b", "c"])
+    np.testing.assert_array_equal(projects.ids(["b", "x"]), [1, -1])
+    with pytest.raises(KeyError, match="x"):
+        projects.mask(["b", "x"])
@@ -0,0 +1,82 @@
+import os
+
+import pandas as pd
+import pytest
+
+from conftest import SHIPPED_INPUTS, SMALL_MODEL
+from china_modules import rolling_horizon
+from china_modules.rolling_horizon import WindowState, read_table
+
+
+def test_committed_builds_in_window_inputs(tmp_path):
+    periods = list(
+        read_table(os.path.join(SHIPPED_INPUTS, "periods.csv"))["INVESTMENT_PERIOD"]
+    )
+    predetermined = read_table(
+        os.path.join(SHIPPED_INPUTS, "gen_build_predetermined.csv")
+    )
+    costs = read_table(os.path.join(SHIPPED_INPUTS, "gen_build_costs.csv"))
+    # a predetermined build in the first period, which BuildGen also reports,
+    # and a new build in the same period
+    old = predetermined[predetermined["build_year"] == periods[0]].iloc[0]
+    new = costs[
+        (costs["build_year"] == periods[0])
+        & ~costs["GENERATION_PROJECT"].isin(predetermined["GENERATION_PROJECT"])
+    ].iloc[0]
+    state = WindowState()
+    state.gen[old["GENERATION_PROJECT"], periods[0]] = float(
+        old["build_gen_predetermined"]
+    )
+    state.gen[new["GENERATION_PROJECT"], periods[0]] = 100.0
+
+    window_dir = str(tmp_path / "window")
+    rolling_horizon.write_window_inputs(
+        SHIPPED_INPUTS, window_dir, periods[1:2], periods, state
+    )
+    written = read_table(os.path.join(window_dir, "gen_build_predetermined.csv"))
+    assert not written.duplicated(["GENERATION_PROJECT", "build_year"]).any()
+    assert len(written) == len(predetermined) + 1
+    pd.testing.assert_frame_equal(
+        written.iloc[: len(predetermined)], predetermined, check_like=True
+    )
+    added = written.iloc[-1]
+    assert (added["GENERATION_PROJECT"], added["build_year"]) == (
+        new["GENERATION_PROJECT"],
+        periods[0],
+    )
+    assert float(added["build_gen_predetermined"]) == 100.0
+    window_costs = read_table(os.path.join(window_dir, "gen_build_costs.csv"))
+    assert (
+        (window_costs["GENERATION_PROJECT"] == new["GENERATION_PROJECT"])
+        & (window_costs["build_year"] == periods[0])
+    ).any()
+    window_periods = read_table(os.path.join(window_dir, "periods.csv"))
+    assert list(window_periods["INVESTMENT_PERIOD"]) == periods[1:2]
+
+
+def test_rolling_horizon_synthetic_inputs(tmp_path, make_inputs):
+    pytest.importorskip("switch_model")
+    pytest.importorskip("highspy")
+    inputs_dir = make_inputs(seed=0, **SMALL_MODEL)
+    outputs_dir = str(tmp_path / "rolling")
+    rolling_horizon.main(
+        [
+            "--inputs-dir",
+            inputs_dir,
+            "--outputs-dir",
+            outputs_dir,
+            "--",
+            "--solver",
+            "appsi_highs",
+        ]
+    )
+    summary = pd.read_csv(os.path.join(outputs_dir, "rolling_horizon.csv"))
+    assert list(summary["status"]) == ["ok", "ok"]
+    last = summary["window"].iloc[-1]
+    predetermined = read_table(
+        os.path.join(outputs_dir, last, "inputs", "gen_build_predetermined.csv")
+    )
+    assert not predetermined.duplicated(["GENERATION_PROJECT", "build_year"]).any()
+    assert len(predetermined) > len(
+        read_table(os.path.join(inputs_dir, "gen_build_predetermined.csv"))
+    )
@@ -0,0 +1,49 @@
+import pytest
+from pyomo.environ import Constraint, value
+from pyomo.repn import generate_standard_repn
+
+from conftest import SMALL_MODEL
+
+
+def rows(instance):
+    """
+    Return the bounds and coefficients of every active constraint, with the
+    constant terms moved into the bounds.
+    """
+    result = {}
+    for con in instance.component_data_objects(Constraint, active=True):
+        repn = generate_standard_repn(con.body, compute_values=True)
+        assert repn.is_linear(), con.name
+        constant = value(repn.constant)
+        bounds = tuple(
+            None if bound is None else value(bound) - constant
+            for bound in (con.lower, con.upper)
+        )
+        coefs = {}
+        for var, coef in zip(repn.linear_vars, repn.linear_coefs):
+            coefs[var.name] = coefs.get(var.name, 0.0) + coef
+        result[con.name] = (bounds, {v: c for v, c in coefs.items() if c != 0})
+    return result
+
+
+@pytest.mark.parametrize(
+    "strategy", ["china_modules.mixed_strategy", "china_modules.re_connected_strategy"]
+)
+def test_matrix_construction_builds_the_same_rows(make_inputs, build, strategy):
+    inputs_dir = make_inputs(seed=1, re_connect_share=1, **SMALL_MODEL)
+    modules = [
+        "--include-modules",
+        "china_modules.zone_totals",
+        strategy,
+        "china_modules.water_limits",
+    ]
+    default = rows(build(inputs_dir, *modules))
+    matrix = rows(build(inputs_dir, *modules, "--matrix-construction"))
+
+    assert matrix.keys() == default.keys()
+    assert any(name.startswith("Enforce_Cooling_Water_Limits") for name in default)
+    assert any(name.startswith("Charge_Storage_Upper_Limit_Zone") for name in default)
+    for name, (bounds, coefs) in default.items():
+        assert matrix[name][0] == pytest.approx(bounds), name
+        assert matrix[name][1].keys() == coefs.keys(), name
+        assert matrix[name][1] == pytest.approx(coefs), name
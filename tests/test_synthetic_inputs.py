@@ -0,0 +1,31 @@
+import pandas as pd
+import pytest
+
+from conftest import SMALL_MODEL
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_small_models_solve(make_inputs, solve, seed):
+    from pyomo.environ import value
+
+    instance = solve(make_inputs(seed=seed, **SMALL_MODEL))
+    assert value(instance.SystemCost) > 0
+
+
+def test_more_zones_with_water_limits_solve(make_inputs, solve):
+    from pyomo.environ import value
+
+    inputs_dir = make_inputs(
+        zones=8, days=2, timepoints_per_day=4, projects_per_zone=20, periods=2, seed=1
+    )
+    instance = solve(inputs_dir, "--include-modules", "china_modules.water_limits")
+    assert value(instance.SystemCost) > 0
+
+
+def test_same_seed_gives_same_inputs(make_inputs):
+    first = make_inputs("first", seed=3, **SMALL_MODEL)
+    second = make_inputs("second", seed=3, **SMALL_MODEL)
+    for filename in ["carbon_policies.csv", "total_capacity_limits.csv", "loads.csv"]:
+        pd.testing.assert_frame_equal(
+            pd.read_csv(f"{first}/{filename}"), pd.read_csv(f"{second}/{filename}")
+        )